@@ -3,6 +3,8 @@
 A module that contains the content-based recommender LDARecommender that uses
 LDA.
 """
+import copy
+import numpy
 from lib.content_based import ContentBased
 from overrides import overrides
 from sklearn.decomposition import LatentDirichletAllocation
@@ -25,6 +27,13 @@ class LDARecommender(ContentBased):
         :param boolean load_matrices: A flag for reinitializing the matrices.
         :param boolean dump_matrices: A flag for saving the matrices.
         """
+        # The number of processes of LDA, -1 uses all the cores.
+        self._n_jobs = -1
+        # The number of documents of every mini-batch of the online training.
+        self._batch_size = 128
+        self.lda_model = None
+        # The topics of the documents that were added after training, they are not items of the ratings.
+        self.cold_document_distribution = None
         super(LDARecommender, self).__init__(initializer, evaluator, hyperparameters, options,
                                              verbose, load_matrices, dump_matrices)
 
@@ -37,10 +46,14 @@ class LDARecommender(ContentBased):
         """
         # Try to read from file.
         matrix_found = False
+        matrix_name = 'document_distribution_lda' + self.abstracts_preprocessor.get_vocabulary_key()
+        self.lda_model = None
+        self.cold_document_distribution = None
+        self.prepared_state = None
         if self._load_matrices is True:
+            # The topics do not depend on the fold, they are loaded with the config that they are saved with.
             matrix_shape = (self.n_items, self.n_factors)
-            matrix_found, matrix = self.initializer.load_matrix(self.hyperparameters, 'document_distribution_lda',
-                                                                matrix_shape)
+            matrix_found, matrix = self.initializer.load_matrix(self.initializer.config, matrix_name, matrix_shape)
             self.document_distribution = matrix
             if self._verbose and matrix_found:
                 print("Document distribution was set from file, will not train.")
@@ -49,22 +62,120 @@ class LDARecommender(ContentBased):
                 print("Document distribution file was not found, will train LDA.")
             self._train()
             if self._dump_matrices:
-                self.initializer.save_matrix(self.document_distribution, 'document_distribution_lda')
+                self.initializer.save_matrix(self.document_distribution, matrix_name)
+                self.initializer.save_model(self.lda_model, self._get_model_name(), self._get_documents_shape())
         if return_report:
             return self.get_evaluation_report()
 
+    def _get_model_name(self):
+        """
+        :returns: The name of the saved LDA model.
+        :rtype: str
+        """
+        return 'lda_model' + self.abstracts_preprocessor.get_vocabulary_key()
+
+    def _get_documents_shape(self):
+        """
+        :returns: The shape of the topics of the items and the added documents, which identifies the saved
+            LDA model and the saved topics of all the documents.
+        :rtype: tuple
+        """
+        n_cold_documents = 0
+        if self.cold_document_distribution is not None:
+            n_cold_documents = self.cold_document_distribution.shape[0]
+        return (self.n_items + n_cold_documents, self.n_factors)
+
     def _train(self):
         """
         Train LDA Recommender, and store the document_distribution.
         """
         term_freq = self.abstracts_preprocessor.get_term_frequency_sparse_matrix()
-        lda = LatentDirichletAllocation(n_topics=self.n_factors, max_iter=self.n_iter,
-                                        learning_method='online',
-                                        learning_offset=50., random_state=0,
-                                        verbose=0)
+        self.lda_model = LatentDirichletAllocation(n_components=self.n_factors, max_iter=self.n_iter,
+                                                   learning_method='online', batch_size=self._batch_size,
+                                                   learning_offset=50., random_state=0, n_jobs=self._n_jobs,
+                                                   verbose=0)
         if self._verbose:
             print("Initialized LDA model..., Training LDA...")
 
-        self.document_distribution = lda.fit_transform(term_freq)
+        self.document_distribution = self.lda_model.fit_transform(term_freq)
         if self._verbose:
             print("LDA trained..")
+
+    def get_lda_model(self):
+        """
+        Get the trained LDA model, it is loaded from file if the document distribution was loaded.
+        The model is never trained here, as it is only used to infer the topics of new documents.
+
+        :returns: The trained LDA model.
+        :rtype: LatentDirichletAllocation
+        """
+        if self.lda_model is None and self._load_matrices:
+            found, self.lda_model = self.initializer.load_model(self.initializer.config, self._get_model_name(),
+                                                                self._get_documents_shape())
+        if self.lda_model is None:
+            raise ValueError("The LDA model of %s was not found, please train it without loading the matrices" % self)
+        return self.lda_model
+
+    @overrides
+    def infer_document_distribution(self, term_freq):
+        """
+        Infer the topics of documents, without training the model.
+
+        :param csr_matrix term_freq: Sparse matrix of documents X words, of the word count.
+        :returns: A matrix of documents X topics distribution.
+        :rtype: ndarray
+        """
+        return self.get_lda_model().transform(term_freq)
+
+    def add_documents(self, term_freq, update_model=True):
+        """
+        Add new documents, their topics are inferred and appended to the cold document distribution. The new
+        documents have no ratings, so they are not items of the predictions. The topics of all the documents
+        and the updated model are saved with the number of all the documents, so that the model of the
+        items is kept.
+
+        :param csr_matrix term_freq: Sparse matrix of the new documents X words, of the word count.
+        :param boolean update_model: A flag for updating the model with the new documents before the inference.
+        :returns: A matrix of the new documents X topics distribution.
+        :rtype: ndarray
+        """
+        lda_model = self.get_lda_model()
+        if update_model:
+            # The saved or cached model of the previous documents is not updated in place.
+            lda_model = copy.deepcopy(lda_model)
+            for start in range(0, term_freq.shape[0], self._batch_size):
+                lda_model.partial_fit(term_freq[start:start + self._batch_size])
+        new_distribution = lda_model.transform(term_freq)
+        if self.cold_document_distribution is None:
+            self.cold_document_distribution = new_distribution
+        else:
+            self.cold_document_distribution = numpy.vstack((self.cold_document_distribution, new_distribution))
+        self.lda_model = lda_model
+        if self._dump_matrices:
+            matrix_name = 'document_distribution_lda' + self.abstracts_preprocessor.get_vocabulary_key()
+            self.initializer.save_matrix(numpy.vstack((self.document_distribution, self.cold_document_distribution)),
+                                         matrix_name)
+            self.initializer.save_model(lda_model, self._get_model_name(), self._get_documents_shape())
+        return new_distribution
+
+    def load_added_documents(self, n_documents):
+        """
+        Load the topics of the documents that were added after training, and the model that was updated
+        with them.
+
+        :param int n_documents: The number of the added documents.
+        :returns: A flag that is True if the topics and the model were found.
+        :rtype: boolean
+        """
+        matrix_name = 'document_distribution_lda' + self.abstracts_preprocessor.get_vocabulary_key()
+        documents_shape = (self.n_items + n_documents, self.n_factors)
+        matrix_found, matrix = self.initializer.load_matrix(self.initializer.config, matrix_name, documents_shape)
+        if not matrix_found:
+            return False
+        model_found, lda_model = self.initializer.load_model(self.initializer.config, self._get_model_name(),
+                                                             documents_shape)
+        if not model_found:
+            return False
+        self.cold_document_distribution = matrix[self.n_items:]
+        self.lda_model = lda_model
+        return True
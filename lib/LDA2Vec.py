@@ -8,9 +8,9 @@ import chainer
 import numpy
 from chainer import optimizers
 from overrides import overrides
-from lda2vec.utils import chunks
 from lib.lda2vec_model import LDA2Vec
 from lib.content_based import ContentBased
+from util.batch_prefetcher import BatchPrefetcher
 
 
 class LDA2VecRecommender(ContentBased):
@@ -30,6 +30,8 @@ class LDA2VecRecommender(ContentBased):
         :param boolean load_matrices: A flag for reinitializing the matrices.
         :param boolean dump_matrices: A flag for saving the output matrices.
         """
+        # If True, all the context offsets of a batch are trained by one sampler call and one backward.
+        self._batched_windows = True
         super(LDA2VecRecommender, self).__init__(initializer, evaluator, hyperparameters, options,
                                                  verbose, load_matrices, dump_matrices)
 
@@ -41,10 +43,10 @@ class LDA2VecRecommender(ContentBased):
         :param bool return_report: A flag to decide if we should return the evaluation report.
         """
         matrix_found = False
+        matrix_name = 'document_distribution_lda2vec' + self.abstracts_preprocessor.get_vocabulary_key()
         if self._load_matrices is True:
             matrix_shape = (self.n_items, self.n_factors)
-            matrix_found, matrix = self.initializer.load_matrix(self.hyperparameters,
-                                                                'document_distribution_lda2vec', matrix_shape)
+            matrix_found, matrix = self.initializer.load_matrix(self.hyperparameters, matrix_name, matrix_shape)
             self.document_distribution = matrix
             if self._verbose and matrix_found:
                 print("Document distribution was set from file, will not train.")
@@ -53,7 +55,7 @@ class LDA2VecRecommender(ContentBased):
                 print("Document distribution file was not found. Will train LDA2Vec.")
             self._train()
             if self._dump_matrices:
-                self.initializer.save_matrix(self.document_distribution, 'document_distribution_lda2vec')
+                self.initializer.save_matrix(self.document_distribution, matrix_name)
         if return_report:
             return self.get_evaluation_report()
 
@@ -62,12 +64,10 @@ class LDA2VecRecommender(ContentBased):
         Train the LDA2Vec model, and store the document_distribution matrix.
         """
         n_units = self.abstracts_preprocessor.get_num_units()
-        # 2 lists which correspond to pairs ('doc_id', 'word_id') of all the words
+        # 2 int32 arrays which correspond to pairs ('doc_id', 'word_id') of all the words
         # in each document, 'word_id' according to the computed dictionary 'vocab'
-        doc_ids, flattened = zip(*self.abstracts_preprocessor.get_article_to_words())
+        doc_ids, flattened = self.abstracts_preprocessor.get_article_word_arrays()
         assert len(doc_ids) == len(flattened)
-        flattened = numpy.array(flattened, dtype='int32')
-        doc_ids = numpy.array(doc_ids, dtype='int32')
 
         # Word frequencies, for lda2vec_model
         n_vocab = self.abstracts_preprocessor.get_num_vocab()
@@ -91,13 +91,19 @@ class LDA2VecRecommender(ContentBased):
             print("Optimizer Initialized...")
         batchsize = 2048
         iterations = 0
+        if self._batched_windows:
+            fit_partial = lda2v_model.fit_partial_batched
+        else:
+            fit_partial = lda2v_model.fit_partial
         for epoch in range(1, self.n_iter + 1):
-            for d, f in chunks(batchsize, doc_ids, flattened):
+            epoch_start, epoch_iterations = time.time(), iterations
+            # The windows of the words are contiguous, so the batches are not shuffled.
+            for d, f in BatchPrefetcher([doc_ids, flattened], batchsize):
                 t0 = time.time()
                 if len(d) <= 10:
                     continue
                 optimizer.zero_grads()
-                l = lda2v_model.fit_partial(d.copy(), f.copy())
+                l = fit_partial(d, f)
                 prior = lda2v_model.prior()
                 loss = prior
                 loss.backward()
@@ -108,6 +114,10 @@ class LDA2VecRecommender(ContentBased):
                     msg = "Iteration:{it:05d} Epoch:{epoch:02d} Loss:{loss:1.3e} Prior:{prior:1.3e} Time:{tim:.3f}s"
                     logs = dict(loss=float(l), epoch=epoch, it=iterations, prior=float(prior.data), tim=(t1 - t0))
                     print(msg.format(**logs))
+            if self._verbose:
+                epoch_time = time.time() - epoch_start
+                print("Epoch:{epoch:02d} Time:{tim:.3f}s Speed:{speed:.2f}it/s".format(
+                    epoch=epoch, tim=epoch_time, speed=(iterations - epoch_iterations) / max(epoch_time, 1e-9)))
 
         # Get document distribution matrix.
         self.document_distribution = lda2v_model.mixture.proportions(numpy.unique(doc_ids), True).data
@@ -10,17 +10,20 @@ from keras import backend
 from keras.layers import Convolution1D
 from keras.layers import Input, concatenate
 from keras.layers.core import Dense, Reshape
-from keras.models import Model
+from keras.models import Model, load_model
 from keras.regularizers import l2
-from lda2vec.utils import chunks
 from lib.content_based import ContentBased
 from lib.collaborative_filtering import CollaborativeFiltering
+from util.batch_prefetcher import BatchPrefetcher
 
 
 class SDAERecommender(CollaborativeFiltering, ContentBased):
     """
     Stacked denoising autoencoders, a content based recomender.
     """
+    # The compiled models and their initial weights, by (n_vocab, n_factors), shared by all folds and configs.
+    _compiled_models = {}
+
     def __init__(self, initializer, evaluator, hyperparameters, options,
                  verbose=False, load_matrices=True, dump_matrices=True):
         """
@@ -95,21 +98,25 @@ class SDAERecommender(CollaborativeFiltering, ContentBased):
         :rtype: list[float]
         """
         matrices_found = False
+        vocabulary_key = self.abstracts_preprocessor.get_vocabulary_key()
         if self._load_matrices is False:
             self.user_vecs = numpy.random.random((self.n_users, self.n_factors))
             self.item_vecs = numpy.random.random((self.n_items, self.n_factors))
         else:
             users_found, self.user_vecs = self.initializer.load_matrix(self.hyperparameters,
-                                                                       'user_mat', (self.n_users, self.n_factors))
+                                                                       'user_mat' + vocabulary_key,
+                                                                       (self.n_users, self.n_factors))
             if self._verbose and users_found:
                 print("User distributions files were found.")
-            items_found, self.item_vecs = self.initializer.load_matrix(self.hyperparameters, 'item_mat',
+            items_found, self.item_vecs = self.initializer.load_matrix(self.hyperparameters,
+                                                                       'item_mat' + vocabulary_key,
                                                                        (self.n_items, self.n_factors))
             if self._verbose and items_found:
                 print("Document distributions files were found.")
 
             docs_found, self.document_distribution = self.initializer.load_matrix(self.hyperparameters,
-                                                                                  'document_distribution_sdae',
+                                                                                  'document_distribution_sdae' +
+                                                                                  vocabulary_key,
                                                                                   (self.n_items, self.n_factors))
             if self._verbose and docs_found:
                 print("Document latent distributions files were found.")
@@ -125,18 +132,40 @@ class SDAERecommender(CollaborativeFiltering, ContentBased):
 
         if self._dump_matrices:
             self.initializer.set_config(self.hyperparameters, self.n_iter)
-            self.initializer.save_matrix(self.user_vecs, 'user_mat')
-            self.initializer.save_matrix(self.item_vecs, 'item_mat')
-            self.initializer.save_matrix(self.document_distribution, 'document_distribution_sdae')
+            self.initializer.save_matrix(self.user_vecs, 'user_mat' + vocabulary_key)
+            self.initializer.save_matrix(self.item_vecs, 'item_mat' + vocabulary_key)
+            self.initializer.save_matrix(self.document_distribution, 'document_distribution_sdae' + vocabulary_key)
+            if not matrices_found:
+                self.export_encoder()
 
         return self.get_evaluation_report()
 
     def get_cnn(self):
         """
-        Build a keras' convolutional neural network model.
+        Get the keras' convolutional neural network model with its initial weights. It is only built and
+        compiled once for every shape, and its weights are reset afterwards.
+        """
+        key = (self.abstracts_preprocessor.get_num_vocab(), self.n_factors)
+        if key in SDAERecommender._compiled_models:
+            self.model, initial_weights = SDAERecommender._compiled_models[key]
+            self.model.set_weights(initial_weights)
+            if self._verbose:
+                print("Reusing the compiled CNN...")
+        else:
+            self.build_cnn()
+            SDAERecommender._compiled_models[key] = (self.model, self.model.get_weights())
 
-        :returns: A tuple of 2 models, for encoding and encoding+decoding model.
-        :rtype: tuple(Model)
+    @staticmethod
+    def clear_compiled_models():
+        """
+        Release the compiled models, and clear the keras session.
+        """
+        SDAERecommender._compiled_models.clear()
+        backend.clear_session()
+
+    def build_cnn(self):
+        """
+        Build and compile a keras' convolutional neural network model.
         """
         n_vocab = self.abstracts_preprocessor.get_num_vocab()
         n1 = 64
@@ -179,7 +208,6 @@ class SDAERecommender(CollaborativeFiltering, ContentBased):
         Predict the encoding of the stacked denoising autoencoders.
 
         :param ndarray X: input of the SDAE
-        :param ndarray y: Target of the SDAE
         :returns: The encoded latent representation of X
         :rtype: float
         """
@@ -197,6 +225,76 @@ class SDAERecommender(CollaborativeFiltering, ContentBased):
         """
         return self.model.evaluate(X, numpy.concatenate((y, X), axis=1))
 
+    def encode_documents(self, term_freq, batch_size=2048):
+        """
+        Encode the documents in batches, only one batch of the term frequencies is dense at once.
+
+        :param csr_matrix term_freq: Sparse matrix of documents X words, of the word count.
+        :param int batch_size: The number of documents encoded at once.
+        :returns: A matrix of documents X factors, of the encoded documents.
+        :rtype: ndarray
+        """
+        document_distribution = numpy.empty((term_freq.shape[0], self.n_factors))
+        start = 0
+        for batch, in BatchPrefetcher([term_freq], batch_size):
+            document_distribution[start:start + batch.shape[0]] = self.predict_sdae(batch)
+            start += batch.shape[0]
+        return document_distribution
+
+    @overrides
+    def infer_document_distribution(self, term_freq):
+        """
+        Encode new documents with the trained SDAE.
+
+        :param csr_matrix term_freq: Sparse matrix of documents X words, of the word count.
+        :returns: A matrix of documents X factors, of the encoded documents.
+        :rtype: ndarray
+        """
+        return self.encode_documents(term_freq.astype(numpy.float32))
+
+    def evaluate_documents(self, term_freq, item_vecs, batch_size=2048):
+        """
+        Compute the loss of the encoding of all documents in batches.
+
+        :param csr_matrix term_freq: Sparse matrix of documents X words, of the word count.
+        :param ndarray item_vecs: The target latent vectors of the documents.
+        :param int batch_size: The number of documents evaluated at once.
+        :returns: The mean loss of the documents.
+        :rtype: float
+        """
+        total_loss = 0.0
+        for batch, item_batch in BatchPrefetcher([term_freq, item_vecs], batch_size):
+            total_loss += float(numpy.mean(self.evaluate_sdae(batch, item_batch))) * batch.shape[0]
+        return total_loss / term_freq.shape[0]
+
+    def export_encoder(self, path=None):
+        """
+        Save the trained encoder as a standalone keras model, that encodes term frequencies.
+
+        :param str path: The path of the saved model, if None then it is saved in matrices/.
+        :returns: The path of the saved model.
+        :rtype: str
+        """
+        if path is None:
+            path = self.initializer._create_path('sdae_encoder' + self.abstracts_preprocessor.get_vocabulary_key(),
+                                                 (self.n_items, self.n_factors), extension='.h5')
+        encoder = Model(inputs=self.model.input, outputs=self.model.get_layer('encoding').output)
+        encoder.save(path)
+        if self._verbose:
+            print("dumped encoder to %s" % path)
+        return path
+
+    @staticmethod
+    def load_encoder(path):
+        """
+        Load an exported encoder for inference, the encoding of documents is encoder.predict(term_freq).
+
+        :param str path: The path of the saved model.
+        :returns: The encoder.
+        :rtype: Model
+        """
+        return load_model(path)
+
     def _train(self):
         """
         Train the stacked denoising autoencoders.
@@ -205,15 +303,17 @@ class SDAERecommender(CollaborativeFiltering, ContentBased):
             current_fold = self.hyperparameters['fold'] + 1
         else:
             current_fold = 0
-        term_freq = self.abstracts_preprocessor.get_term_frequency_sparse_matrix().todense()
+        # The term frequencies stay sparse, only the batches are densified.
+        term_freq = self.abstracts_preprocessor.get_term_frequency_sparse_matrix().astype(numpy.float32)
         self.get_cnn()
         if self._verbose:
             print("CNN is constructed...")
+        self._ensure_writeable_vecs()
         error = numpy.inf
         iterations = 0
         batchsize = 2048
         for epoch in range(1, 1 + self.n_iter):
-            self.document_distribution = self.predict_sdae(term_freq)
+            self.document_distribution = self.encode_documents(term_freq, batchsize)
             t0 = time.time()
             self.user_vecs = self.als_step(self.user_vecs, self.item_vecs, self.train_data, self._lambda, type='user')
             self.item_vecs = self.als_step(self.item_vecs, self.user_vecs, self.train_data, self._lambda, type='item')
@@ -229,7 +329,7 @@ class SDAERecommender(CollaborativeFiltering, ContentBased):
                     print('Fold:{fold:02d} Iteration:{it:05d} Epoch:{epoch:02d} Loss:{loss:1.4e} '
                           'Time:{time:.3f}s'.format(**logs))
 
-            for inp_batch, item_batch in chunks(batchsize, term_freq, self.item_vecs):
+            for inp_batch, item_batch in BatchPrefetcher([term_freq, self.item_vecs], batchsize):
                 t0 = time.time()
                 loss = self.train_sdae(inp_batch, item_batch)
                 t1 = time.time()
@@ -245,13 +345,11 @@ class SDAERecommender(CollaborativeFiltering, ContentBased):
                         print(msg.format(**logs))
             error = self.evaluator.get_rmse(self.user_vecs.dot(self.item_vecs.T), self.train_data)
 
-        self.document_distribution = self.predict_sdae(term_freq)
-        rms = self.evaluate_sdae(term_freq, self.item_vecs)
+        self.document_distribution = self.encode_documents(term_freq, batchsize)
+        rms = self.evaluate_documents(term_freq, self.item_vecs, batchsize)
 
         if self._verbose:
             print(rms)
-        # Garbage collection for keras
-        backend.clear_session()
         if self._verbose:
             print("SDAE trained...")
         return rms
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+A module that contains the content-based recommender TFIDFRecommender that uses
+the cosine similarities of TF-IDF vectors.
+"""
+import numpy
+from lib.content_based import ContentBased
+from overrides import overrides
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfTransformer
+
+
+class TFIDFRecommender(ContentBased):
+    """
+    TF-IDF Recommender, a content based recommender that does not need training. The users are scored by
+    sparse products with the L2-normalized TF-IDF vectors, and the document distribution is their truncated SVD.
+    """
+    def __init__(self, initializer, evaluator, hyperparameters, options,
+                 verbose=False, load_matrices=True, dump_matrices=True):
+        """
+        Constructor of TF-IDF processor.
+
+        :param ModelInitializer initializer: A model initializer.
+        :param Evaluator evaluator: An evaluator of recommender and holder of input.
+        :param dict hyperparameters: A dictionary of the hyperparameters.
+        :param dict options: A dictionary of the run options.
+        :param boolean verbose: A flag for printing while computing.
+        :param boolean load_matrices: A flag for reinitializing the matrices.
+        :param boolean dump_matrices: A flag for saving the matrices.
+        """
+        # If False, the users are scored with the truncated document distribution instead of the TF-IDF vectors.
+        self._sparse_scoring = True
+        self.tfidf_matrix = None
+        self.tfidf_transformer = None
+        self.svd = None
+        super(TFIDFRecommender, self).__init__(initializer, evaluator, hyperparameters, options,
+                                               verbose, load_matrices, dump_matrices)
+
+    @overrides
+    def train_one_fold(self, return_report=True):
+        """
+        Compute the TF-IDF vectors and their truncated SVD.
+
+        :param bool return_report: A flag to decide if we should return the evaluation report.
+        """
+        self.prepared_state = None
+        self.svd = None
+        self.tfidf_matrix = self.get_tfidf_transformer().transform(
+            self.abstracts_preprocessor.get_term_frequency_sparse_matrix()).tocsr()
+        matrix_found = False
+        matrix_name = 'document_distribution_tfidf' + self.abstracts_preprocessor.get_vocabulary_key()
+        if self._load_matrices is True:
+            matrix_shape = (self.n_items, self.n_factors)
+            matrix_found, matrix = self.initializer.load_matrix(self.hyperparameters, matrix_name, matrix_shape)
+            self.document_distribution = matrix
+            if self._verbose and matrix_found:
+                print("Document distribution was set from file, will not compute the SVD.")
+        if matrix_found is False:
+            self._train()
+            if self._dump_matrices:
+                self.initializer.save_matrix(self.document_distribution, matrix_name)
+        if return_report:
+            return self.get_evaluation_report()
+
+    def _train(self):
+        """
+        Truncate the TF-IDF vectors to n_factors with a randomized SVD, and store the document_distribution.
+        """
+        n_components = min(self.n_factors, self.tfidf_matrix.shape[1] - 1)
+        self.svd = TruncatedSVD(n_components=n_components, algorithm='randomized', random_state=0)
+        self.document_distribution = self._pad_factors(self.svd.fit_transform(self.tfidf_matrix))
+        if self._verbose:
+            print("TF-IDF SVD computed, explained variance %.3f" % self.svd.explained_variance_ratio_.sum())
+
+    def _pad_factors(self, document_distribution):
+        """
+        Pad the document distribution with zeros, if the vocabulary is smaller than n_factors.
+
+        :param ndarray document_distribution: A matrix of documents X components.
+        :returns: A matrix of documents X n_factors.
+        :rtype: ndarray
+        """
+        n_components = document_distribution.shape[1]
+        if n_components < self.n_factors:
+            document_distribution = numpy.hstack((document_distribution,
+                                                  numpy.zeros((document_distribution.shape[0],
+                                                               self.n_factors - n_components))))
+        return document_distribution
+
+    def get_tfidf_transformer(self):
+        """
+        :returns: The TF-IDF transformer, fitted on the abstracts.
+        :rtype: TfidfTransformer
+        """
+        if self.tfidf_transformer is None:
+            self.tfidf_transformer = TfidfTransformer(norm='l2').fit(
+                self.abstracts_preprocessor.get_term_frequency_sparse_matrix())
+        return self.tfidf_transformer
+
+    @overrides
+    def infer_document_distribution(self, term_freq):
+        """
+        Project new documents on the truncated TF-IDF space.
+
+        :param csr_matrix term_freq: Sparse matrix of documents X words, of the word count.
+        :returns: A matrix of documents X topics distribution.
+        :rtype: ndarray
+        """
+        if self.svd is None:
+            if self.tfidf_matrix is None:
+                self.tfidf_matrix = self.get_tfidf_transformer().transform(
+                    self.abstracts_preprocessor.get_term_frequency_sparse_matrix()).tocsr()
+            # The SVD was not computed if the document distribution was loaded from file.
+            document_distribution = self.document_distribution
+            self._train()
+            if document_distribution is not None:
+                self.document_distribution = document_distribution
+        return self._pad_factors(self.svd.transform(self.get_tfidf_transformer().transform(term_freq)))
+
+    @overrides
+    def prepare_predictions(self):
+        """
+        Compute the similarity weights of the TF-IDF vectors, which do not depend on the ratings.
+        """
+        if not self._sparse_scoring or self._n_neighbours:
+            return super(TFIDFRecommender, self).prepare_predictions()
+        if self.tfidf_matrix is None:
+            self.tfidf_matrix = self.get_tfidf_transformer().transform(
+                self.abstracts_preprocessor.get_term_frequency_sparse_matrix()).tocsr()
+        state = (id(self.tfidf_matrix), self.tfidf_matrix, None)
+        if self.prepared_state is not None and self.prepared_state[0] == state[0] and self.prepared_state[2] is None:
+            return
+        self.prepared_state = state
+        self.item_neighbours = None
+        self.transposed_tfidf_matrix = self.tfidf_matrix.T.tocsr()
+        X = self.tfidf_matrix
+        self.similarity_weights = X.dot(self.transposed_tfidf_matrix.dot(numpy.ones((X.shape[0],))))
+
+    @overrides
+    def predict_block(self, ratings_block):
+        """
+        Predict the ratings of a block of users, from the cosine similarities of the TF-IDF vectors.
+
+        :param csr_matrix ratings_block: Sparse matrix of users X items, of the training ratings of the users.
+        :returns: A matrix of users X documents
+        :rtype: ndarray
+        """
+        if not self._sparse_scoring or self.item_neighbours is not None:
+            return super(TFIDFRecommender, self).predict_block(ratings_block)
+        predictions = ratings_block.dot(self.tfidf_matrix).dot(self.transposed_tfidf_matrix).toarray()
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            predictions /= self.similarity_weights
+        predictions[~numpy.isfinite(predictions)] = 0.0
+        return predictions
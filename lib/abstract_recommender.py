@@ -101,6 +101,25 @@ class AbstractRecommender(object):
         """
         Method prints evaluation report for a trained model.
 
+        :returns: Tuple of evaluation metrics.
+        :rtype: Tuple
+        """
+        (test_sum, train_sum, rmse, train_recall, test_recall, recall_at_x, ratio, mrr_at_five, ndcg_at_five,
+         mrr_at_ten, ndcg_at_ten) = self.get_evaluation_metrics()
+        if self._verbose:
+            report_str = 'Test sum {:.2f}, Train sum {:.2f}, Final error {:.5f}, train recall {:.5f}, '\
+                         'test recall {:.5f}, recall@200 {:.5f}, '\
+                         'ratio {:.5f}, mrr@5 {:.5f}, '\
+                         'ndcg@5 {:.5f}, mrr@10 {:.5f}, ndcg@10 {:.5f}'
+            print(report_str.format(test_sum, train_sum, rmse, train_recall, test_recall, recall_at_x, ratio,
+                                    mrr_at_five, ndcg_at_five, mrr_at_ten, ndcg_at_ten))
+        return (test_sum, train_sum, rmse, train_recall, test_recall, recall_at_x, ratio, mrr_at_five, ndcg_at_five,
+                mrr_at_ten, ndcg_at_ten)
+
+    def get_evaluation_metrics(self):
+        """
+        Compute the evaluation metrics of a trained model from its predictions matrix.
+
         :returns: Tuple of evaluation metrics.
         :rtype: Tuple
         """
@@ -120,13 +139,6 @@ class AbstractRecommender(object):
         mrr_at_ten = self.evaluator.calculate_mrr(10, predictions, self.test_data, rounded_predictions)
         ndcg_at_ten = self.evaluator.calculate_ndcg(10, predictions, self.test_data, rounded_predictions)
         rmse = self.evaluator.get_rmse(predictions, self.train_data)
-        if self._verbose:
-            report_str = 'Test sum {:.2f}, Train sum {:.2f}, Final error {:.5f}, train recall {:.5f}, '\
-                         'test recall {:.5f}, recall@200 {:.5f}, '\
-                         'ratio {:.5f}, mrr@5 {:.5f}, '\
-                         'ndcg@5 {:.5f}, mrr@10 {:.5f}, ndcg@10 {:.5f}'
-            print(report_str.format(test_sum, train_sum, rmse, train_recall, test_recall, recall_at_x, ratio,
-                                    mrr_at_five, ndcg_at_five, mrr_at_ten, ndcg_at_ten))
         return (test_sum, train_sum, rmse, train_recall, test_recall, recall_at_x, ratio, mrr_at_five, ndcg_at_five,
                 mrr_at_ten, ndcg_at_ten)
 
@@ -177,9 +189,20 @@ class AbstractRecommender(object):
         :returns: predictions rounded up matrix
         :rtype: int[][]
         """
-        predictions = self.get_predictions().copy()
-        n_users = self.ratings.shape[0]
-        for user in range(n_users):
+        return self.round_predictions(self.get_predictions())
+
+    @staticmethod
+    def round_predictions(predictions):
+        """
+        Round up the predictions of a block of users, every prediction of a user that is at least
+        the average prediction of the user is 1, and the others are 0.
+
+        :param float[][] predictions: A matrix of users X items of predictions.
+        :returns: predictions rounded up matrix
+        :rtype: int[][]
+        """
+        predictions = predictions.copy()
+        for user in range(predictions.shape[0]):
             avg = sum(predictions[user]) / predictions.shape[1]
             low_values_indices = predictions[user, :] < avg
             predictions[user, :] = 1
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+A module that contains the item-based recommender CitationGraphRecommender, that
+scores items by random walks with restart on the citation graph.
+"""
+import numpy
+from overrides import overrides
+from scipy import sparse
+from lib.content_based import ContentBased
+from util.data_parser import DataParser
+
+
+class CitationGraphRecommender(ContentBased):
+    """
+    A recommender that runs personalized PageRank on the (undirected) citation graph, restarting from the
+    library of each user. Blocks of users are walked at once with sparse matrix products.
+    """
+    def __init__(self, initializer, evaluator, hyperparameters, options,
+                 verbose=False, load_matrices=True, dump_matrices=True, citations=None):
+        """
+        Constructor of the citation graph recommender.
+
+        :param ModelInitializer initializer: A model initializer.
+        :param Evaluator evaluator: An evaluator of recommender and holder of input.
+        :param dict hyperparameters: A dictionary of the hyperparameters.
+        :param dict options: A dictionary of the run options.
+        :param boolean verbose: A flag for printing while computing.
+        :param boolean load_matrices: A flag for reinitializing the matrices.
+        :param boolean dump_matrices: A flag for saving the output matrices.
+        :param list[pair] citations: List of (article_id, cited_article_id), if None then queried.
+        """
+        # Options of the random walk, they can be overridden by the run options.
+        self._restart_probability = 0.15
+        self._walk_iterations = 30
+        self._walk_tolerance = 1e-6
+        if citations is None:
+            citations = DataParser.get_citations()
+        self.citations = citations
+        self.transition_matrix = None
+        self.transposed_transition_matrix = None
+        super(CitationGraphRecommender, self).__init__(initializer, evaluator, hyperparameters, options,
+                                                       verbose, load_matrices, dump_matrices)
+
+    @overrides
+    def train_one_fold(self, return_report=True):
+        """
+        Build the transition matrix of the citation graph, it does not depend on the fold.
+
+        :param bool return_report: A flag to decide if we should return the evaluation report.
+        """
+        self.document_distribution = None
+        self.transition_matrix = self.build_transition_matrix()
+        if return_report:
+            return self.get_evaluation_report()
+
+    def build_transition_matrix(self):
+        """
+        Build the row-stochastic transition matrix of the undirected citation graph, and its transpose
+        that the random walks use.
+
+        :returns: Sparse matrix of items X items, of transition probabilities.
+        :rtype: csr_matrix
+        """
+        if len(self.citations):
+            citing, cited = numpy.array(self.citations, dtype=numpy.int64).T
+            valid = (citing >= 0) & (citing < self.n_items) & (cited >= 0) & (cited < self.n_items)
+            citing, cited = citing[valid], cited[valid]
+        else:
+            citing, cited = numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.int64)
+        adjacency = sparse.coo_matrix((numpy.ones(2 * len(citing)), (numpy.concatenate((citing, cited)),
+                                                                     numpy.concatenate((cited, citing)))),
+                                      shape=(self.n_items, self.n_items)).tocsr()
+        adjacency.data[:] = 1.0
+        degrees = numpy.asarray(adjacency.sum(axis=1)).ravel()
+        self.dangling_items = degrees == 0
+        degrees[self.dangling_items] = 1.0
+        if self._verbose:
+            print("Citation graph has %d items and %d edges" % (self.n_items, adjacency.nnz // 2))
+        transition_matrix = sparse.diags(1.0 / degrees).dot(adjacency).tocsr()
+        # The walks are computed on the transposed matrices, items X users.
+        self.transposed_transition_matrix = transition_matrix.T.tocsr()
+        return transition_matrix
+
+    @overrides
+    def prepare_predictions(self):
+        """
+        Build the transition matrix if the recommender was not trained.
+        """
+        if self.transition_matrix is None:
+            self.transition_matrix = self.build_transition_matrix()
+
+    @overrides
+    def predict_block(self, ratings_block):
+        """
+        Predict the ratings of a block of users, by walking from their libraries.
+
+        :param csr_matrix ratings_block: Sparse matrix of users X items, of the training ratings of the users.
+        :returns: A matrix of users X documents
+        :rtype: ndarray
+        """
+        return self.random_walk(ratings_block)
+
+    def random_walk(self, seeds):
+        """
+        Run random walks with restart from a block of users at once.
+
+        :param csr_matrix seeds: Sparse matrix of users X items, of the libraries of the users.
+        :returns: Matrix of users X items, of the stationary visiting probabilities.
+        :rtype: ndarray
+        """
+        library_sizes = numpy.asarray(seeds.sum(axis=1)).ravel()
+        library_sizes[library_sizes == 0] = 1.0
+        restart = sparse.diags(1.0 / library_sizes).dot(seeds).toarray()
+        transposed_transition = self.transposed_transition_matrix
+        restart = restart.T
+        scores = restart.copy()
+        alpha = self._restart_probability
+        for _ in range(self._walk_iterations):
+            # Walks that reach an item without citations restart from the library.
+            dangling_mass = scores[self.dangling_items].sum(axis=0)
+            new_scores = (1 - alpha) * (transposed_transition.dot(scores) + restart * dangling_mass) + alpha * restart
+            converged = numpy.abs(new_scores - scores).max() < self._walk_tolerance
+            scores = new_scores
+            if converged:
+                break
+        return scores.T
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+A module that contains the ColdStartEmbedder, that embeds new documents in the latent space of
+the collaborative filtering without training, so that they can be recommended right away.
+"""
+import re
+import numpy
+from scipy import sparse
+
+
+class ColdStartEmbedder(object):
+    """
+    A class that maps the document distribution of a trained content-based recommender to the item vectors
+    of a trained collaborative filtering with a ridge regression. New documents are projected through the
+    content model, then through this linear map.
+    """
+    def __init__(self, content_based, item_vecs, vocabulary=None, _lambda=0.01, verbose=False):
+        """
+        Constructs a cold-start embedder, and fits the linear map.
+
+        :param ContentBased content_based:
+            A trained content-based recommender, that can infer the distribution of new documents.
+        :param ndarray item_vecs: The item vectors of the collaborative filtering.
+        :param dict[str,int] vocabulary: A dictionary of every word to its id, needed to embed raw texts.
+        :param float _lambda: The regularization of the ridge regression.
+        :param boolean verbose: A flag for printing progress.
+        """
+        self.content_based = content_based
+        self.abstracts_preprocessor = content_based.abstracts_preprocessor
+        self.vocabulary = vocabulary
+        self._lambda = _lambda
+        self._verbose = verbose
+        self.fit(content_based.get_document_topic_distribution(), item_vecs)
+
+    def fit(self, document_distribution, item_vecs):
+        """
+        Fit the linear map from the document distribution to the item vectors.
+
+        :param ndarray document_distribution: A matrix of documents X topics.
+        :param ndarray item_vecs: A matrix of documents X factors.
+        """
+        X = self._add_bias(document_distribution)
+        regularization = numpy.eye(X.shape[1]) * self._lambda
+        # The bias is not regularized.
+        regularization[-1, -1] = 0.0
+        self.weights = numpy.linalg.solve(X.T.dot(X) + regularization, X.T.dot(item_vecs))
+        if self._verbose:
+            error = numpy.sqrt(numpy.mean((X.dot(self.weights) - item_vecs) ** 2))
+            print("Cold-start map fitted, RMS error %.5f" % error)
+
+    @staticmethod
+    def _add_bias(matrix):
+        """
+        :param ndarray matrix: A matrix.
+        :returns: The matrix with an additional column of ones.
+        :rtype: ndarray
+        """
+        return numpy.hstack((matrix, numpy.ones((matrix.shape[0], 1))))
+
+    def get_bag_of_words(self, texts):
+        """
+        Build the term frequencies of raw texts, in the vocabulary of the content-based recommender.
+        Words that are not in the vocabulary are ignored.
+
+        :param list[str] texts: The raw texts.
+        :returns: Sparse matrix of texts X words, of the word count.
+        :rtype: csr_matrix
+        """
+        if self.vocabulary is None:
+            raise ValueError("A vocabulary is needed to embed raw texts")
+        vocabulary_mapping = self.abstracts_preprocessor.get_vocabulary_mapping()
+        rows, columns = [], []
+        for row, text in enumerate(texts):
+            for word in re.findall(r"[a-z0-9]+", text.lower()):
+                word_id = self.vocabulary.get(word)
+                if word_id is None:
+                    continue
+                if vocabulary_mapping is not None:
+                    word_id = vocabulary_mapping[word_id]
+                    if word_id < 0:
+                        continue
+                rows.append(row)
+                columns.append(word_id)
+        # Duplicated words are summed to their counts.
+        return sparse.coo_matrix((numpy.ones(len(rows)), (rows, columns)),
+                                 shape=(len(texts), self.abstracts_preprocessor.get_num_vocab())).tocsr()
+
+    def embed(self, term_freq):
+        """
+        Embed new documents in the latent space of the collaborative filtering.
+
+        :param csr_matrix term_freq: Sparse matrix of documents X words, of the word count.
+        :returns: A matrix of documents X factors, of the item vectors of the documents.
+        :rtype: ndarray
+        """
+        document_distribution = self.content_based.infer_document_distribution(sparse.csr_matrix(term_freq))
+        return self._add_bias(document_distribution).dot(self.weights)
+
+    def embed_texts(self, texts):
+        """
+        Embed new raw texts in the latent space of the collaborative filtering.
+
+        :param list[str] texts: The raw texts.
+        :returns: A matrix of texts X factors, of the item vectors of the texts.
+        :rtype: ndarray
+        """
+        return self.embed(self.get_bag_of_words(texts))
+
+    def predict(self, user_vecs, term_freq):
+        """
+        Predict the ratings of new documents.
+
+        :param ndarray user_vecs: The user vectors of the collaborative filtering.
+        :param csr_matrix term_freq: Sparse matrix of documents X words, of the word count.
+        :returns: A matrix of users X new documents.
+        :rtype: ndarray
+        """
+        return user_vecs.dot(self.embed(term_freq).T)
@@ -50,6 +50,13 @@ class CollaborativeFiltering(AbstractRecommender):
         self._update_with_items = update_with_items
         self._split_type = 'user'
         self._init_with_content = init_with_content
+        # The training of a fold stops when the error improves by less than this fraction.
+        self._convergence_tolerance = 0.0
+        self.graph_recommender = None
+        # The user_vecs and item_vecs of every fold, of the last training and of a training to start from.
+        self.fold_vecs = {}
+        self.warm_start = None
+        self.n_epochs = 0
 
         self.set_hyperparameters(hyperparameters)
         self.set_options(options)
@@ -109,6 +116,8 @@ class CollaborativeFiltering(AbstractRecommender):
             self.document_distribution = item_vecs.copy()
         else:
             self.document_distribution = None
+        self.fold_vecs = {}
+        self.n_epochs = 0
         if self.splitting_method == 'naive':
             self.set_data(*self.evaluator.naive_split(self._split_type))
             self.hyperparameters['fold'] = 0
@@ -169,28 +178,34 @@ class CollaborativeFiltering(AbstractRecommender):
         :rtype: list[float]
         """
         matrices_found = False
-        if self._load_matrices is False:
-            self.user_vecs = numpy.random.random((self.n_users, self.n_factors))
-            if (item_vecs is None or not self._init_with_content
-                    or not item_vecs.shape == (self.n_items, self.n_factors)):
-                self.item_vecs = numpy.random.random((self.n_items, self.n_factors))
-            else:
+        warm_start_vecs = self.get_warm_start_vecs()
+        if self._load_matrices is False and warm_start_vecs is not None:
+            self.user_vecs, self.item_vecs = warm_start_vecs
+        elif self._load_matrices is False:
+            self.user_vecs = self.evaluator.random_state.random_sample((self.n_users, self.n_factors))
+            if self._starts_from_item_vecs(item_vecs):
                 self.item_vecs = item_vecs
+            else:
+                self.item_vecs = self.evaluator.random_state.random_sample((self.n_items, self.n_factors))
         else:
             users_found, self.user_vecs = self.initializer.load_matrix(self.hyperparameters,
                                                                        'user_vecs' + self._get_options_suffix(),
-                                                                       (self.n_users, self.n_factors))
+                                                                       (self.n_users, self.n_factors),
+                                                                       self.evaluator.random_state)
             if self._verbose and users_found:
                 print("User distributions files were found.")
             items_found, self.item_vecs = self.initializer.load_matrix(self.hyperparameters,
                                                                        'item_vecs' + self._get_options_suffix(),
-                                                                       (self.n_items, self.n_factors))
+                                                                       (self.n_items, self.n_factors),
+                                                                       self.evaluator.random_state)
             if self._verbose and items_found:
                 print("Document distributions files were found.")
-            if not items_found and item_vecs is not None:
+            if not items_found and self._starts_from_item_vecs(item_vecs):
                 items_found = True
                 self.item_vecs = item_vecs
             matrices_found = users_found and items_found
+            if not matrices_found and warm_start_vecs is not None:
+                self.user_vecs, self.item_vecs = warm_start_vecs
         if not matrices_found:
             if self._verbose and self._load_matrices:
                 print("User and Document distributions files were not found, will train collaborative.")
@@ -203,6 +218,7 @@ class CollaborativeFiltering(AbstractRecommender):
             else:
                 if self._verbose and self._load_matrices:
                     print("User and Document distributions files found, will not train the model further.")
+        self.fold_vecs[self.hyperparameters.get('fold', 0)] = (self.user_vecs.copy(), self.item_vecs.copy())
 
         if self._dump_matrices:
             self.initializer.set_config(self.hyperparameters, self.n_iter)
@@ -211,6 +227,57 @@ class CollaborativeFiltering(AbstractRecommender):
 
         return self.get_evaluation_report()
 
+    def _starts_from_item_vecs(self, item_vecs):
+        """
+        :param ndarray item_vecs: The item vectors given to the training, like the document distribution.
+        :returns: A flag that is True if the training of a fold starts from the given item vectors.
+        :rtype: boolean
+        """
+        return (item_vecs is not None and self._init_with_content and
+                item_vecs.shape == (self.n_items, self.n_factors))
+
+    def set_warm_start(self, fold_vecs):
+        """
+        Start the next trainings from the vectors of another training, instead of random vectors.
+
+        :param dict fold_vecs: The user_vecs and item_vecs of every fold, as in fold_vecs after a training.
+            None to start from random vectors again.
+        """
+        self.warm_start = fold_vecs
+
+    def get_warm_start_vecs(self):
+        """
+        :returns: The user_vecs and item_vecs to start the current fold from, resized to n_factors,
+            None if there is no warm start.
+        :rtype: tuple(ndarray, ndarray)
+        """
+        if self.warm_start is None or self.hyperparameters.get('fold', 0) not in self.warm_start:
+            return None
+        return tuple(self._resize_factors(vecs) for vecs in self.warm_start[self.hyperparameters.get('fold', 0)])
+
+    def _resize_factors(self, vecs):
+        """
+        Truncate the vectors to n_factors, or pad them with small random factors.
+
+        :param ndarray vecs: The vectors.
+        :returns: A copy of the vectors with n_factors columns.
+        :rtype: ndarray
+        """
+        if vecs.shape[1] >= self.n_factors:
+            return vecs[:, :self.n_factors].copy()
+        # Zero factors would stay zero in the ALS steps, they are initialized small instead.
+        padding = self.evaluator.random_state.random_sample((vecs.shape[0], self.n_factors - vecs.shape[1])) * 0.01
+        return numpy.hstack((vecs, padding))
+
+    def _ensure_writeable_vecs(self):
+        """
+        The ALS steps update the vectors in place, the read-only vectors of a component cache are copied first.
+        """
+        if not self.user_vecs.flags.writeable:
+            self.user_vecs = self.user_vecs.copy()
+        if not self.item_vecs.flags.writeable:
+            self.item_vecs = self.item_vecs.copy()
+
     def _get_options_suffix(self):
         suffix = ''
         if self._init_with_content:
@@ -225,6 +292,7 @@ class CollaborativeFiltering(AbstractRecommender):
         """
         Train model for n_iter iterations. Can be called multiple times for further training.
         """
+        self._ensure_writeable_vecs()
         error = numpy.inf
         if 'fold' in self.hyperparameters:
             current_fold = self.hyperparameters['fold'] + 1
@@ -245,6 +313,7 @@ class CollaborativeFiltering(AbstractRecommender):
             self.item_vecs = self.als_step(self.item_vecs, self.user_vecs, self.train_data, self._lambda, type='item')
             t1 = time.time()
             error = self.evaluator.get_rmse(self.user_vecs.dot(self.item_vecs.T), self.train_data)
+            self.n_epochs += 1
             if self._verbose:
                 if current_fold == 0:
                     print('Epoch:{epoch:02d} Loss:{loss:1.4e} Time:{time:.3f}s'.format(**dict(epoch=epoch, loss=error,
@@ -253,7 +322,7 @@ class CollaborativeFiltering(AbstractRecommender):
                     print('Fold:{fold:02d} Epoch:{epoch:02d} Loss:{loss:1.4e} '
                           'Time:{time:.3f}s'.format(**dict(fold=current_fold, epoch=epoch, loss=error,
                                                            time=(t1 - t0))))
-            if error >= old_error:
+            if error >= old_error * (1 - self._convergence_tolerance):
                 if self._verbose:
                     print("Local Optimum was found in the last iteration, breaking.")
                 break
@@ -270,9 +339,13 @@ class CollaborativeFiltering(AbstractRecommender):
             collaborative_predictions = self.user_vecs.dot(self.item_vecs.T)
             if self._is_hybrid:
                 self.item_based_recommender.set_data(self.train_data, self.test_data)
+                graph_predictions = None
+                if self.graph_recommender is not None:
+                    self.graph_recommender.set_data(self.train_data, self.test_data)
+                    graph_predictions = self.graph_recommender.get_predictions()
                 # Train Linear Regression
                 regr = LinearRegression(self.train_data, self.test_data, self.item_based_recommender.get_predictions(),
-                                        collaborative_predictions)
+                                        collaborative_predictions, graph_predictions)
                 self.predictions = regr.train()
                 self.prediction_fold = self.hyperparameters['fold']
                 if self._verbose:
@@ -300,3 +373,11 @@ class CollaborativeFiltering(AbstractRecommender):
         :param ContentBased recommender: The content based recommender
         """
         self.item_based_recommender = recommender
+
+    def set_graph_recommender(self, recommender):
+        """
+        Set the citation graph recommender, in order to use its ratings as a third signal of the hybrid recommender.
+
+        :param CitationGraphRecommender recommender: The citation graph recommender
+        """
+        self.graph_recommender = recommender
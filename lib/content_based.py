@@ -4,6 +4,7 @@ This module provides the functionalities of content-based analysis of the tests.
 """
 import numpy
 from overrides import overrides
+from scipy import sparse
 from lib.abstract_recommender import AbstractRecommender
 
 
@@ -35,6 +36,12 @@ class ContentBased(AbstractRecommender):
         self._load_matrices = load_matrices
         self._dump_matrices = dump_matrices
         self._verbose = verbose
+        # The number of users whose predictions are computed at once.
+        self._block_size = 1024
+        # If given, only the n_neighbours most similar items of every item are used.
+        self._n_neighbours = None
+        self.item_neighbours = None
+        self.prepared_state = None
         self.set_hyperparameters(hyperparameters)
         self.set_options(options)
 
@@ -63,6 +70,7 @@ class ContentBased(AbstractRecommender):
         :param bool return_report: A flag to decide if we should return the evaluation report.
         """
         self.document_distribution = None
+        self.prepared_state = None
 
     @overrides
     def set_hyperparameters(self, hyperparameters):
@@ -73,6 +81,7 @@ class ContentBased(AbstractRecommender):
         """
         self.n_factors = hyperparameters['n_factors']
         self.predictions = None
+        self.prepared_state = None
         self.hyperparameters = hyperparameters.copy()
 
     def get_document_topic_distribution(self):
@@ -84,34 +93,228 @@ class ContentBased(AbstractRecommender):
         """
         return self.document_distribution
 
-    @overrides
-    def get_predictions(self):
+    def infer_document_distribution(self, term_freq):
         """
-        Get the expected ratings between users and items.
+        Infer the document distribution of new documents, without training.
+
+        :param csr_matrix term_freq: Sparse matrix of documents X words, of the word count.
+        :returns: A matrix of documents X topics distribution.
+        :rtype: ndarray
+        """
+        raise NotImplementedError("%s can't infer the distribution of new documents" % self)
+
+    def get_normalized_document_distribution(self):
+        """
+        Center and normalize the rows of the document distribution, a random distribution is used if there is none.
+
+        :returns: A matrix of documents X topics, of unit rows.
+        :rtype: ndarray
+        """
+        if self.document_distribution is None:
+            V = numpy.random.random((self.n_items, self.n_factors))
+        else:
+            V = numpy.array(self.document_distribution, dtype=numpy.float64)
+        V -= V.mean(axis=1)[:, numpy.newaxis]
+        item_norms = numpy.sqrt(numpy.einsum('ij,ij->i', V, V))
+        item_norms[item_norms <= 1e-6] = 1.0
+        V /= item_norms[:, numpy.newaxis]
+        return V
+
+    def prepare_predictions(self):
+        """
+        Compute the item-side quantities of the predictions, which do not depend on the ratings.
+        They are computed once for a document distribution, and reused by all the folds.
+        """
+        # The document distribution is referenced by the state, so its id can not be reused by another matrix.
+        state = (id(self.document_distribution), self.document_distribution, self._n_neighbours)
+        if self.prepared_state is not None and self.prepared_state[0] == state[0] and \
+                self.prepared_state[2] == state[2]:
+            return
+        self.prepared_state = state
+        self.normalized_documents = self.get_normalized_document_distribution()
+        V = self.normalized_documents
+        if self._n_neighbours:
+            self.item_neighbours = self.get_item_neighbours_matrix()
+            self.transposed_item_neighbours = self.item_neighbours.T.tocsr()
+            self.similarity_weights = numpy.asarray(self.item_neighbours.sum(axis=1)).ravel()
+        else:
+            self.item_neighbours = None
+            self.similarity_weights = V.dot(V.T.dot(numpy.ones((V.shape[0],))))
+
+    def get_item_neighbours_matrix(self):
+        """
+        Get the graph of the most similar items of every item, it is loaded or saved through the initializer
+        if the document distribution is trained.
+
+        :returns: Sparse matrix of items X items, of the cosine similarities of the n_neighbours nearest items.
+        :rtype: csr_matrix
+        """
+        # The shape of the graph does not identify the number of factors, so it is part of the name.
+        matrix_name = 'item_neighbours_%d_%s_%d%s' % (self._n_neighbours, self, self.n_factors,
+                                                      self.abstracts_preprocessor.get_vocabulary_key())
+        shape = (self.n_items, self.n_items)
+        is_trained = self.document_distribution is not None
+        if is_trained and self._load_matrices:
+            found, item_neighbours = self.initializer.load_sparse_matrix(self.hyperparameters, matrix_name, shape)
+            if found:
+                return item_neighbours
+        item_neighbours = self.build_item_neighbours()
+        if is_trained and self._dump_matrices:
+            self.initializer.set_config(self.hyperparameters.copy(), self.n_iter)
+            self.initializer.save_sparse_matrix(item_neighbours, matrix_name)
+        return item_neighbours
+
+    def build_item_neighbours(self):
+        """
+        Build the graph of the most similar items of every item, from blocks of the cosine similarities.
+
+        :returns: Sparse matrix of items X items, of the cosine similarities of the n_neighbours nearest items.
+        :rtype: csr_matrix
+        """
+        V = self.normalized_documents
+        n_neighbours = min(self._n_neighbours, self.n_items)
+        indices = numpy.empty((self.n_items, n_neighbours), dtype=numpy.int32)
+        similarities = numpy.empty((self.n_items, n_neighbours))
+        for start in range(0, self.n_items, self._block_size):
+            end = min(self.n_items, start + self._block_size)
+            block = V[start:end].dot(V.T)
+            indices[start:end] = numpy.argpartition(-block, n_neighbours - 1, axis=1)[:, :n_neighbours]
+            similarities[start:end] = numpy.take_along_axis(block, indices[start:end], axis=1)
+        indptr = numpy.arange(0, self.n_items * n_neighbours + 1, n_neighbours)
+        item_neighbours = sparse.csr_matrix((similarities.ravel(), indices.ravel(), indptr),
+                                            shape=(self.n_items, self.n_items))
+        item_neighbours.sort_indices()
+        return item_neighbours
+
+    def get_item_neighbours(self, item):
+        """
+        Get the most similar items of an item, requires the option n_neighbours.
+
+        :param int item: The index of the item.
+        :returns: A tuple of the indices of the nearest items and their similarities, most similar first.
+        :rtype: tuple[ndarray]
+        """
+        if self.item_neighbours is None:
+            self.prepare_predictions()
+        row = self.item_neighbours.getrow(item)
+        order = numpy.argsort(-row.data, kind='mergesort')
+        return row.indices[order], row.data[order]
 
+    def predict_block(self, ratings_block):
+        """
+        Predict the ratings of a block of users.
+
+        :param csr_matrix ratings_block: Sparse matrix of users X items, of the training ratings of the users.
         :returns: A matrix of users X documents
         :rtype: ndarray
         """
-        if self.predictions is not None:
-            return self.predictions
         # The matrix V * VT is a (cosine) similarity matrix, where V is the row-normalized
         # latent document matrix, this matrix is big, so we avoid having it in inline computations
         # by changing the multiplication order
         # predicted_rating[u,i] = sum[j]{R[u,j] Vj * Vi} / sum[j]{Vj * Vi}
         #                       = sum[j]{R[u,j] * cos(i, j)} / sum[j]{cos(i, j)}
-        if self.document_distribution is None:
-            V = numpy.random.random((self.n_items, self.n_factors))
+        if self.item_neighbours is not None:
+            predictions = ratings_block.dot(self.transposed_item_neighbours).toarray()
         else:
-            V = self.document_distribution.copy()
-        for item in range(V.shape[0]):
-            mean = numpy.mean(V[item])
-            V[item] -= mean
-            item_norm = numpy.sqrt(V[item].dot(V[item]))
-            if item_norm > 1e-6:
-                V[item] /= item_norm
-        weighted_ratings = self.train_data.dot(V).dot(V.T)
-        weights = V.dot(V.T.dot(numpy.ones((V.shape[0],))))
-        self.predictions = weighted_ratings / weights  # Divisions by zero are handled.
-        del weighted_ratings
-        self.predictions[~numpy.isfinite(self.predictions)] = 0.0
+            V = self.normalized_documents
+            predictions = ratings_block.dot(V).dot(V.T)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            predictions /= self.similarity_weights
+        predictions[~numpy.isfinite(predictions)] = 0.0
+        return predictions
+
+    def iter_prediction_blocks(self):
+        """
+        Compute the predictions in blocks of users, so that only one block is held in memory.
+
+        :returns: An iterator of (start, end, predictions) of the users from start to end.
+        :rtype: generator
+        """
+        self.prepare_predictions()
+        train_data = sparse.csr_matrix(self.train_data, dtype=numpy.float64)
+        for start in range(0, self.n_users, self._block_size):
+            end = min(self.n_users, start + self._block_size)
+            yield start, end, self.predict_block(train_data[start:end])
+
+    def get_top_recommendations(self, num_recommendations=10):
+        """
+        Get the top recommendations of all users, without holding all the predictions in memory.
+
+        :param int num_recommendations: The number of recommended items for each user.
+        :returns: A tuple of matrices of users X num_recommendations, of the items and their predictions.
+        :rtype: tuple[ndarray]
+        """
+        num_recommendations = min(num_recommendations, self.n_items)
+        top_items = numpy.empty((self.n_users, num_recommendations), dtype=numpy.int64)
+        top_values = numpy.empty((self.n_users, num_recommendations))
+        for start, end, predictions in self.iter_prediction_blocks():
+            items = numpy.argpartition(-predictions, num_recommendations - 1, axis=1)[:, :num_recommendations]
+            values = numpy.take_along_axis(predictions, items, axis=1)
+            order = numpy.argsort(-values, axis=1, kind='mergesort')
+            top_items[start:end] = numpy.take_along_axis(items, order, axis=1)
+            top_values[start:end] = numpy.take_along_axis(values, order, axis=1)
+        return top_items, top_values
+
+    @overrides
+    def get_evaluation_metrics(self):
+        """
+        Compute the evaluation metrics of a trained model from blocks of predictions, so that the predictions
+        matrix is not held in memory. If the predictions matrix was already computed, it is used.
+
+        :returns: Tuple of evaluation metrics.
+        :rtype: Tuple
+        """
+        if self.predictions is not None:
+            return super(ContentBased, self).get_evaluation_metrics()
+        evaluator = self.evaluator
+        fold = self.hyperparameters['fold']
+        train_hits, test_hits, recommendations, rss = 0, 0, 0, 0
+        recalls, mrrs_at_five, ndcgs_at_five, mrrs_at_ten, ndcgs_at_ten = [], [], [], [], []
+        for start, end, predictions in self.iter_prediction_blocks():
+            rounded_predictions = self.round_predictions(predictions)
+            train_hits += sum(rounded_predictions[self.train_data[start:end].nonzero()])
+            test_hits += sum(rounded_predictions[self.test_data[start:end].nonzero()])
+            recommendations += sum(sum(rounded_predictions))
+            for offset, user in enumerate(range(start, end)):
+                rss += numpy.sum((predictions[offset] - self.train_data[user]) ** 2)
+                evaluator.load_user_top_recommendations(user, 200, predictions[offset], fold)
+                recall = evaluator.get_user_recall_at_x(user, 200, self.test_data[user], rounded_predictions[offset])
+                if recall is not None:
+                    recalls.append(recall)
+                mrrs_at_five.append(evaluator.get_user_mrr(user, 5, rounded_predictions[offset]))
+                mrrs_at_ten.append(evaluator.get_user_mrr(user, 10, rounded_predictions[offset]))
+                for n_recommendations, ndcgs in [(5, ndcgs_at_five), (10, ndcgs_at_ten)]:
+                    ndcg = evaluator.get_user_ndcg(user, n_recommendations, rounded_predictions[offset])
+                    if ndcg is not None:
+                        ndcgs.append(ndcg)
+        evaluator.recs_loaded = True
+        test_sum = self.test_data.sum()
+        train_sum = self.train_data.sum()
+        # Division by zeros are handled, like in the evaluator.
+        train_recall = train_hits / sum(sum(self.train_data))
+        test_recall = test_hits / sum(sum(self.test_data))
+        recall_at_x = numpy.mean(recalls, dtype=numpy.float16)
+        ratio = recommendations / sum(sum(self.ratings))
+        mrr_at_five = numpy.mean(mrrs_at_five, dtype=numpy.float16)
+        ndcg_at_five = numpy.mean(ndcgs_at_five, dtype=numpy.float16)
+        mrr_at_ten = numpy.mean(mrrs_at_ten, dtype=numpy.float16)
+        ndcg_at_ten = numpy.mean(ndcgs_at_ten, dtype=numpy.float16)
+        rmse = numpy.sqrt(float(rss) / (self.n_users * self.n_items))
+        return (test_sum, train_sum, rmse, train_recall, test_recall, recall_at_x, ratio, mrr_at_five, ndcg_at_five,
+                mrr_at_ten, ndcg_at_ten)
+
+    @overrides
+    def get_predictions(self):
+        """
+        Get the expected ratings between users and items.
+
+        :returns: A matrix of users X documents
+        :rtype: ndarray
+        """
+        if self.predictions is not None:
+            return self.predictions
+        predictions = numpy.empty((self.n_users, self.n_items))
+        for start, end, predictions_block in self.iter_prediction_blocks():
+            predictions[start:end] = predictions_block
+        self.predictions = predictions
         return self.predictions
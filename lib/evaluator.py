@@ -26,6 +26,8 @@ class Evaluator(object):
         if abstracts_preprocessor:
             self.abstracts_preprocessor = abstracts_preprocessor
         self.random_seed = random_seed
+        # The generator of the splits and of the initializations after them, it is not shared between evaluators.
+        self.random_state = numpy.random.RandomState(42) if random_seed is False else numpy.random
         self._verbose = verbose
         self.k_folds = None
 
@@ -64,6 +66,25 @@ class Evaluator(object):
         self.k_folds = kfolds
         self.test_percentage = 1.0 / self.k_folds
 
+    def get_split_seed(self):
+        """
+        :returns: The seed of the splits of the data, None if the splits are random.
+        :rtype: int
+        """
+        if self.random_seed is False:
+            return 42
+        return None
+
+    def _get_random_state(self):
+        """
+        :returns: The random generator of a split. With a fixed seed, it is reseeded, and it is the evaluator's own
+            generator, so that the recommenders that train in parallel threads do not draw from the same generator.
+        :rtype: RandomState
+        """
+        if self.random_seed is False:
+            self.random_state.seed(42)
+        return self.random_state
+
     def naive_split(self, type='user'):
         """
         Split the data into training and testing sets.
@@ -82,14 +103,13 @@ class Evaluator(object):
         :returns: a tuple of train and test data.
         :rtype: tuple
         """
-        if self.random_seed is False:
-            numpy.random.seed(42)
+        random_state = self._get_random_state()
 
         test = numpy.zeros(self.ratings.shape)
         train = self.ratings.copy()
         for user in range(self.ratings.shape[0]):
             non_zeros = self.ratings[user, :].nonzero()[0]
-            test_ratings = numpy.random.choice(non_zeros,
+            test_ratings = random_state.choice(non_zeros,
                                                size=int(self.test_percentage * len(non_zeros)))
             train[user, test_ratings] = 0.
             test[user, test_ratings] = self.ratings[user, test_ratings]
@@ -104,11 +124,10 @@ class Evaluator(object):
         :returns: a tuple of train and test data.
         :rtype: tuple
         """
-        if self.random_seed is False:
-            numpy.random.seed(42)
+        random_state = self._get_random_state()
 
         indices = list(range(self.n_items))
-        test_ratings = numpy.random.choice(indices, size=int(self.test_percentage * len(indices)))
+        test_ratings = random_state.choice(indices, size=int(self.test_percentage * len(indices)))
         train = self.ratings.copy()
         test = numpy.zeros(self.ratings.shape)
         for index in test_ratings:
@@ -141,8 +160,7 @@ class Evaluator(object):
         :returns: a list of all indices of the training set and test set.
         :rtype: list of lists
         """
-        if self.random_seed is False:
-            numpy.random.seed(42)
+        random_state = self._get_random_state()
 
         test_indices = []
 
@@ -159,7 +177,7 @@ class Evaluator(object):
             non_rated_indices = item_indices[mask]
 
             # Shuffle all rated items indices
-            numpy.random.shuffle(rated_items_indices)
+            random_state.shuffle(rated_items_indices)
 
             # Size of 1/k of the total user's ratings
             size_of_test = round((1.0 / self.k_folds) * len(rated_items_indices))
@@ -168,7 +186,7 @@ class Evaluator(object):
             test_ratings = [[] for x in range(self.k_folds)]
 
             counter = 0
-            numpy.random.shuffle(non_rated_indices)
+            random_state.shuffle(non_rated_indices)
             # List that stores the number of indices to be added to each test set.
             num_to_add = []
 
@@ -222,17 +240,30 @@ class Evaluator(object):
         :rtype: int[][]
         """
         for user in range(self.ratings.shape[0]):
-            nonzeros = self.test_indices[(user * (1 + fold))]
-            top_recommendations = TopRecommendations(n_recommendations)
-            for index in nonzeros:
-                index = int(index)
-                top_recommendations.insert(index, predictions[user][index])
-            self.recommendation_indices[user] = list(reversed(top_recommendations.get_indices()))
-            top_recommendations = None
+            self.load_user_top_recommendations(user, n_recommendations, predictions[user], fold)
 
         self.recs_loaded = True
         return self.recommendation_indices
 
+    def load_user_top_recommendations(self, user, n_recommendations, user_predictions, fold):
+        """
+        This method loads the top n recommendations of one user.
+
+        :param int user: The index of the user.
+        :param int n_recommendations: number of recommendations to be generated.
+        :param float[] user_predictions: The predictions of the user.
+        :param int fold: The current fold.
+        :returns: The indices of the top recommendations of the user.
+        :rtype: list[int]
+        """
+        nonzeros = self.test_indices[(user * (1 + fold))]
+        top_recommendations = TopRecommendations(n_recommendations)
+        for index in nonzeros:
+            index = int(index)
+            top_recommendations.insert(index, user_predictions[index])
+        self.recommendation_indices[user] = list(reversed(top_recommendations.get_indices()))
+        return self.recommendation_indices[user]
+
     def get_rmse(self, predicted, actual=None):
         """
         The method given a prediction matrix returns the root mean squared error (rmse).
@@ -280,17 +311,29 @@ class Evaluator(object):
 
         recalls = []
         for user in range(ratings.shape[0]):
-            recommendation_hits = 0
-            user_likes = ratings[user].sum()
-            recall = 0
-            if user_likes != 0:
-                recommendation_hits = (self.ratings[user][self.recommendation_indices[user][:x]] *
-                                       rounded_predictions[user][self.recommendation_indices[user][:x]]).sum()
-
-                recall = recommendation_hits / (min(x, user_likes) * 1.0)
+            recall = self.get_user_recall_at_x(user, x, ratings[user], rounded_predictions[user])
+            if recall is not None:
                 recalls.append(recall)
         return numpy.mean(recalls, dtype=numpy.float16)
 
+    def get_user_recall_at_x(self, user, x, user_ratings, user_rounded_predictions):
+        """
+        The method calculates the recall of one user by only looking at the top x.
+
+        :param int user: The index of the user.
+        :param int x: number of recommendations to look at, sorted by relevance.
+        :param int[] user_ratings: The ratings of the user.
+        :param int[] user_rounded_predictions: The rounded predictions of the user.
+        :returns: Recall at x, None if the user has no ratings.
+        :rtype: float
+        """
+        user_likes = user_ratings.sum()
+        if user_likes == 0:
+            return None
+        recommendation_hits = (self.ratings[user][self.recommendation_indices[user][:x]] *
+                               user_rounded_predictions[self.recommendation_indices[user][:x]]).sum()
+        return recommendation_hits / (min(x, user_likes) * 1.0)
+
     def calculate_ndcg(self, n_recommendations, predictions, test_data, rounded_predictions):
         """
         The method calculates the normalized Discounted Cumulative Gain of all users
@@ -303,17 +346,32 @@ class Evaluator(object):
         """
         ndcgs = []
         for user in range(self.ratings.shape[0]):
-            dcg = 0
-            idcg = 0
-            for pos_index, index in enumerate(self.recommendation_indices[user]):
-                dcg += (self.ratings[user, index] * rounded_predictions[user][index]) / numpy.log2(pos_index + 2)
-                idcg += 1 / numpy.log2(pos_index + 2)
-                if pos_index + 1 == n_recommendations:
-                    break
-            if idcg != 0:
-                ndcgs.append(dcg / idcg)
+            ndcg = self.get_user_ndcg(user, n_recommendations, rounded_predictions[user])
+            if ndcg is not None:
+                ndcgs.append(ndcg)
         return numpy.mean(ndcgs, dtype=numpy.float16)
 
+    def get_user_ndcg(self, user, n_recommendations, user_rounded_predictions):
+        """
+        The method calculates the normalized Discounted Cumulative Gain of one user.
+
+        :param int user: The index of the user.
+        :param int n_recommendations: number of recommendations to look at, sorted by relevance.
+        :param int[] user_rounded_predictions: The rounded predictions of the user.
+        :returns: nDCG for n_recommendations, None if the user has no recommendations.
+        :rtype: float
+        """
+        dcg = 0
+        idcg = 0
+        for pos_index, index in enumerate(self.recommendation_indices[user]):
+            dcg += (self.ratings[user, index] * user_rounded_predictions[index]) / numpy.log2(pos_index + 2)
+            idcg += 1 / numpy.log2(pos_index + 2)
+            if pos_index + 1 == n_recommendations:
+                break
+        if idcg == 0:
+            return None
+        return dcg / idcg
+
     def calculate_mrr(self, n_recommendations, predictions, test_data, rounded_predictions):
         """
         The method calculates the mean reciprocal rank for all users
@@ -328,14 +386,24 @@ class Evaluator(object):
         mrr_list = []
 
         for user in range(self.ratings.shape[0]):
-            mrr = 0
-            for mrr_index, index in enumerate(self.recommendation_indices[user]):
-                score = self.ratings[user][index] * rounded_predictions[user][index]
-                if score == 1:
-                    mrr = score / (mrr_index + 1)
-                    break
-                if mrr_index + 1 == n_recommendations:
-                    break
-            mrr_list.append(mrr)
+            mrr_list.append(self.get_user_mrr(user, n_recommendations, rounded_predictions[user]))
 
         return numpy.mean(mrr_list, dtype=numpy.float16)
+
+    def get_user_mrr(self, user, n_recommendations, user_rounded_predictions):
+        """
+        The method calculates the reciprocal rank of one user.
+
+        :param int user: The index of the user.
+        :param int n_recommendations: number of recommendations to look at, sorted by relevance.
+        :param int[] user_rounded_predictions: The rounded predictions of the user.
+        :returns: The reciprocal rank of the first hit, 0 if there is none.
+        :rtype: float
+        """
+        for mrr_index, index in enumerate(self.recommendation_indices[user]):
+            score = self.ratings[user][index] * user_rounded_predictions[index]
+            if score == 1:
+                return score / (mrr_index + 1)
+            if mrr_index + 1 == n_recommendations:
+                break
+        return 0
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+A module that contains a small Gaussian process regressor, the surrogate model
+of the bayesian hyperparameter search.
+"""
+import numpy
+from scipy.linalg import cho_factor, cho_solve
+from scipy.stats import norm
+
+
+class GaussianProcess(object):
+    """
+    A Gaussian process regressor with a squared exponential kernel. The length scale is chosen
+    among candidates by the marginal likelihood of the observations.
+    """
+    def __init__(self, length_scales=(0.1, 0.2, 0.5, 1.0, 2.0), noise=1e-6):
+        """
+        Constructs a Gaussian process.
+
+        :param tuple length_scales: The candidate length scales of the kernel.
+        :param float noise: The variance of the noise of the observations, relative to their variance.
+        """
+        self.length_scales = length_scales
+        self.noise = noise
+        self.length_scale = None
+
+    def _kernel(self, X1, X2, length_scale):
+        """
+        :returns: The squared exponential kernel between the rows of X1 and X2.
+        :rtype: ndarray
+        """
+        distances = (numpy.sum(X1 ** 2, axis=1)[:, numpy.newaxis] + numpy.sum(X2 ** 2, axis=1)[numpy.newaxis, :] -
+                     2 * X1.dot(X2.T))
+        return numpy.exp(-0.5 * numpy.maximum(distances, 0) / length_scale ** 2)
+
+    def fit(self, X, y):
+        """
+        Fit the Gaussian process to observations.
+
+        :param ndarray X: A matrix of observations X features.
+        :param ndarray y: The observed values.
+        :returns: The fitted Gaussian process.
+        :rtype: GaussianProcess
+        """
+        self.X = numpy.asarray(X, dtype=numpy.float64)
+        y = numpy.asarray(y, dtype=numpy.float64)
+        self.y_mean = y.mean()
+        self.y_std = y.std() if y.std() > 0 else 1.0
+        self.y = (y - self.y_mean) / self.y_std
+        best_likelihood = -numpy.inf
+        for length_scale in self.length_scales:
+            K = self._kernel(self.X, self.X, length_scale) + numpy.eye(len(self.X)) * (self.noise + 1e-10)
+            factor = cho_factor(K, lower=True)
+            alpha = cho_solve(factor, self.y)
+            likelihood = -0.5 * self.y.dot(alpha) - numpy.sum(numpy.log(numpy.diag(factor[0])))
+            if likelihood > best_likelihood:
+                best_likelihood = likelihood
+                self.length_scale, self.factor, self.alpha = length_scale, factor, alpha
+        return self
+
+    def predict(self, X):
+        """
+        Predict the values of new points.
+
+        :param ndarray X: A matrix of points X features.
+        :returns: A pair of the means and the standard deviations of the predictions.
+        :rtype: tuple(ndarray, ndarray)
+        """
+        K_star = self._kernel(numpy.asarray(X, dtype=numpy.float64), self.X, self.length_scale)
+        mean = K_star.dot(self.alpha)
+        variance = 1.0 - numpy.sum(K_star * cho_solve(self.factor, K_star.T).T, axis=1)
+        std = numpy.sqrt(numpy.maximum(variance, 1e-12))
+        return mean * self.y_std + self.y_mean, std * self.y_std
+
+    def expected_improvement(self, X, best_value):
+        """
+        The expected improvement of new points over the best observed value, for a maximization.
+
+        :param ndarray X: A matrix of points X features.
+        :param float best_value: The best observed value.
+        :returns: The expected improvement of every point.
+        :rtype: ndarray
+        """
+        mean, std = self.predict(X)
+        z = (mean - best_value) / std
+        return (mean - best_value) * norm.cdf(z) + std * norm.pdf(z)
@@ -4,17 +4,49 @@ A module that provides functionalities for grid search
 will be used for hyperparameter optimization.
 """
 import csv
+import multiprocessing
+import numbers
 import numpy
 import os
 import itertools as it
 from lib.evaluator import Evaluator
+from util.experiment_planner import ExperimentPlanner
+
+# The grid search evaluated by the worker processes, they inherit it when they are forked.
+_worker_grid_search = None
+
+
+def _init_worker(n_threads):
+    """
+    Limit the BLAS threads of a worker process, so that the workers share the cores.
+
+    :param int n_threads: The number of BLAS threads of every worker.
+    """
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    # The limits are kept for the lifetime of the worker.
+    _init_worker.limits = threadpool_limits(limits=n_threads)
+
+
+def _evaluate_in_worker(hyperparameters):
+    """
+    Evaluate a combination of hyperparameters in a worker process.
+
+    :param dict hyperparameters: The hyperparameters.
+    :returns: The results of the evaluation.
+    :rtype: tuple
+    """
+    return _worker_grid_search._evaluate(hyperparameters)
 
 
 class GridSearch(object):
     """
     A class to perform grid search and find the best hyperparameters for a recommender.
     """
-    def __init__(self, recommender, hyperparameters, verbose=True, report_name='grid_search_results'):
+    def __init__(self, recommender, hyperparameters, verbose=True, report_name='grid_search_results', n_jobs=1,
+                 results_store=None):
         """
         Train number of recommenders using UV decomposition using different parameters.
 
@@ -22,6 +54,12 @@ class GridSearch(object):
         :param dict hyperparameters: A dictionary of the hyperparameters.
         :param boolean verbose: A flag to decide printing progress.
         :param str report_name: The name of the csv file in which the analysis of the grid search will be dumped.
+        :param int n_jobs:
+            The number of worker processes that evaluate the combinations, -1 uses all the cores. The workers
+            are forked, so they share the ratings and the abstracts of the recommender without copying them.
+        :param ResultsStore results_store:
+            A store of the results, the results of every combination are stored as soon as it is evaluated,
+            and the combinations that are already in the store are not evaluated again.
         """
         self.recommender = recommender
         self.hyperparameters = hyperparameters
@@ -29,6 +67,9 @@ class GridSearch(object):
         self.evaluator = Evaluator(recommender.get_ratings())
         self.all_errors = dict()
         self.results_file_name = report_name + '.csv'
+        self.n_jobs = ExperimentPlanner.get_n_jobs(n_jobs)
+        self.results_store = results_store
+        self.data_fingerprint = None
 
     def get_all_combinations(self):
         """
@@ -56,25 +97,14 @@ class GridSearch(object):
         """
         best_error = numpy.inf
         best_params = dict()
-        train, test = self.recommender.evaluator.naive_split(self.recommender._split_type)
-        predictions = None
+        self.test_data = self.recommender.evaluator.naive_split(self.recommender._split_type)[1]
         all_results = [['n_factors', '_lambda', 'rmse', 'train_recall', 'test_recall', 'recall_at_200', 'ratio',
                         'mrr @ 5', 'ndcg @ 5', 'mrr @ 10', 'ndcg @ 10']]
-        for hyperparameters in self.get_all_combinations():
-            if self._verbose:
-                print("Running config: %s" % hyperparameters)
-            self.recommender.set_hyperparameters(hyperparameters)
-            current_result = [hyperparameters['n_factors'], hyperparameters['_lambda']]
-            self.recommender.train()
-            current_result.extend(self.recommender.get_evaluation_report())
+        combinations = self.get_all_combinations()
+        # The results are gathered in the order of the combinations, whatever the number of workers.
+        for hyperparameters, (current_result, train_recall, test_recall) in zip(combinations,
+                                                                                self._evaluate_all(combinations)):
             all_results.append(current_result)
-            if predictions is None:
-                predictions = self.recommender.get_predictions()
-            rounded_predictions = self.recommender.rounded_predictions()
-            test_recall = self.evaluator.calculate_recall(test, rounded_predictions)
-            train_recall = self.evaluator.calculate_recall(self.recommender.get_ratings(), rounded_predictions)
-            if self._verbose:
-                print('Train error: %f, Test error: %f' % (train_recall, test_recall))
             if 1 - test_recall < best_error:
                 best_params = hyperparameters
                 best_error = 1 - test_recall
@@ -87,6 +117,342 @@ class GridSearch(object):
             print("Best config: %s" % best_params)
         return best_params, all_results
 
+    def train_successive_halving(self, min_iterations=1, reduction_factor=3):
+        """
+        An adaptive search, all the combinations are trained for min_iterations, then only the best
+        1 / reduction_factor of them by test recall are trained again for reduction_factor times more
+        iterations, until the n_iterations of the recommender are reached.
+
+        :param int min_iterations: The number of iterations of the first round.
+        :param int reduction_factor: The factor of the reduction of the combinations at every round.
+        :returns: Pair of best hyperparameters dictionary, and list of lists of metrics' results
+        :rtype: tuple(dict, float[][])
+        """
+        options = self.recommender.options.copy()
+        max_iterations = options['n_iterations']
+        self.test_data = self.recommender.evaluator.naive_split(self.recommender._split_type)[1]
+        all_results = [['n_factors', '_lambda', 'rmse', 'train_recall', 'test_recall', 'recall_at_200', 'ratio',
+                        'mrr @ 5', 'ndcg @ 5', 'mrr @ 10', 'ndcg @ 10', 'n_iterations']]
+        candidates = self.get_all_combinations()
+        n_iterations = min(min_iterations, max_iterations)
+        try:
+            while True:
+                if self._verbose:
+                    print("Training %d configs for %d iterations" % (len(candidates), n_iterations))
+                self.recommender.set_options(dict(options, n_iterations=n_iterations))
+                test_recalls = []
+                for hyperparameters, (current_result, train_recall, test_recall) in zip(
+                        candidates, self._evaluate_all(candidates)):
+                    all_results.append(current_result + [n_iterations])
+                    test_recalls.append(test_recall)
+                    current_key = self.get_key(dict(hyperparameters, n_iterations=n_iterations))
+                    self.all_errors[current_key] = dict()
+                    self.all_errors[current_key]['train_recall'] = train_recall
+                    self.all_errors[current_key]['test_recall'] = test_recall
+                # The first of the combinations with the best test recall wins ties, as in the exhaustive search.
+                ranking = sorted(range(len(candidates)), key=lambda index: -test_recalls[index])
+                if n_iterations >= max_iterations:
+                    break
+                n_survivors = max(1, len(candidates) // reduction_factor)
+                candidates = [candidates[index] for index in sorted(ranking[:n_survivors])]
+                if len(candidates) == 1:
+                    n_iterations = max_iterations
+                else:
+                    n_iterations = min(max_iterations, n_iterations * reduction_factor)
+        finally:
+            self.recommender.set_options(options)
+        best_params = candidates[ranking[0]]
+        self.dump_csv(all_results)
+        if self._verbose:
+            print("Best config: %s" % best_params)
+        return best_params, all_results
+
+    def train_warm_start(self, tolerance=1e-3, compare_cold_start=False):
+        """
+        A sweep of the combinations, ordered by increasing n_factors and decreasing _lambda. The collaborative
+        filtering of every combination starts from the closest combination that was already trained, and is
+        trained until the error improves by less than tolerance.
+
+        :param float tolerance: The relative improvement of the error under which the training stops.
+        :param boolean compare_cold_start:
+            A flag for also training every combination from random vectors, to report the number of epochs.
+        :returns: Pair of best hyperparameters dictionary, and list of lists of metrics' results
+        :rtype: tuple(dict, float[][])
+        """
+        collaborative_filtering = getattr(self.recommender, 'collaborative_filtering', self.recommender)
+        convergence_tolerance = collaborative_filtering._convergence_tolerance
+        best_error = numpy.inf
+        best_params = dict()
+        self.test_data = self.recommender.evaluator.naive_split(self.recommender._split_type)[1]
+        all_results = [['n_factors', '_lambda', 'rmse', 'train_recall', 'test_recall', 'recall_at_200', 'ratio',
+                        'mrr @ 5', 'ndcg @ 5', 'mrr @ 10', 'ndcg @ 10', 'warm_start', 'epochs', 'cold_start_epochs']]
+        combinations = sorted(self.get_all_combinations(),
+                              key=lambda hyperparameters: (hyperparameters['n_factors'], -hyperparameters['_lambda']))
+        trained = []
+        warm_epochs, cold_epochs = 0, 0
+        try:
+            collaborative_filtering._convergence_tolerance = tolerance
+            for hyperparameters in combinations:
+                cold_start_epochs = None
+                if compare_cold_start:
+                    collaborative_filtering.set_warm_start(None)
+                    self._evaluate(hyperparameters)
+                    cold_start_epochs = collaborative_filtering.n_epochs
+                    cold_epochs += cold_start_epochs
+                closest = self.get_closest_combination(hyperparameters, [config for config, _ in trained])
+                warm_start = ''
+                if closest is not None:
+                    warm_start = self.get_key(trained[closest][0])
+                    collaborative_filtering.set_warm_start(trained[closest][1])
+                else:
+                    collaborative_filtering.set_warm_start(None)
+                current_result, train_recall, test_recall = self._evaluate(hyperparameters)
+                trained.append((hyperparameters, collaborative_filtering.fold_vecs))
+                warm_epochs += collaborative_filtering.n_epochs
+                all_results.append(current_result + [warm_start, collaborative_filtering.n_epochs, cold_start_epochs])
+                if 1 - test_recall < best_error:
+                    best_params = hyperparameters
+                    best_error = 1 - test_recall
+                current_key = self.get_key(hyperparameters)
+                self.all_errors[current_key] = dict()
+                self.all_errors[current_key]['train_recall'] = train_recall
+                self.all_errors[current_key]['test_recall'] = test_recall
+        finally:
+            collaborative_filtering.set_warm_start(None)
+            collaborative_filtering._convergence_tolerance = convergence_tolerance
+        self.dump_csv(all_results)
+        if self._verbose:
+            if compare_cold_start:
+                print("Warm starts trained %d epochs, cold starts %d epochs" % (warm_epochs, cold_epochs))
+            print("Best config: %s" % best_params)
+        return best_params, all_results
+
+    def train_bayesian(self, n_trials=10, n_initial=3, batch_size=1, random_state=None):
+        """
+        A sequential model-based search over the combinations. After n_initial random combinations, a Gaussian
+        process of the test recall suggests the combinations of the highest expected improvement. The suggestions
+        are made in batches of batch_size, that are evaluated in parallel if there are several jobs.
+
+        :param int n_trials: The number of combinations to evaluate.
+        :param int n_initial: The number of random combinations evaluated before the first suggestion.
+        :param int batch_size: The number of combinations suggested at once.
+        :param RandomState random_state: The random generator of the initial combinations, numpy's global one if None.
+        :returns: Pair of best hyperparameters dictionary, and list of lists of metrics' results
+        :rtype: tuple(dict, float[][])
+        """
+        random_state = random_state if random_state is not None else numpy.random
+        best_error = numpy.inf
+        best_params = dict()
+        self.test_data = self.recommender.evaluator.naive_split(self.recommender._split_type)[1]
+        all_results = [['n_factors', '_lambda', 'rmse', 'train_recall', 'test_recall', 'recall_at_200', 'ratio',
+                        'mrr @ 5', 'ndcg @ 5', 'mrr @ 10', 'ndcg @ 10']]
+        combinations = self.get_all_combinations()
+        features = self.get_combination_features(combinations)
+        n_trials = min(n_trials, len(combinations))
+        evaluated, test_recalls = [], []
+        while len(evaluated) < n_trials:
+            n_batch = min(batch_size, n_trials - len(evaluated))
+            remaining = [index for index in range(len(combinations)) if index not in evaluated]
+            if len(evaluated) < max(n_initial, 1):
+                n_batch = min(n_batch, max(n_initial, 1) - len(evaluated))
+                batch = [int(index) for index in random_state.choice(remaining, size=n_batch, replace=False)]
+            else:
+                batch = self.suggest_combinations(features, evaluated, test_recalls, remaining, n_batch)
+            for index, (current_result, train_recall, test_recall) in zip(
+                    batch, self._evaluate_all([combinations[index] for index in batch])):
+                evaluated.append(index)
+                test_recalls.append(test_recall)
+                all_results.append(current_result)
+                if 1 - test_recall < best_error:
+                    best_params = combinations[index]
+                    best_error = 1 - test_recall
+                current_key = self.get_key(combinations[index])
+                self.all_errors[current_key] = dict()
+                self.all_errors[current_key]['train_recall'] = train_recall
+                self.all_errors[current_key]['test_recall'] = test_recall
+        self.dump_csv(all_results)
+        if self._verbose:
+            print("Best config: %s, after %d of %d configs" % (best_params, len(evaluated), len(combinations)))
+        return best_params, all_results
+
+    @staticmethod
+    def suggest_combinations(features, evaluated, test_recalls, remaining, n_suggestions):
+        """
+        Suggest the combinations of the highest expected improvement of the test recall. For a batch of
+        suggestions, every suggestion is assumed to have the worst observed test recall until it is evaluated,
+        so that the next suggestions are made elsewhere.
+
+        :param ndarray features: The features of all the combinations.
+        :param list[int] evaluated: The indices of the evaluated combinations.
+        :param list[float] test_recalls: The test recalls of the evaluated combinations.
+        :param list[int] remaining: The indices of the combinations that can be suggested.
+        :param int n_suggestions: The number of suggestions.
+        :returns: The indices of the suggested combinations.
+        :rtype: list[int]
+        """
+        # scipy.stats is only imported by the bayesian search, the other searches start faster.
+        from lib.gaussian_process import GaussianProcess
+        suggestions = []
+        liar = min(test_recalls)
+        for _ in range(min(n_suggestions, len(remaining))):
+            observed = list(evaluated) + suggestions
+            surrogate = GaussianProcess().fit(features[observed], list(test_recalls) + [liar] * len(suggestions))
+            candidates = [index for index in remaining if index not in suggestions]
+            improvement = surrogate.expected_improvement(features[candidates], max(test_recalls))
+            suggestions.append(candidates[int(numpy.argmax(improvement))])
+        return suggestions
+
+    def get_combination_features(self, combinations):
+        """
+        Encode the combinations as vectors in [0, 1]. A numeric hyperparameter is encoded by the rank of its
+        value, so that a grid of _lambda on a log scale is evenly spaced. Other hyperparameters, like the name
+        of a content model, are one-hot encoded.
+
+        :param list[dict] combinations: The combinations of hyperparameters.
+        :returns: A matrix of combinations X features.
+        :rtype: ndarray
+        """
+        columns = []
+        for name in sorted(self.hyperparameters):
+            values = self.hyperparameters[name]
+            if all(isinstance(value, numbers.Real) and not isinstance(value, bool) for value in values):
+                ordered = sorted(set(values))
+                scale = float(max(1, len(ordered) - 1))
+                columns.append([[ordered.index(config[name]) / scale] for config in combinations])
+            else:
+                distinct = []
+                for value in values:
+                    if value not in distinct:
+                        distinct.append(value)
+                columns.append([[float(config[name] == value) for value in distinct] for config in combinations])
+        return numpy.hstack([numpy.array(column, dtype=numpy.float64) for column in columns])
+
+    @staticmethod
+    def get_closest_combination(hyperparameters, combinations):
+        """
+        Find the combination with the closest n_factors, then the closest _lambda on a log scale.
+
+        :param dict hyperparameters: The hyperparameters.
+        :param list[dict] combinations: The combinations to choose from.
+        :returns: The index of the closest combination, None if there are no combinations.
+        :rtype: int
+        """
+        if not combinations:
+            return None
+
+        def log_lambda(config):
+            return numpy.log10(max(config['_lambda'], 1e-12))
+        distances = [(abs(config['n_factors'] - hyperparameters['n_factors']),
+                      abs(log_lambda(config) - log_lambda(hyperparameters))) for config in combinations]
+        return distances.index(min(distances))
+
+    def _evaluate_all(self, combinations):
+        """
+        Evaluate combinations of hyperparameters, in parallel if there are several jobs. The combinations
+        that are in the results store are not evaluated again.
+
+        :param list[dict] combinations: The combinations of hyperparameters.
+        :returns: The results of the evaluations, in the order of the combinations.
+        :rtype: list[tuple]
+        """
+        evaluations = [None] * len(combinations)
+        keys = [self.get_store_key(hyperparameters) for hyperparameters in combinations]
+        # The results of random splits are stored, but they can not be reused.
+        reuse_results = self.results_store is not None and self.recommender.evaluator.get_split_seed() is not None
+        pending = []
+        for index, key in enumerate(keys):
+            stored = self.results_store.get(key) if reuse_results else None
+            if stored is None:
+                pending.append(index)
+                continue
+            if self._verbose:
+                print("Skipping config: %s, found in the results store" % combinations[index])
+            evaluations[index] = (stored['results'], stored['train_recall'], stored['test_recall'])
+        pending_combinations = [combinations[index] for index in pending]
+        if self.n_jobs > 1 and len(pending) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            pending_evaluations = self._evaluate_parallel(pending_combinations)
+        else:
+            pending_evaluations = map(self._evaluate, pending_combinations)
+        for index, evaluation in zip(pending, pending_evaluations):
+            evaluations[index] = evaluation
+            if self.results_store is not None:
+                current_result, train_recall, test_recall = evaluation
+                results = {'results': current_result, 'train_recall': train_recall, 'test_recall': test_recall}
+                self.results_store.add(keys[index], results, self.get_store_config(combinations[index]))
+        return evaluations
+
+    def get_store_config(self, hyperparameters):
+        """
+        :param dict hyperparameters: The hyperparameters.
+        :returns: The configuration of a run of the grid search, as it is identified in the results store.
+        :rtype: dict
+        """
+        config = {'recommender': str(self.recommender), 'hyperparameters': hyperparameters,
+                  'options': self.recommender.options, 'results_file_name': self.results_file_name}
+        if hasattr(self.recommender, 'config'):
+            config['config'] = self.recommender.config.get_all_config()
+        return config
+
+    def get_store_key(self, hyperparameters):
+        """
+        :param dict hyperparameters: The hyperparameters.
+        :returns: The key of the run in the results store, None if there is no store.
+        :rtype: str
+        """
+        if self.results_store is None:
+            return None
+        if self.data_fingerprint is None:
+            self.data_fingerprint = self.results_store.get_data_fingerprint(
+                self.recommender.get_ratings(), getattr(self.recommender, 'abstracts_preprocessor', None))
+        return self.results_store.get_key(self.get_store_config(hyperparameters), self.data_fingerprint,
+                                          self.recommender.evaluator.get_split_seed())
+
+    def _evaluate(self, hyperparameters):
+        """
+        Train the recommender with a combination of hyperparameters, and evaluate it.
+
+        :param dict hyperparameters: The hyperparameters.
+        :returns: A tuple of the row of the results, the train recall and the test recall.
+        :rtype: tuple
+        """
+        if self._verbose:
+            print("Running config: %s" % hyperparameters)
+        self.recommender.set_hyperparameters(hyperparameters)
+        current_result = [hyperparameters['n_factors'], hyperparameters['_lambda']]
+        self.recommender.train()
+        current_result.extend(self.recommender.get_evaluation_report())
+        rounded_predictions = self.recommender.rounded_predictions()
+        test_recall = self.evaluator.calculate_recall(self.test_data, rounded_predictions)
+        train_recall = self.evaluator.calculate_recall(self.recommender.get_ratings(), rounded_predictions)
+        if self._verbose:
+            print('Train error: %f, Test error: %f' % (train_recall, test_recall))
+        return current_result, train_recall, test_recall
+
+    def _evaluate_parallel(self, combinations):
+        """
+        Evaluate the combinations of hyperparameters in forked worker processes.
+
+        :param list[dict] combinations: The combinations of hyperparameters.
+        :returns: The results of the evaluations, in the order of the combinations, as they are done.
+        :rtype: generator
+        """
+        global _worker_grid_search
+        n_workers = min(self.n_jobs, len(combinations))
+        n_threads = max(1, multiprocessing.cpu_count() // n_workers)
+        if self._verbose:
+            print("Evaluating %d configs with %d workers of %d threads" % (len(combinations), n_workers, n_threads))
+        _worker_grid_search = self
+        try:
+            pool = multiprocessing.get_context('fork').Pool(n_workers, _init_worker, (n_threads,))
+            try:
+                for evaluation in pool.imap(_evaluate_in_worker, combinations, chunksize=1):
+                    yield evaluation
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            _worker_grid_search = None
+
     def get_key(self, config):
         """
         Given a dict (config) the function generates a key that uniquely represents
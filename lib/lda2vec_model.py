@@ -33,6 +33,7 @@ class LDA2Vec(Chain):
         self.dropout_ratio = dropout_ratio
         self.word_dropout_ratio = word_dropout_ratio
         self.n_samples = n_samples
+        self._window_buffers = None
 
     def prior(self):
         dl1 = dirichlet_likelihood(self.mixture.weights)
@@ -48,7 +49,8 @@ class LDA2Vec(Chain):
         doc_at_pivot = rdoc_ids[window: -window]
         doc = self.mixture(next(move(self.xp, doc_at_pivot)),
                            update_only_docs=update_only_docs)
-        loss = 0.0
+        # The mean loss of the context offsets is returned
+        total_loss = 0.0
         start, end = window, rword_indices.shape[0] - window
         context = (F.dropout(doc, self.dropout_ratio) +
                    F.dropout(pivot, self.dropout_ratio))
@@ -70,7 +72,53 @@ class LDA2Vec(Chain):
             target, = move(self.xp, targetidx)
             loss = self.sampler(context, target)
             loss.backward()
+            total_loss += loss.data
             if update_only_docs:
                 # Wipe out any gradient accumulation on word vectors
                 self.sampler.W.grad *= 0.0
-        return loss.data
+        return total_loss / (2 * window)
+
+    def fit_partial_batched(self, rdoc_ids, rword_indices, window=5,
+                            update_only_docs=False):
+        # Same gradients as fit_partial, but all the context offsets are
+        # stacked into one target array, so there is one sampler call and
+        # one backward per batch instead of one per offset. The returned
+        # loss is the mean loss of the offsets, like in fit_partial.
+        n_pivots = rword_indices.shape[0] - 2 * window
+        frames = np.array([frame for frame in range(-window, window + 1)
+                           if frame != 0])
+        # The index buffers are reused while the batch size does not change
+        if (self._window_buffers is None or
+                self._window_buffers[0].shape != (len(frames), n_pivots)):
+            positions = (window + frames[:, None] +
+                         np.arange(n_pivots)[None, :])
+            self._window_buffers = (positions,
+                                    np.empty(positions.shape, 'int32'),
+                                    np.empty(positions.shape, 'bool'))
+        positions, targetidx, weight = self._window_buffers
+        doc_at_pivot = rdoc_ids[window: -window]
+        np.equal(rdoc_ids[positions], doc_at_pivot[None, :], out=weight)
+        if self.word_dropout_ratio > 0.0:
+            rand = np.random.uniform(0, 1, weight.shape)
+            weight &= rand > self.word_dropout_ratio
+        targetidx[...] = rword_indices[positions]
+        # Targets in other documents or dropped are ignored
+        targetidx[~weight] = -1
+
+        pivot_idx = next(move(self.xp, rword_indices[window: -window]))
+        pivot = F.embed_id(pivot_idx, self.sampler.W)
+        if update_only_docs:
+            pivot.unchain_backward()
+        doc = self.mixture(next(move(self.xp, doc_at_pivot)),
+                           update_only_docs=update_only_docs)
+        context = (F.dropout(doc, self.dropout_ratio) +
+                   F.dropout(pivot, self.dropout_ratio))
+        # The rows of the contexts are ordered like the flattened targets
+        contexts = F.concat([context] * len(frames), axis=0)
+        target, = move(self.xp, targetidx.ravel())
+        loss = self.sampler(contexts, target)
+        loss.backward()
+        if update_only_docs:
+            # Wipe out any gradient accumulation on word vectors
+            self.sampler.W.grad *= 0.0
+        return loss.data / len(frames)
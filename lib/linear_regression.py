@@ -4,14 +4,13 @@ Module that trains a linear regression model to combine
 content based and collaborative recommenders.
 """
 import numpy
-from sklearn import linear_model
 
 
 class LinearRegression(object):
     """
-    Linear regression to combine the results of two matrices.
+    Linear regression to combine the results of two (or three) matrices.
     """
-    def __init__(self, train_labels, test_labels, item_based_ratings, collaborative_ratings):
+    def __init__(self, train_labels, test_labels, item_based_ratings, collaborative_ratings, graph_ratings=None):
         """
         Apply linear regression between two different methods to predict final collaborative_ratings
 
@@ -19,6 +18,7 @@ class LinearRegression(object):
         :param ndarray test_labels: Test data.
         :param ndarray item_based_ratings: Ratings produced by item based recommender.
         :param ndarray collaborative_ratings: Ratings produced by collaborative recommender
+        :param ndarray graph_ratings: Optional ratings produced by the citation graph recommender.
         """
         self.item_based_ratings = item_based_ratings
         self.collaborative_ratings = collaborative_ratings
@@ -26,10 +26,14 @@ class LinearRegression(object):
         self.collaborative_ratings_shape = collaborative_ratings.shape
         self.flat_train_labels = self.flatten_matrix(train_labels)
         self.flat_test_labels = self.flatten_matrix(test_labels)
-        self.train_data = numpy.vstack((self.flatten_matrix(item_based_ratings),
-                                        self.flatten_matrix(collaborative_ratings))).T
+        self.graph_ratings = graph_ratings
+        features = [self.flatten_matrix(item_based_ratings), self.flatten_matrix(collaborative_ratings)]
+        if graph_ratings is not None:
+            features.append(self.flatten_matrix(graph_ratings))
+        self.train_data = numpy.vstack(features).T
         self.regression_coef1 = 0
         self.regression_coef2 = 0
+        self.regression_coef3 = 0
 
     def flatten_matrix(self, matrix):
         """
@@ -60,10 +64,16 @@ class LinearRegression(object):
         :returns: adjusted predictions matrix.
         :rtype: ndarray
         """
+        # sklearn is only imported by the hybrid recommenders, the other recommenders start faster.
+        from sklearn import linear_model
         regr_model = linear_model.LinearRegression()
         regr_model.fit(self.train_data, self.flat_train_labels)
         weighted_item_based_ratings = regr_model.coef_[0] * self.item_based_ratings
         weighted_collaborative_ratings = regr_model.coef_[1] * self.collaborative_ratings
         self.regression_coef1 = regr_model.coef_[0]
         self.regression_coef2 = regr_model.coef_[1]
+        if self.graph_ratings is not None:
+            self.regression_coef3 = regr_model.coef_[2]
+            return weighted_collaborative_ratings + weighted_item_based_ratings + \
+                self.regression_coef3 * self.graph_ratings
         return weighted_collaborative_ratings + weighted_item_based_ratings
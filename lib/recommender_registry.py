@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+A module that contains the registry of the recommenders, their modules are imported when a
+configuration selects them, so that the heavy frameworks of some of them are only imported if needed.
+"""
+import importlib
+
+
+class RecommenderRegistry(object):
+    """
+    A registry of the classes of the content-based recommenders and the collaborative filtering, by the
+    names used in the configurations. A class is imported the first time it is requested.
+    """
+    # The module and the class of every content-based recommender.
+    CONTENT_BASED = {'None': ('lib.content_based', 'ContentBased'),
+                     'LDA': ('lib.LDA', 'LDARecommender'),
+                     'LDA2Vec': ('lib.LDA2Vec', 'LDA2VecRecommender'),
+                     'TFIDF': ('lib.TFIDF', 'TFIDFRecommender'),
+                     'CitationGraph': ('lib.citation_graph', 'CitationGraphRecommender')}
+    # The module and the class of every collaborative filtering.
+    COLLABORATIVE_FILTERING = {'ALS': ('lib.collaborative_filtering', 'CollaborativeFiltering'),
+                               'SDAE': ('lib.SDAE', 'SDAERecommender')}
+    # The frameworks that the modules need, besides numpy, scipy and sklearn.
+    BACKENDS = {'lib.LDA2Vec': 'chainer and lda2vec', 'lib.SDAE': 'keras and tensorflow'}
+
+    @staticmethod
+    def get_content_based(name):
+        """
+        :param str name: The name of the content-based recommender in the configuration.
+        :returns: The class of the content-based recommender.
+        :rtype: type
+        """
+        if name not in RecommenderRegistry.CONTENT_BASED:
+            raise NameError("Not a valid content based %s. Options are %s" %
+                            (name, ', '.join("'%s'" % option for option in RecommenderRegistry.CONTENT_BASED)))
+        return RecommenderRegistry.load(*RecommenderRegistry.CONTENT_BASED[name])
+
+    @staticmethod
+    def get_collaborative_filtering(name):
+        """
+        :param str name: The name of the collaborative filtering in the configuration.
+        :returns: The class of the collaborative filtering.
+        :rtype: type
+        """
+        if name not in RecommenderRegistry.COLLABORATIVE_FILTERING:
+            raise NameError("Not a valid collaborative filtering %s. Options are %s" %
+                            (name, ', '.join("'%s'" % option
+                                             for option in RecommenderRegistry.COLLABORATIVE_FILTERING)))
+        return RecommenderRegistry.load(*RecommenderRegistry.COLLABORATIVE_FILTERING[name])
+
+    @staticmethod
+    def load(module_name, class_name):
+        """
+        Import a class, the module is only imported once by python.
+
+        :param str module_name: The name of the module.
+        :param str class_name: The name of the class.
+        :returns: The class.
+        :rtype: type
+        """
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as e:
+            if module_name not in RecommenderRegistry.BACKENDS:
+                raise
+            raise ImportError("%s needs %s, which can not be imported: %s" %
+                              (class_name, RecommenderRegistry.BACKENDS[module_name], e)) from e
+        return getattr(module, class_name)
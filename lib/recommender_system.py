@@ -2,15 +2,14 @@
 """
 This is a module that contains the main class and functionalities of the recommender systems.
 """
+import time
 import numpy
 from overrides import overrides
 from lib.abstract_recommender import AbstractRecommender
-from lib.collaborative_filtering import CollaborativeFiltering
+from lib.citation_graph import CitationGraphRecommender
 from lib.content_based import ContentBased
 from lib.evaluator import Evaluator
-from lib.LDA import LDARecommender
-from lib.LDA2Vec import LDA2VecRecommender
-from lib.SDAE import SDAERecommender
+from lib.recommender_registry import RecommenderRegistry
 from util.abstracts_preprocessor import AbstractsPreprocessor
 from util.data_parser import DataParser
 from util.recommender_configuer import RecommenderConfiguration
@@ -24,7 +23,7 @@ class RecommenderSystem(AbstractRecommender):
     """
     def __init__(self, initializer=None, abstracts_preprocessor=None, ratings=None, config=None,
                  process_parser=False, verbose=False, load_matrices=True, dump_matrices=True, train_more=True,
-                 random_seed=False, results_file_name='top_recommendations'):
+                 random_seed=False, results_file_name='top_recommendations', citations=None, component_cache=None):
         """
         Constructor of the RecommenderSystem.
 
@@ -37,6 +36,9 @@ class RecommenderSystem(AbstractRecommender):
         :param boolean train_more: train_more the collaborative filtering after loading matrices.
         :param boolean random_seed: A flag to determine if we will use random seed or not.
         :param str results_file_name: Top recommendations results' file name
+        :param list[pair] citations: List of (article_id, cited_article_id), if None then queried when needed.
+        :param ComponentCache component_cache:
+            A cache of the trained components, shared by the recommender systems of an experiment.
         """
         if process_parser:
             DataParser.process()
@@ -68,44 +70,79 @@ class RecommenderSystem(AbstractRecommender):
         self.set_options(self.config.get_options())
 
         self.initializer = ModelInitializer(self.hyperparameters.copy(), self.n_iter, self._verbose)
+        self.collaborative_initializer = self.initializer
+        data_fingerprint = None
+        if component_cache is not None:
+            data_fingerprint = component_cache.get_data_fingerprint(self.ratings, self.abstracts_preprocessor)
+            content_namespace = (data_fingerprint, str(sorted(self.options.items())))
+            self.initializer.set_component_cache(component_cache, content_namespace,
+                                                 self._load_matrices, self._dump_matrices)
+        self.select_vocabulary()
 
         if self.config.get_error_metric() == 'RMS':
             self.evaluator = Evaluator(self.ratings, self.abstracts_preprocessor, self._random_seed, self._verbose)
         else:
             raise NameError("Not a valid error metric %s. Only option is 'RMS'" % self.config.get_error_metric())
 
-        # Initialize content based.
-        if self.config.get_content_based() == 'None':
-            self.content_based = ContentBased(self.initializer, self.evaluator, self.hyperparameters, self.options,
-                                              self._verbose, self._load_matrices, self._dump_matrices)
-        elif self.config.get_content_based() == 'LDA':
-            self.content_based = LDARecommender(self.initializer, self.evaluator, self.hyperparameters, self.options,
-                                                self._verbose, self._load_matrices, self._dump_matrices)
-        elif self.config.get_content_based() == 'LDA2Vec':
-            self.content_based = LDA2VecRecommender(self.initializer, self.evaluator, self.hyperparameters,
-                                                    self.options, self._verbose,
-                                                    self._load_matrices, self._dump_matrices)
+        collaborative_load_matrices, collaborative_dump_matrices = self._load_matrices, self._dump_matrices
+        if component_cache is not None:
+            # The factors depend on the splits, the options and the content model they are initialized with.
+            # The factors of random splits would never be loaded again, they are not cached.
+            split_seed = self.evaluator.get_split_seed()
+            self.collaborative_initializer = ModelInitializer(self.hyperparameters.copy(), self.n_iter, self._verbose)
+            if split_seed is not None:
+                self.collaborative_initializer.set_component_cache(
+                    component_cache, (data_fingerprint, split_seed, str(sorted(self.options.items())),
+                                      self.config.get_content_based(), self.config.get_recommender()),
+                    self._load_matrices, self._dump_matrices)
+                # The cached factors are loaded by the loading branch of the collaborative filtering, the factors
+                # that are not found start from the same content item vectors as in the training without loading.
+                collaborative_load_matrices, collaborative_dump_matrices = True, True
+            # The components load and save through the cache, which loads and saves the files according to the flags.
+            self._load_matrices = True
+            self._dump_matrices = True
+
+        # Initialize content based, its module is only imported if it is selected.
+        content_based_class = RecommenderRegistry.get_content_based(self.config.get_content_based())
+        if self.config.get_content_based() == 'CitationGraph':
+            self.content_based = content_based_class(self.initializer, self.evaluator, self.hyperparameters,
+                                                     self.options, self._verbose, self._load_matrices,
+                                                     self._dump_matrices, citations)
         else:
-            raise NameError("Not a valid content based %s. Options are 'None', "
-                            "'LDA', 'LDA2Vec'" % self.config.get_content_based())
+            self.content_based = content_based_class(self.initializer, self.evaluator, self.hyperparameters,
+                                                     self.options, self._verbose, self._load_matrices,
+                                                     self._dump_matrices)
 
         # Initialize collaborative filtering.
         if self.config.get_collaborative_filtering() == 'ALS':
             is_hybrid = self.config.get_recommender() == 'hybrid'
             if self.config.get_content_based() == 'None':
                 raise NameError("Not valid content based 'None' with hybrid recommender")
-            self.collaborative_filtering = CollaborativeFiltering(self.initializer, self.evaluator,
-                                                                  self.hyperparameters, self.options,
-                                                                  self._verbose, self._load_matrices,
-                                                                  self._dump_matrices, self._train_more,
-                                                                  is_hybrid)
+            collaborative_filtering_class = RecommenderRegistry.get_collaborative_filtering('ALS')
+            self.collaborative_filtering = collaborative_filtering_class(self.collaborative_initializer,
+                                                                         self.evaluator, self.hyperparameters,
+                                                                         self.options, self._verbose,
+                                                                         collaborative_load_matrices,
+                                                                         collaborative_dump_matrices,
+                                                                         self._train_more, is_hybrid)
+            if is_hybrid and self.options.get('use_citations', False):
+                if isinstance(self.content_based, CitationGraphRecommender):
+                    graph_recommender = self.content_based
+                else:
+                    graph_recommender = CitationGraphRecommender(self.initializer, self.evaluator,
+                                                                 self.hyperparameters, self.options, self._verbose,
+                                                                 self._load_matrices, self._dump_matrices, citations)
+                self.collaborative_filtering.set_graph_recommender(graph_recommender)
         elif self.config.get_collaborative_filtering() == 'SDAE':
-            self.collaborative_filtering = SDAERecommender(self.initializer, self.evaluator, self.hyperparameters,
-                                                           self.options, self._verbose, self._load_matrices,
-                                                           self._dump_matrices)
             if not self.config.get_content_based() == 'None':
                 raise NameError("Not a valid content based %s with SDAE. You can only use 'None'"
                                 % self.config.get_content_based())
+            collaborative_filtering_class = RecommenderRegistry.get_collaborative_filtering('SDAE')
+            self.collaborative_filtering = collaborative_filtering_class(self.collaborative_initializer,
+                                                                         self.evaluator, self.hyperparameters,
+                                                                         self.options, self._verbose,
+                                                                         collaborative_load_matrices,
+                                                                         collaborative_dump_matrices)
         elif self.config.get_collaborative_filtering() == 'None':
             if not self.config.get_recommender() == 'itembased':
                 raise NameError("None collaborative filtering is only valid with itembased recommender type")
@@ -127,6 +164,25 @@ class RecommenderSystem(AbstractRecommender):
             raise NameError("Invalid recommender type %s. "
                             "Only options are 'userbased','itembased', and 'hybrid'" % self.config.get_recommender())
 
+    def select_vocabulary(self):
+        """
+        Prune and hash the vocabulary of the abstracts according to the options min_df, max_df,
+        max_features and hashed_features, and save the mapping of the selected vocabulary.
+        """
+        n_vocab = self.abstracts_preprocessor.get_num_vocab()
+        self.abstracts_preprocessor = self.abstracts_preprocessor.select_vocabulary(
+            self.options.get('min_df'), self.options.get('max_df'), self.options.get('max_features'),
+            self.options.get('hashed_features'))
+        vocabulary_mapping = self.abstracts_preprocessor.get_vocabulary_mapping()
+        if vocabulary_mapping is None:
+            return
+        if self._verbose:
+            print("Vocabulary was reduced from %d to %d words" %
+                  (n_vocab, self.abstracts_preprocessor.get_num_vocab()))
+        if self._dump_matrices:
+            self.initializer.save_matrix(vocabulary_mapping.reshape((-1, 1)),
+                                         'vocabulary_mapping' + self.abstracts_preprocessor.get_vocabulary_key())
+
     @overrides
     def set_options(self, options):
         """
@@ -136,6 +192,10 @@ class RecommenderSystem(AbstractRecommender):
         """
         self.n_iter = options['n_iterations']
         self.options = options.copy()
+        if hasattr(self, 'collaborative_filtering') and self.collaborative_filtering is not None:
+            self.collaborative_filtering.set_options(options)
+        if hasattr(self, 'content_based') and self.content_based is not None:
+            self.content_based.set_options(options)
 
     @overrides
     def get_evaluation_report(self):
@@ -173,7 +233,11 @@ class RecommenderSystem(AbstractRecommender):
             print("Training content-based %s..." % self.content_based)
         content_based_error = numpy.inf
         if self.content_based.__class__ != ContentBased:
+            t0 = time.time()
             content_based_error = self.content_based.train()
+            if self._verbose:
+                print("Content-based %s took %.3fs with a vocabulary of %d words" %
+                      (self.content_based, time.time() - t0, self.abstracts_preprocessor.get_num_vocab()))
             self.content_based.get_predictions()
             # Optimize unused memory
             if not self.recommender == self.content_based:
@@ -2,6 +2,10 @@
 """
 A module to run different recommenders.
 """
+import copy
+import csv
+import functools
+import os
 import sys
 import itertools
 import numpy
@@ -10,24 +14,37 @@ from optparse import OptionParser
 from lib.evaluator import Evaluator
 from lib.collaborative_filtering import CollaborativeFiltering
 from lib.grid_search import GridSearch
-from lib.LDA import LDARecommender
-from lib.LDA2Vec import LDA2VecRecommender
-from lib.SDAE import SDAERecommender
 from lib.random_recommender import RandomRecommender
+from lib.recommender_registry import RecommenderRegistry
 from lib.recommender_system import RecommenderSystem
 from util.abstracts_preprocessor import AbstractsPreprocessor
+from util.component_cache import ComponentCache
 from util.data_parser import DataParser
+from util.experiment_planner import ExperimentPlanner
 from util.recommender_configuer import RecommenderConfiguration
 from util.model_initializer import ModelInitializer
+from util.recommender_daemon import RecommenderClient, RecommenderDaemon
+from util.results_store import ResultsStore
 from util.runs_loader import RunsLoader
+from util.work_queue import WorkQueue
 
 
 class RunnableRecommenders(object):
     """
     A class that is used to run recommenders.
     """
+    # The methods that run the commands of the command line, and of the jobs of the daemon.
+    COMMANDS = {'recommender': 'run_recommender', 'collaborative': 'run_collaborative', 'random': 'run_random',
+                'grid_search': 'run_grid_search', 'lda': 'run_lda', 'lda2vec': 'run_lda2vec', 'tfidf': 'run_tfidf',
+                'sdae': 'run_sdae', 'experiment': 'run_experiment',
+                'experiment_with_gridsearch': 'run_experiment_with_gridsearch', 'merge': 'merge_experiment'}
+    # The options that every job of the daemon sets, the data and the random seed are set when the daemon starts.
+    JOB_OPTIONS = ['verbose', 'load_matrices', 'dump', 'train_more', 'n_jobs', 'successive_halving', 'force',
+                   'warm_start', 'n_trials', 'memory_budget', 'shard', 'queue_directory']
+
     def __init__(self, use_database=True, verbose=True, load_matrices=True, dump=True, train_more=True,
-                 random_seed=False, config=None):
+                 random_seed=False, config=None, n_jobs=1, successive_halving=False,
+                 force=False, warm_start=False, n_trials=0, memory_budget=None, shard=None, queue_directory=None):
         """
         Setup the data and configuration for the recommenders.
         """
@@ -42,7 +59,8 @@ class RunnableRecommenders(object):
                          4: 'berlin is not that green', 5: 'truth manifests itself',
                          6: 'plato said truth is beautiful', 7: 'freiburg has dna'}
 
-            vocab = set(itertools.chain(*list(map(lambda ab: ab.split(' '), abstracts.values()))))
+            # The words are sorted, so that the fingerprint of the data does not depend on the hash seed.
+            vocab = sorted(set(itertools.chain(*list(map(lambda ab: ab.split(' '), abstracts.values())))))
             w2i = dict(zip(vocab, range(len(vocab))))
             word_to_count = [(w2i[word], sum(abstract.split(' ').count(word)
                                              for doc_id, abstract in abstracts.items())) for word in vocab]
@@ -63,18 +81,55 @@ class RunnableRecommenders(object):
         self.dump = dump
         self.train_more = train_more
         self.random_seed = random_seed
+        self.n_jobs = n_jobs
+        self.successive_halving = successive_halving
+        self.warm_start = warm_start
+        self.n_trials = n_trials
+        # The runs of an experiment run in parallel stages if there are several jobs or a memory budget in bytes.
+        self.memory_budget = memory_budget
+        # A tuple of the index of this shard and the number of shards, this process only runs the runs of its shard.
+        self.shard = shard
+        # The shared directory of a work queue, from which this process claims runs.
+        self.queue_directory = queue_directory
+        # The runs that are in the store are skipped, unless forced.
+        self.results_store = ResultsStore(force=force)
+        # The runs of an experiment share their trained components.
+        self.component_cache = ComponentCache()
+        # The results of the experiments are appended to this CSV file.
+        self.experiment_results_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'matrices',
+                                                    'experiment_results.csv')
         self.evaluator = Evaluator(self.ratings, self.abstracts_preprocessor, self.random_seed, self.verbose)
+        self.load_config()
+
+    def load_config(self):
+        """
+        Load the configuration of the recommenders from the configuration file. The daemon loads it before
+        every job, as the jobs change it, and the file can be edited while the daemon runs.
+        """
         self.config = RecommenderConfiguration()
         self.hyperparameters = self.config.get_hyperparameters()
         self.options = self.config.get_options()
         self.initializer = ModelInitializer(self.hyperparameters.copy(), self.options['n_iterations'], self.verbose)
 
+    @property
+    def force(self):
+        """
+        :returns: A flag that is True if the runs that are already in the results store are run again.
+        :rtype: boolean
+        """
+        return self.results_store.force
+
+    @force.setter
+    def force(self, force):
+        self.results_store.force = force
+
     def run_lda(self):
         """
         Run LDA recommender.
         """
-        lda_recommender = LDARecommender(self.initializer, self.evaluator, self.hyperparameters, self.options,
-                                         self.verbose, self.load_matrices, self.dump)
+        lda_recommender = RecommenderRegistry.get_content_based('LDA')(self.initializer, self.evaluator,
+                                                                       self.hyperparameters, self.options,
+                                                                       self.verbose, self.load_matrices, self.dump)
         results = lda_recommender.train()
         report_str = 'Summary: Test sum {:.2f}, Train sum {:.2f}, Final error {:.5f}, train recall {:.5f}, '\
                      'test recall {:.5f}, recall@200 {:.5f}, '\
@@ -86,8 +141,10 @@ class RunnableRecommenders(object):
         """
         Runs LDA2Vec recommender.
         """
-        lda2vec_recommender = LDA2VecRecommender(self.initializer, self.evaluator, self.hyperparameters,
-                                                 self.options, self.verbose, self.load_matrices, self.dump)
+        lda2vec_recommender = RecommenderRegistry.get_content_based('LDA2Vec')(self.initializer, self.evaluator,
+                                                                               self.hyperparameters, self.options,
+                                                                               self.verbose, self.load_matrices,
+                                                                               self.dump)
         results = lda2vec_recommender.train()
         report_str = 'Summary: Test sum {:.2f}, Train sum {:.2f}, Final error {:.5f}, train recall {:.5f}, '\
                      'test recall {:.5f}, recall@200 {:.5f}, '\
@@ -95,12 +152,28 @@ class RunnableRecommenders(object):
                      'ndcg@5 {:.5f}, mrr@10 {:.5f}, ndcg@10 {:.5f}'
         print(report_str.format(*results))
 
+    def run_tfidf(self):
+        """
+        Runs TF-IDF recommender.
+        """
+        tfidf_recommender = RecommenderRegistry.get_content_based('TFIDF')(self.initializer, self.evaluator,
+                                                                           self.hyperparameters, self.options,
+                                                                           self.verbose, self.load_matrices, self.dump)
+        results = tfidf_recommender.train()
+        report_str = 'Summary: Test sum {:.2f}, Train sum {:.2f}, Final error {:.5f}, train recall {:.5f}, '\
+                     'test recall {:.5f}, recall@200 {:.5f}, '\
+                     'ratio {:.5f}, mrr@5 {:.5f}, '\
+                     'ndcg@5 {:.5f}, mrr@10 {:.5f}, ndcg@10 {:.5f}'
+        print(report_str.format(*results))
+
     def run_sdae(self):
         """
         Runs SDAE recommender.
         """
-        sdae_recommender = SDAERecommender(self.initializer, self.evaluator, self.hyperparameters,
-                                           self.options, self.verbose, self.load_matrices, self.dump)
+        sdae_recommender = RecommenderRegistry.get_collaborative_filtering('SDAE')(self.initializer, self.evaluator,
+                                                                                   self.hyperparameters, self.options,
+                                                                                   self.verbose, self.load_matrices,
+                                                                                   self.dump)
         results = sdae_recommender.train()
         report_str = 'Summary: Test sum {:.2f}, Train sum {:.2f}, Final error {:.5f}, train recall {:.5f}, '\
                      'test recall {:.5f}, recall@200 {:.5f}, '\
@@ -147,8 +220,17 @@ class RunnableRecommenders(object):
                                         verbose=self.verbose, load_matrices=self.load_matrices,
                                         dump_matrices=self.dump, train_more=self.train_more,
                                         random_seed=self.random_seed)
-        GS = GridSearch(recommender, hyperparameters, self.verbose)
-        best_params, all_results = GS.train()
+        GS = GridSearch(recommender, hyperparameters, self.verbose, n_jobs=self.n_jobs,
+                        results_store=self.results_store)
+        if self.successive_halving:
+            best_params, all_results = GS.train_successive_halving()
+        elif self.warm_start:
+            best_params, all_results = GS.train_warm_start(compare_cold_start=True)
+        elif self.n_trials:
+            # Every worker evaluates one suggestion of a batch.
+            best_params, all_results = GS.train_bayesian(self.n_trials, batch_size=GS.n_jobs)
+        else:
+            best_params, all_results = GS.train()
 
     def run_recommender(self):
         """
@@ -170,31 +252,7 @@ class RunnableRecommenders(object):
         """
         Runs experiment
         """
-        all_results = [['n_factors', '_lambda', 'desc', 'rmse', 'train_recall', 'test_recall', 'recall_at_200',
-                        'ratio', 'mrr @ 5', 'ndcg @ 5', 'mrr @ 10', 'ndcg @ 10']]
-        runs = RunsLoader()
-        for run_idx, config_dict in enumerate(runs.get_runnable_recommenders()):
-            if run_idx:
-                print("\n___________________________________________________________________________________________")
-            this_config = config_dict.copy()
-            recommender = RecommenderSystem(abstracts_preprocessor=self.abstracts_preprocessor, ratings=self.ratings,
-                                            config=this_config, verbose=self.verbose, load_matrices=self.load_matrices,
-                                            dump_matrices=self.dump, train_more=self.train_more,
-                                            random_seed=self.random_seed)
-            print("Run #%d %s: " % ((run_idx + 1), recommender.config.get_description()),
-                  recommender.content_based, recommender.collaborative_filtering,
-                  ", with: ", recommender.config.config_dict)
-            results = recommender.train()
-            report_str = 'Summary: Test sum {:.2f}, Train sum {:.2f}, Final error {:.5f}, train recall {:.5f}, '\
-                         'test recall {:.5f}, recall@200 {:.5f}, '\
-                         'ratio {:.5f}, mrr@5 {:.5f}, '\
-                         'ndcg@5 {:.5f}, mrr@10 {:.5f}, ndcg@10 {:.5f}'
-            print(report_str.format(*results))
-            current_result = [recommender.hyperparameters['n_factors'], recommender.hyperparameters['_lambda'],
-                              recommender.config.get_description()]
-            current_result.extend(results)
-            all_results.append(current_result)
-        GridSearch(recommender, {}, self.verbose, report_name='experiment_results').dump_csv(all_results)
+        self.run_configs(RunsLoader().get_runnable_recommenders())
 
     def run_experiment_with_gridsearch(self):
         """
@@ -213,7 +271,8 @@ class RunnableRecommenders(object):
                                         load_matrices=self.load_matrices, dump_matrices=False,
                                         train_more=self.train_more, random_seed=self.random_seed)
         userbased_hyperparameters, userbased_gridsearch_results =\
-            GridSearch(recommender, userbased_configs, self.verbose, report_name='grid_search_userbased').train()
+            GridSearch(recommender, userbased_configs, self.verbose, report_name='grid_search_userbased',
+                       n_jobs=self.n_jobs, results_store=self.results_store).train()
 
         print("Userbased hyperparameters:", userbased_hyperparameters)
 
@@ -228,7 +287,8 @@ class RunnableRecommenders(object):
                                         load_matrices=self.load_matrices, dump_matrices=False,
                                         train_more=self.train_more, random_seed=self.random_seed)
         itembased_hyperparameters, itembased_gridsearch_results =\
-            GridSearch(recommender, itembased_configs, self.verbose, report_name='grid_search_itembased').train()
+            GridSearch(recommender, itembased_configs, self.verbose, report_name='grid_search_itembased',
+                       n_jobs=self.n_jobs, results_store=self.results_store).train()
 
         print("Itembased hyperparameters:", itembased_hyperparameters)
 
@@ -239,42 +299,252 @@ class RunnableRecommenders(object):
         print("Userbased hyperparameters:", userbased_hyperparameters)
         print("Itembased hyperparameters:", itembased_hyperparameters)
 
-        all_results = [['n_factors', '_lambda', 'desc', 'rmse', 'train_recall', 'test_recall', 'recall_at_200',
-                        'ratio', 'mrr @ 5', 'ndcg @ 5', 'mrr @ 10', 'ndcg @ 10']]
-        runs = RunsLoader()
-        for run_idx, config_dict in enumerate(runs.get_runnable_recommenders()):
-            if run_idx:
-                print("\n___________________________________________________________________________________________")
-            this_config = config_dict.copy()
+        configs = []
+        for config_dict in RunsLoader().get_runnable_recommenders():
+            this_config = copy.deepcopy(config_dict)
             if this_config['recommender']['recommender'] == 'itembased':
                 if itembased_hyperparameters:
                     this_config['recommender']['hyperparameters'] = itembased_hyperparameters.copy()
             elif this_config['recommender']['recommender'] == 'userbased':
                 if userbased_hyperparameters:
                     this_config['recommender']['hyperparameters'] = userbased_hyperparameters.copy()
-            recommender = RecommenderSystem(abstracts_preprocessor=self.abstracts_preprocessor, ratings=self.ratings,
-                                            config=this_config, verbose=self.verbose, load_matrices=self.load_matrices,
-                                            dump_matrices=self.dump, train_more=self.train_more,
-                                            random_seed=self.random_seed)
-            print("Run #%d %s: " % ((run_idx + 1), recommender.config.get_description()),
-                  recommender.content_based, recommender.collaborative_filtering,
-                  ", with: ", recommender.config.config_dict)
-            results = recommender.train()
-            report_str = 'Summary: Test sum {:.2f}, Train sum {:.2f}, Final error {:.5f}, train recall {:.5f}, '\
-                         'test recall {:.5f}, recall@200 {:.5f}, '\
-                         'ratio {:.5f}, mrr@5 {:.5f}, '\
-                         'ndcg@5 {:.5f}, mrr@10 {:.5f}, ndcg@10 {:.5f}'
-            print(report_str.format(*results))
-            current_result = [recommender.hyperparameters['n_factors'], recommender.hyperparameters['_lambda'],
-                              recommender.config.get_description()]
-            current_result.extend(results)
+            configs.append(this_config)
+        self.run_configs(configs)
+
+    def run_configs(self, configs):
+        """
+        Runs the recommenders of a list of configurations, and dumps their results. The results of every run
+        are stored as soon as it is done, and the runs that are already in the results store are skipped.
+        With a shard, only the runs of the shard are run, and with a work queue, the runs are claimed from
+        the queue. The results of all the shards or workers are then dumped by merge_experiment_results.
+
+        :param list[dict] configs: The configurations of the recommenders.
+        """
+        if self.queue_directory is not None:
+            self.run_queue_worker(configs)
+            return
+        all_results = [['n_factors', '_lambda', 'desc', 'rmse', 'train_recall', 'test_recall', 'recall_at_200',
+                        'ratio', 'mrr @ 5', 'ndcg @ 5', 'mrr @ 10', 'ndcg @ 10']]
+        report_str = 'Summary: Test sum {:.2f}, Train sum {:.2f}, Final error {:.5f}, train recall {:.5f}, '\
+                     'test recall {:.5f}, recall@200 {:.5f}, '\
+                     'ratio {:.5f}, mrr@5 {:.5f}, '\
+                     'ndcg@5 {:.5f}, mrr@10 {:.5f}, ndcg@10 {:.5f}'
+        planner = ExperimentPlanner(self.n_jobs, self.memory_budget, self.verbose)
+        load_key = planner.add_stage(('load',), lambda: self.component_cache.get_data_fingerprint(
+            self.ratings, self.abstracts_preprocessor), memory=self.ratings.nbytes, name='load')
+        run_results = []
+        for run_idx, config_dict in enumerate(configs):
+            if self.shard is not None and run_idx % self.shard[1] != self.shard[0]:
+                continue
+            if run_results:
+                print("\n___________________________________________________________________________________________")
+            this_config = copy.deepcopy(config_dict)
+            key = self.get_run_key(this_config)
+            current_result = self.get_stored_result(key)
+            if current_result is not None:
+                print("Run #%d %s: found in the results store, skipped" %
+                      ((run_idx + 1), RecommenderConfiguration(this_config).get_description()))
+                print(report_str.format(*current_result[3:]))
+                run_results.append(current_result)
+                continue
+            if self.n_jobs == 1 and self.memory_budget is None:
+                current_result = self.run_config(run_idx, this_config, key)
+                print(report_str.format(*current_result[3:]))
+                run_results.append(current_result)
+                continue
+            # The runs that share a content model depend on one stage that trains it, the runs are independent.
+            dependencies = [load_key]
+            configuration = RecommenderConfiguration(this_config)
+            n_factors = configuration.get_hyperparameters()['n_factors']
+            if configuration.get_content_based() != 'None':
+                content_key = ('content', configuration.get_content_based(),
+                               str(sorted(configuration.get_hyperparameters().items())),
+                               str(sorted(configuration.get_options().items())))
+                dependencies.append(planner.add_stage(
+                    content_key, functools.partial(self.train_content_based, this_config),
+                    [load_key], self.estimate_memory('content', n_factors),
+                    'content %s %d' % (configuration.get_content_based(), n_factors)))
+            run_results.append(planner.add_stage(
+                ('run', run_idx), functools.partial(self.run_config, run_idx, this_config, key),
+                dependencies, self.estimate_memory(configuration.get_recommender(), n_factors),
+                'run #%d %s' % (run_idx + 1, configuration.get_description())))
+        if len(planner.stages) > 1:
+            try:
+                stage_results = planner.run()
+            finally:
+                # The content stages pinned their components for the runs that depend on them.
+                for stage in planner.stages.values():
+                    if stage.key[0] == 'content' and stage.result is not None:
+                        self.component_cache.unpin(stage.result)
+            run_results = [stage_results[result] if isinstance(result, tuple) else result for result in run_results]
+            for current_result in run_results:
+                print("%s: " % current_result[2] + report_str.format(*current_result[3:]))
+        all_results.extend(run_results)
+        if self.verbose:
+            print("Component cache: %d components, %d hits, %d misses" %
+                  (len(self.component_cache), self.component_cache.hits, self.component_cache.misses))
+        if self.shard is not None:
+            print("Shard %d/%d done, the results of all the shards are dumped by merge" %
+                  (self.shard[0] + 1, self.shard[1]))
+            return
+        self.dump_experiment_results(all_results)
+
+    def get_run_key(self, config):
+        """
+        :param dict config: The configuration of a run.
+        :returns: The key of the run in the results store.
+        :rtype: str
+        """
+        data_fingerprint = self.component_cache.get_data_fingerprint(self.ratings, self.abstracts_preprocessor)
+        return self.results_store.get_key({'run': config, 'train_more': self.train_more}, data_fingerprint,
+                                          self.evaluator.get_split_seed())
+
+    def get_stored_result(self, key):
+        """
+        :param str key: The key of a run.
+        :returns: The stored row of the results of the run, None if it was not run.
+        :rtype: list
+        """
+        # The results of random splits are stored, but they can not be reused.
+        if self.evaluator.get_split_seed() is None:
+            return None
+        return self.results_store.get(key)
+
+    def run_queue_worker(self, configs):
+        """
+        Adds the runs to the work queue, unless they are already there, and runs the runs claimed from
+        the queue until all of them are done. Several processes on one or more hosts can share the queue
+        directory, and they share the results store. A run of a worker that died is claimed again after
+        its lease expires.
+
+        :param list[dict] configs: The configurations of the recommenders.
+        """
+        queue = WorkQueue(self.queue_directory)
+        for run_idx, config_dict in enumerate(configs):
+            key = self.get_run_key(config_dict)
+            queue.add('%05d-%s' % (run_idx, key), {'run_idx': run_idx, 'config': config_dict, 'key': key})
+
+        def run_task(task_id, task):
+            # Another worker can have stored the run before its lease expired.
+            self.results_store.reload()
+            if self.get_stored_result(task['key']) is None:
+                self.run_config(task['run_idx'], task['config'], task['key'])
+
+        done_task_ids = queue.process(run_task)
+        print("Worker %s ran %d runs, the results of all the workers are dumped by merge" %
+              (queue.worker_id, len(done_task_ids)))
+
+    def merge_experiment_results(self, configs):
+        """
+        Dumps the stored results of the runs of an experiment, that were run by shards or workers. The results
+        are read from the store even if they can not be reused, like the results of random splits.
+
+        :param list[dict] configs: The configurations of the recommenders.
+        """
+        self.results_store.reload()
+        all_results = [['n_factors', '_lambda', 'desc', 'rmse', 'train_recall', 'test_recall', 'recall_at_200',
+                        'ratio', 'mrr @ 5', 'ndcg @ 5', 'mrr @ 10', 'ndcg @ 10']]
+        for run_idx, config_dict in enumerate(configs):
+            current_result = self.results_store.results.get(self.get_run_key(config_dict))
+            if current_result is None:
+                print("Run #%d %s: not in the results store, missing from the results" %
+                      ((run_idx + 1), RecommenderConfiguration(config_dict).get_description()))
+                continue
             all_results.append(current_result)
-        GridSearch(recommender, {}, self.verbose, report_name='experiment_results').dump_csv(all_results)
+        self.dump_experiment_results(all_results)
+
+    def merge_experiment(self):
+        """
+        Dumps the results of the experiment, that was run by shards or workers.
+        """
+        self.merge_experiment_results(RunsLoader().get_runnable_recommenders())
+
+    def run_config(self, run_idx, config, key):
+        """
+        Runs the recommender of a configuration, and stores its results.
+
+        :param int run_idx: The index of the run.
+        :param dict config: The configuration of the recommender.
+        :param str key: The key of the run in the results store.
+        :returns: The row of the results of the run.
+        :rtype: list
+        """
+        recommender = RecommenderSystem(abstracts_preprocessor=self.abstracts_preprocessor,
+                                        ratings=self.ratings, config=config, verbose=self.verbose,
+                                        load_matrices=self.load_matrices, dump_matrices=self.dump,
+                                        train_more=self.train_more, random_seed=self.random_seed,
+                                        component_cache=self.component_cache)
+        print("Run #%d %s: " % ((run_idx + 1), recommender.config.get_description()),
+              recommender.content_based, recommender.collaborative_filtering,
+              ", with: ", recommender.config.config_dict)
+        results = recommender.train()
+        current_result = [recommender.hyperparameters['n_factors'], recommender.hyperparameters['_lambda'],
+                          recommender.config.get_description()]
+        current_result.extend(results)
+        self.results_store.add(key, current_result, config)
+        return current_result
+
+    def train_content_based(self, config):
+        """
+        Trains the content-based recommender of a configuration, its components are shared by the runs
+        through the component cache. They are pinned, so that the components of the other runs do not evict
+        them before the runs that depend on them load them.
+
+        :param dict config: The configuration of the recommender.
+        :returns: The pinned namespace of the components, that is unpinned when the runs are done.
+        :rtype: tuple
+        """
+        recommender = RecommenderSystem(abstracts_preprocessor=self.abstracts_preprocessor,
+                                        ratings=self.ratings, config=config, verbose=self.verbose,
+                                        load_matrices=self.load_matrices, dump_matrices=self.dump,
+                                        train_more=self.train_more, random_seed=self.random_seed,
+                                        component_cache=self.component_cache)
+        cache_namespace = recommender.initializer.cache_namespace
+        self.component_cache.pin(cache_namespace)
+        try:
+            recommender.content_based.train()
+        except Exception:
+            self.component_cache.unpin(cache_namespace)
+            raise
+        return cache_namespace
+
+    def estimate_memory(self, stage_type, n_factors):
+        """
+        A rough estimate of the memory footprint of a stage, dominated by the dense copies of the ratings
+        for the folds and the predictions.
+
+        :param str stage_type: 'content', or the type of the recommender of a run.
+        :param int n_factors: The number of factors.
+        :returns: The estimated memory in bytes.
+        :rtype: int
+        """
+        n_users, n_items = self.ratings.shape
+        dense = n_users * n_items * 8
+        factors = (n_users + n_items) * n_factors * 8
+        if stage_type == 'content':
+            term_frequencies = self.abstracts_preprocessor.get_term_frequency_sparse_matrix().nnz * 16
+            return 3 * dense + factors + term_frequencies
+        if stage_type == 'hybrid':
+            # The predictions of both recommenders, and the linear regression of them.
+            return 7 * dense + 2 * factors
+        return 4 * dense + 2 * factors
+
+    def dump_experiment_results(self, all_results):
+        """
+        Dumps the results of the experiment to experiment_results.csv.
+
+        :param list[list] all_results: The header and the results of every run.
+        """
+        with open(self.experiment_results_path, "a") as f:
+            csv.writer(f).writerows(all_results)
+        if self.verbose:
+            print("dumped to %s" % self.experiment_results_path)
 
 
 if __name__ == '__main__':
     parser = OptionParser("runnables.py [options] [recommenders]\n\nRecommenders:\n\trecommender\n\tcollaborative"
-                          "\n\tgrid_search\n\tlda\n\tlda2vec\n\tsdae\n\texperiment\n\texperiment_with_gridsearch")
+                          "\n\tgrid_search\n\tlda\n\tlda2vec\n\ttfidf\n\tsdae\n\texperiment"
+                          "\n\texperiment_with_gridsearch\n\tmerge\n\tdaemon")
     parser.add_option("-d", "--use-database", dest="db", action='store_true',
                       help="use database to run the recommender", metavar="DB")
     parser.add_option("-a", "--all", dest="all", action='store_true',
@@ -289,6 +559,27 @@ if __name__ == '__main__':
                       help="train the collaborative filtering more, after loading matrices", metavar="TRAINMORE")
     parser.add_option("-r", "--random_seed", dest="random_seed", action='store_true',
                       help="Set the seed to the current timestamp if true.", metavar="RANDOMSEED")
+    parser.add_option("-j", "--jobs", dest="n_jobs", type='int', default=1,
+                      help="number of processes of the grid searches, -1 for all cores", metavar="JOBS")
+    parser.add_option("-f", "--force", dest="force", action='store_true',
+                      help="run again the runs that are already in the results store", metavar="FORCE")
+    parser.add_option("--warm-start", dest="warm_start", action='store_true',
+                      help="run the grid search as a sweep of warm started configs", metavar="WARMSTART")
+    parser.add_option("--trials", dest="n_trials", type='int', default=0,
+                      help="run a bayesian search of TRIALS configs instead of the full grid search", metavar="TRIALS")
+    parser.add_option("-m", "--memory", dest="memory", type='float',
+                      help="memory budget in GB of the parallel stages of the experiments", metavar="MEMORY")
+    parser.add_option("--shard", dest="shard",
+                      help="run the runs of shard SHARD of the experiments, as index/count from 1/count",
+                      metavar="SHARD")
+    parser.add_option("-q", "--queue", dest="queue",
+                      help="claim the runs of the experiments from the work queue in the directory QUEUE",
+                      metavar="QUEUE")
+    parser.add_option("--halving", dest="successive_halving", action='store_true',
+                      help="run the grid search with successive halving of the configs", metavar="HALVING")
+    parser.add_option("--socket", dest="socket",
+                      help="start the daemon on the Unix socket SOCKET with the command daemon, or submit the "
+                      "commands to it", metavar="SOCKET")
     options, args = parser.parse_args()
     use_database = options.db is not None
     use_all = options.all is not None
@@ -297,16 +588,53 @@ if __name__ == '__main__':
     dump = options.dump is not None
     train_more = options.train_more is not None
     random_seed = options.random_seed is not None
+    shard = None
+    if options.shard:
+        try:
+            shard_index, shard_count = map(int, options.shard.split('/'))
+        except ValueError:
+            parser.error("--shard expects index/count, like 1/4")
+        if not 1 <= shard_index <= shard_count:
+            parser.error("--shard index should be between 1 and the count")
+        shard = (shard_index - 1, shard_count)
+
+    memory_budget = int(options.memory * 2 ** 30) if options.memory else None
 
+    if options.socket and 'daemon' not in args:
+        # The daemon has the data and the components loaded, the options of this call are set for its jobs.
+        job_options = {'verbose': verbose, 'load_matrices': load_matrices, 'dump': dump, 'train_more': train_more,
+                       'n_jobs': options.n_jobs, 'successive_halving': options.successive_halving is not None,
+                       'force': options.force is not None, 'warm_start': options.warm_start is not None,
+                       'n_trials': options.n_trials, 'memory_budget': memory_budget, 'shard': shard,
+                       'queue_directory': options.queue}
+        client = RecommenderClient(options.socket)
+        for arg in args:
+            error = client.submit(arg, job_options)
+            if error is not None:
+                print(error)
+                sys.exit(1)
+        sys.exit(0)
     if random_seed is True:
         numpy.random.seed(int(time.time()))
-    runnable = RunnableRecommenders(use_database, verbose, load_matrices, dump, train_more, random_seed)
+    runnable = RunnableRecommenders(use_database, verbose, load_matrices, dump, train_more, random_seed,
+                                    n_jobs=options.n_jobs, successive_halving=options.successive_halving is not None,
+                                    force=options.force is not None, warm_start=options.warm_start is not None,
+                                    n_trials=options.n_trials, memory_budget=memory_budget,
+                                    shard=shard, queue_directory=options.queue)
+    if 'daemon' in args:
+        if not options.socket:
+            parser.error("the daemon needs a socket, given by --socket")
+        print("Daemon listening on %s" % options.socket)
+        RecommenderDaemon(runnable, options.socket, RunnableRecommenders.COMMANDS,
+                          RunnableRecommenders.JOB_OPTIONS, 'load_config').serve()
+        sys.exit(0)
     if use_all is True:
         runnable.run_recommender()
         runnable.run_collaborative()
         runnable.run_grid_search()
         runnable.run_lda()
         runnable.run_lda2vec()
+        runnable.run_tfidf()
         runnable.run_sdae()
         runnable.run_experiment()
         runnable.run_experiment_with_gridsearch()
@@ -314,37 +642,11 @@ if __name__ == '__main__':
         sys.exit(0)
     found_runnable = False
     for arg in args:
-        if arg == 'recommender':
-            runnable.run_recommender()
-            found_runnable = True
-        elif arg == 'collaborative':
-            runnable.run_collaborative()
-            found_runnable = True
-        elif arg == 'random':
-            runnable.run_random()
-            found_runnable = True
-        elif arg == 'grid_search':
-            runnable.run_grid_search()
-            found_runnable = True
-        elif arg == 'lda':
-            runnable.run_lda()
-            found_runnable = True
-        elif arg == 'lda2vec':
-            runnable.run_lda2vec()
-            found_runnable = True
-        elif arg == 'experiment':
-            runnable.run_experiment()
-            found_runnable = True
-        elif arg == 'sdae':
-            runnable.run_sdae()
-            found_runnable = True
-        elif arg == 'experiment_with_gridsearch':
-            runnable.run_experiment_with_gridsearch()
+        if arg in RunnableRecommenders.COMMANDS:
+            getattr(runnable, RunnableRecommenders.COMMANDS[arg])()
             found_runnable = True
         else:
-            print("'%s' option is not valid, please use one of "
-                  "['recommender', 'collaborative', 'grid_search', 'lda', 'lda2vec', 'experiment', "
-                  "'sdae', 'experiment_with_gridsearch']" % arg)
+            print("'%s' option is not valid, please use one of %s" % (arg, sorted(RunnableRecommenders.COMMANDS)))
     if found_runnable is False:
         print("Didn't find any valid option, running recommender instead.")
         runnable.run_recommender()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+import itertools
+import numpy
+import unittest
+from lib.cold_start import ColdStartEmbedder
+from lib.collaborative_filtering import CollaborativeFiltering
+from lib.evaluator import Evaluator
+from lib.TFIDF import TFIDFRecommender
+from util.abstracts_preprocessor import AbstractsPreprocessor
+from util.model_initializer import ModelInitializer
+
+
+class TestcaseBase(unittest.TestCase):
+    def setUp(self):
+        """
+        Setup method that is called at the beginning of each test.
+        """
+        self.documents, self.users = 8, 10
+        self.n_factors = 5
+        self.hyperparameters = {'n_factors': self.n_factors, '_lambda': 0.01}
+        self.options = {'n_iterations': 5, 'k_folds': 2}
+        self.initializer = ModelInitializer(self.hyperparameters.copy(), 5)
+        self.abstracts = {0: 'hell world berlin dna evolution', 1: 'freiburg is green',
+                          2: 'the best dna is the dna of dinasours', 3: 'truth is absolute',
+                          4: 'berlin is not that green', 5: 'truth manifests itself',
+                          6: 'plato said truth is beautiful', 7: 'freiburg has dna'}
+        vocab = sorted(set(itertools.chain(*list(map(lambda ab: ab.split(' '), self.abstracts.values())))))
+        self.vocabulary = dict(zip(vocab, range(len(vocab))))
+        word_to_count = [(self.vocabulary[word], sum(abstract.split(' ').count(word)
+                                                     for abstract in self.abstracts.values())) for word in vocab]
+        article_to_word = list(set([(doc_id, self.vocabulary[word]) for doc_id, abstract in self.abstracts.items()
+                                    for word in abstract.split(' ')]))
+        article_to_word_to_count = list(set([(doc_id, self.vocabulary[word], abstract.split(' ').count(word))
+                                             for doc_id, abstract in self.abstracts.items()
+                                             for word in abstract.split(' ')]))
+        self.abstracts_preprocessor = AbstractsPreprocessor(self.abstracts, word_to_count,
+                                                            article_to_word, article_to_word_to_count)
+        self.ratings_matrix = numpy.array([[int(not bool((article + user) % 3)) for article in range(self.documents)]
+                                           for user in range(self.users)])
+        self.evaluator = Evaluator(self.ratings_matrix, self.abstracts_preprocessor)
+
+
+class TestColdStartEmbedder(TestcaseBase):
+    def runTest(self):
+        content_based = TFIDFRecommender(self.initializer, self.evaluator, self.hyperparameters, self.options,
+                                         load_matrices=False, dump_matrices=False)
+        content_based.train()
+        cf = CollaborativeFiltering(self.initializer, self.evaluator, self.hyperparameters, self.options,
+                                    load_matrices=False, dump_matrices=False)
+        cf.train()
+        embedder = ColdStartEmbedder(content_based, cf.item_vecs, self.vocabulary)
+
+        # A known abstract is embedded like its fitted document distribution.
+        texts = [self.abstracts[0].upper() + ' unknownword', self.abstracts[3]]
+        term_freq = embedder.get_bag_of_words(texts)
+        self.assertEqual(term_freq.shape, (2, self.abstracts_preprocessor.get_num_vocab()))
+        self.assertEqual(term_freq[0].sum(), 5)
+        expected_term_freq = self.abstracts_preprocessor.get_term_frequency_sparse_matrix()[[0, 3]]
+        self.assertTrue(numpy.allclose(term_freq.toarray(), expected_term_freq.toarray()))
+        item_vecs = embedder.embed_texts(texts)
+        self.assertEqual(item_vecs.shape, (2, self.n_factors))
+        expected = embedder._add_bias(content_based.get_document_topic_distribution()[[0, 3]]).dot(embedder.weights)
+        self.assertTrue(numpy.allclose(item_vecs, expected))
+        self.assertEqual(embedder.predict(cf.user_vecs, term_freq).shape, (self.users, 2))
@@ -54,3 +54,29 @@ class TestALS(TestcaseBase):
         random_item = int(numpy.random.random() * self.documents)
         random_prediction = cf.predict(random_user, random_item)
         self.assertTrue(isinstance(random_prediction, numpy.float64))
+
+
+class TestWarmStart(TestcaseBase):
+    def runTest(self):
+        cf = CollaborativeFiltering(self.initializer, self.evaluator, self.hyperparameters,
+                                    self.options, load_matrices=False, dump_matrices=False)
+        cf.train()
+        self.assertEqual(sorted(cf.fold_vecs), list(range(self.k_folds)))
+        self.assertTrue(0 < cf.n_epochs <= self.k_folds * self.n_iterations)
+
+        # A higher rank is started from the padded vectors of the lower rank.
+        options = dict(self.options, convergence_tolerance=1.0)
+        larger = CollaborativeFiltering(self.initializer, self.evaluator, {'n_factors': 7, '_lambda': 0.01},
+                                        options, load_matrices=False, dump_matrices=False)
+        self.assertEqual(larger._convergence_tolerance, 1.0)
+        larger.set_warm_start(cf.fold_vecs)
+        larger.hyperparameters['fold'] = 1
+        user_vecs, item_vecs = larger.get_warm_start_vecs()
+        self.assertEqual(user_vecs.shape, (self.users, 7))
+        self.assertEqual(item_vecs.shape, (self.documents, 7))
+        self.assertTrue(numpy.array_equal(item_vecs[:, :self.n_factors], cf.fold_vecs[1][1]))
+        larger.train()
+        # With a tolerance of 1 every fold stops after its second epoch, the first one is compared to no error.
+        self.assertEqual(larger.n_epochs, 2 * self.k_folds)
+        larger.set_warm_start(None)
+        self.assertIsNone(larger.get_warm_start_vecs())
@@ -1,14 +1,17 @@
 #!/usr/bin/env python
+import importlib.util
 import itertools
 import numpy
 import unittest
 from lib.abstract_recommender import AbstractRecommender
+from lib.citation_graph import CitationGraphRecommender
 from lib.content_based import ContentBased
 from lib.evaluator import Evaluator
 from lib.LDA import LDARecommender
-from lib.LDA2Vec import LDA2VecRecommender
-from lib.SDAE import SDAERecommender
+from lib.recommender_registry import RecommenderRegistry
+from lib.TFIDF import TFIDFRecommender
 from util.abstracts_preprocessor import AbstractsPreprocessor
+from util.component_cache import ComponentCache
 from util.data_parser import DataParser
 from util.model_initializer import ModelInitializer
 
@@ -73,6 +76,43 @@ class TestContentBased(TestcaseBase):
         content_based.train()
         self.assertTrue(isinstance(content_based, AbstractRecommender))
         self.assertTrue(content_based.get_predictions().shape, (self.users, self.documents))
+        # Blocks of users predict the same as the full matrix.
+        content_based.document_distribution = numpy.random.random((self.documents, self.n_factors))
+        content_based.predictions = None
+        V = content_based.document_distribution - content_based.document_distribution.mean(axis=1)[:, None]
+        V /= numpy.linalg.norm(V, axis=1)[:, None]
+        expected = content_based.train_data.dot(V).dot(V.T) / V.dot(V.T.dot(numpy.ones(self.documents)))
+        content_based._block_size = 3
+        self.assertTrue(numpy.allclose(content_based.get_predictions(), expected))
+        # The item-side quantities are reused by the other folds.
+        normalized_documents = content_based.normalized_documents
+        train_data, test_data = content_based.train_data, content_based.test_data
+        content_based.set_data(*self.evaluator.get_fold(1, content_based.fold_test_indices))
+        content_based.get_predictions()
+        self.assertIs(content_based.normalized_documents, normalized_documents)
+        content_based.set_data(train_data, test_data)
+        top_items, top_values = content_based.get_top_recommendations(3)
+        self.assertEqual(top_items.shape, (self.users, 3))
+        self.assertTrue(numpy.allclose(top_values, numpy.sort(expected, axis=1)[:, ::-1][:, :3]))
+        self.assertTrue(numpy.allclose(numpy.take_along_axis(expected, top_items, axis=1), top_values))
+        # The evaluation from blocks of predictions reports like the evaluation of the predictions matrix.
+        content_based.predictions = None
+        report = content_based.get_evaluation_report()
+        self.assertIsNone(content_based.predictions)
+        self.assertTrue(numpy.allclose(report, AbstractRecommender.get_evaluation_metrics(content_based),
+                                       equal_nan=True))
+        # With all the items as neighbours, the neighbours graph predicts like the dense similarities.
+        content_based._n_neighbours = self.documents
+        content_based._dump_matrices = False
+        content_based.predictions = None
+        self.assertTrue(numpy.allclose(content_based.get_predictions(), expected))
+        content_based._n_neighbours = 3
+        content_based.predictions = None
+        content_based.get_predictions()
+        self.assertEqual(content_based.item_neighbours.nnz, 3 * self.documents)
+        neighbours, similarities = content_based.get_item_neighbours(0)
+        self.assertEqual(neighbours[0], 0)
+        self.assertTrue(numpy.allclose(similarities, numpy.sort(V.dot(V[0]))[::-1][:3]))
 
 
 class TestLDA(TestcaseBase):
@@ -88,8 +128,42 @@ class TestLDA(TestcaseBase):
         self.assertEqual(content_based.get_predictions().shape, (self.users, self.documents))
 
 
+class TestLDAAddDocuments(TestcaseBase):
+    def runTest(self):
+        self.initializer.set_component_cache(ComponentCache(), ('lda',), load_files=False, dump_files=False)
+        content_based = LDARecommender(self.initializer, self.evaluator, self.hyperparameters, self.options)
+        content_based.train()
+        lda_model = content_based.get_lda_model()
+        # New documents are inferred and kept apart from the items, without training from scratch.
+        term_freq = self.abstracts_preprocessor.get_term_frequency_sparse_matrix()[:2]
+        new_distribution = content_based.add_documents(term_freq)
+        self.assertEqual(new_distribution.shape, (2, self.n_factors))
+        self.assertEqual(content_based.cold_document_distribution.shape, (2, self.n_factors))
+        self.assertEqual(content_based.get_document_topic_distribution().shape, (self.documents, self.n_factors))
+        self.assertTrue(numpy.allclose(content_based.infer_document_distribution(term_freq), new_distribution))
+        self.assertEqual(content_based.get_predictions().shape, (self.users, self.documents))
+        self.assertEqual(len(content_based.get_evaluation_report()), 11)
+        # The model of the items is not updated, the updated model is saved with the number of all the documents.
+        found, items_model = self.initializer.load_model(self.hyperparameters, content_based._get_model_name(),
+                                                         (self.documents, self.n_factors))
+        self.assertTrue(found)
+        self.assertIs(items_model, lda_model)
+        self.assertIsNot(content_based.get_lda_model(), lda_model)
+        loaded = LDARecommender(self.initializer, self.evaluator, self.hyperparameters, self.options)
+        loaded.train()
+        self.assertTrue(loaded.load_added_documents(2))
+        self.assertTrue(numpy.allclose(loaded.cold_document_distribution, new_distribution))
+        self.assertIs(loaded.get_lda_model(), content_based.get_lda_model())
+        self.assertFalse(loaded.load_added_documents(3))
+        # The model is not trained when it is missing.
+        content_based.lda_model = None
+        content_based._load_matrices = False
+        self.assertRaises(ValueError, content_based.get_lda_model)
+
+
 class TestLDA2Vec(TestcaseBase):
     def runTest(self):
+        LDA2VecRecommender = RecommenderRegistry.get_content_based('LDA2Vec')
         content_based = LDA2VecRecommender(self.initializer, self.evaluator, self.hyperparameters, self.options)
         self.assertEqual(content_based.n_factors, self.n_factors)
         self.assertEqual(content_based.n_items, self.documents)
@@ -101,8 +175,52 @@ class TestLDA2Vec(TestcaseBase):
         self.assertEqual(content_based.get_predictions().shape, (self.users, self.documents))
 
 
+@unittest.skipUnless(importlib.util.find_spec('chainer') and importlib.util.find_spec('lda2vec'),
+                     "chainer and lda2vec are not installed")
+class TestLDA2VecBatchedLoss(unittest.TestCase):
+    def runTest(self):
+        from lib.lda2vec_model import LDA2Vec
+        # With one word the negative samples are the same, and both steps draw the same random masks.
+        model = LDA2Vec(n_documents=2, n_document_topics=2, n_units=4, n_vocab=1, counts=numpy.array([1]),
+                        n_samples=1, dropout_ratio=0.0)
+        # The targets in the other document are ignored, so the losses of the context offsets differ.
+        doc_ids = numpy.repeat(numpy.arange(2, dtype='int32'), 6)
+        word_indices = numpy.zeros(12, dtype='int32')
+        model.cleargrads()
+        numpy.random.seed(0)
+        batched_loss = model.fit_partial_batched(doc_ids, word_indices, window=2)
+        batched_grad = model.mixture.weights.W.grad.copy()
+        model.cleargrads()
+        numpy.random.seed(0)
+        loss = model.fit_partial(doc_ids, word_indices, window=2)
+        self.assertTrue(numpy.allclose(batched_loss, loss))
+        self.assertTrue(numpy.allclose(batched_grad, model.mixture.weights.W.grad))
+
+
+class TestTFIDF(TestcaseBase):
+    def runTest(self):
+        content_based = TFIDFRecommender(self.initializer, self.evaluator, self.hyperparameters, self.options,
+                                         load_matrices=False, dump_matrices=False)
+        self.assertEqual(content_based.n_factors, self.n_factors)
+        content_based.train()
+        self.assertEqual(content_based.get_document_topic_distribution().shape, (self.documents, self.n_factors))
+        self.assertTrue(isinstance(content_based, AbstractRecommender))
+        predictions = content_based.get_predictions()
+        self.assertEqual(predictions.shape, (self.users, self.documents))
+        X = content_based.tfidf_matrix.toarray()
+        self.assertTrue(numpy.allclose(numpy.linalg.norm(X, axis=1), 1.0))
+        expected = content_based.train_data.dot(X).dot(X.T) / X.dot(X.T.dot(numpy.ones(self.documents)))
+        self.assertTrue(numpy.allclose(predictions, expected))
+        # Scoring with the truncated document distribution.
+        content_based._sparse_scoring = False
+        content_based.predictions = None
+        self.assertEqual(content_based.get_predictions().shape, (self.users, self.documents))
+
+
 class TestSDAE(TestcaseBase):
     def runTest(self):
+        SDAERecommender = RecommenderRegistry.get_collaborative_filtering('SDAE')
+        SDAERecommender.clear_compiled_models()
         hyperparameters = self.hyperparameters.copy()
         hyperparameters['_lambda'] = 0.01
         content_based = SDAERecommender(self.initializer, self.evaluator, hyperparameters, self.options)
@@ -114,3 +232,30 @@ class TestSDAE(TestcaseBase):
         self.assertGreaterEqual(content_based.get_document_topic_distribution().min(), -1e-6)
         self.assertTrue(isinstance(content_based, AbstractRecommender))
         self.assertEqual(content_based.get_predictions().shape, (self.users, self.documents))
+        # The compiled model is reused by the next trainings of the same shape.
+        model = content_based.model
+        content_based.train()
+        self.assertIs(content_based.model, model)
+        key = (self.abstracts_preprocessor.get_num_vocab(), self.n_factors)
+        self.assertEqual(list(SDAERecommender._compiled_models), [key])
+        self.assertIs(SDAERecommender._compiled_models[key][0], model)
+
+
+class TestCitationGraph(TestcaseBase):
+    def runTest(self):
+        citations = [(0, 1), (1, 2), (2, 0), (3, 4), (7, 7), (6, 100)]
+        content_based = CitationGraphRecommender(self.initializer, self.evaluator, self.hyperparameters,
+                                                 self.options, citations=citations)
+        self.assertEqual(content_based.n_items, self.documents)
+        content_based.train()
+        self.assertEqual(content_based.transition_matrix.shape, (self.documents, self.documents))
+        self.assertTrue(numpy.allclose(content_based.transition_matrix.sum(axis=1).A.ravel()[:5], 1.0))
+        self.assertTrue(isinstance(content_based, AbstractRecommender))
+        predictions = content_based.get_predictions()
+        self.assertEqual(predictions.shape, (self.users, self.documents))
+        self.assertTrue(numpy.allclose(predictions[content_based.train_data.sum(axis=1) > 0].sum(axis=1), 1.0))
+        self.assertGreaterEqual(predictions.min(), 0.0)
+        # Walking users one by one gives the same scores.
+        content_based.predictions = None
+        content_based._block_size = 1
+        self.assertTrue(numpy.allclose(content_based.get_predictions(), predictions))
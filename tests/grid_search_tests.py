@@ -1,11 +1,16 @@
 #!/usr/bin/env python
 import numpy
+import os
+import shutil
+import tempfile
 import unittest
 from lib.collaborative_filtering import CollaborativeFiltering
 from lib.evaluator import Evaluator
+from lib.gaussian_process import GaussianProcess
 from lib.grid_search import GridSearch
 from util.data_parser import DataParser
 from util.model_initializer import ModelInitializer
+from util.results_store import ResultsStore
 
 
 class TestcaseBase(unittest.TestCase):
@@ -33,6 +38,19 @@ class TestcaseBase(unittest.TestCase):
         self.ratings_matrix = numpy.array(mock_get_ratings_matrix())
         setattr(DataParser, "get_ratings_matrix", mock_get_ratings_matrix)
 
+    def get_grid_search(self, hyperparameters=None, **kwargs):
+        """
+        :param dict hyperparameters: The hyperparameters to search, the ones of the test by default.
+        :returns: A grid search of a collaborative filtering that does not load or save its matrices.
+        :rtype: GridSearch
+        """
+        evaluator = Evaluator(self.ratings_matrix)
+        cf = CollaborativeFiltering(self.initializer, evaluator, self.initial_config, self.options,
+                                    load_matrices=False, dump_matrices=False)
+        if hyperparameters is None:
+            hyperparameters = self.hyperparameters
+        return GridSearch(cf, hyperparameters, False, **kwargs)
+
 
 class TestGridSearch(TestcaseBase):
     def runTest(self):
@@ -63,3 +81,103 @@ class TestGridSearch(TestcaseBase):
     def checkGridSearch(self, grid_search):
         best_params = grid_search.train()
         self.assertTrue(isinstance(best_params, tuple))
+
+
+class TestParallelGridSearch(TestcaseBase):
+    def runTest(self):
+        grid_search = self.get_grid_search(n_jobs=2)
+        best_params, all_results = grid_search.train()
+        combinations = grid_search.get_all_combinations()
+        self.assertIn(best_params, combinations)
+        self.assertEqual(len(all_results), len(combinations) + 1)
+        # The results are in the order of the combinations.
+        self.assertEqual([row[:2] for row in all_results[1:]],
+                         [[config['n_factors'], config['_lambda']] for config in combinations])
+        self.assertEqual(len(grid_search.get_all_errors()), len(combinations))
+
+
+class TestSuccessiveHalving(TestcaseBase):
+    def runTest(self):
+        grid_search = self.get_grid_search()
+        best_params, all_results = grid_search.train_successive_halving(min_iterations=3, reduction_factor=2)
+        combinations = grid_search.get_all_combinations()
+        self.assertIn(best_params, combinations)
+        # 4 configs for 3 iterations, 2 for 6, then the best one for the full 15 iterations.
+        self.assertEqual([row[-1] for row in all_results[1:]], [3, 3, 3, 3, 6, 6, 15])
+        self.assertEqual(all_results[-1][:2], [best_params['n_factors'], best_params['_lambda']])
+        self.assertEqual(grid_search.recommender.n_iter, self.n_iterations)
+
+
+class TestMemoizedGridSearch(TestcaseBase):
+    def runTest(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'results_store.jsonl')
+        hyperparameters = {'_lambda': [0.0001, 0.1], 'n_factors': [10]}
+        grid_search = self.get_grid_search(hyperparameters, results_store=ResultsStore(path, code_version='test'))
+        best_params, all_results = grid_search.train()
+        cf = grid_search.recommender
+
+        # Only the new combination is trained.
+        trained = []
+        train = cf.train
+
+        def mock_train():
+            trained.append(cf.hyperparameters.copy())
+            return train()
+        cf.train = mock_train
+        hyperparameters['n_factors'].append(20)
+        grid_search = GridSearch(cf, hyperparameters, False, results_store=ResultsStore(path, code_version='test'))
+        new_best_params, new_all_results = grid_search.train()
+        self.assertEqual([config['n_factors'] for config in trained], [20, 20])
+        self.assertEqual([row[:2] for row in new_all_results[1:]], [[10, 0.0001], [20, 0.0001], [10, 0.1], [20, 0.1]])
+        self.assertTrue(numpy.allclose(numpy.array(new_all_results[1])[2:], numpy.array(all_results[1])[2:]))
+
+
+class TestWarmStartGridSearch(TestcaseBase):
+    def runTest(self):
+        grid_search = self.get_grid_search()
+        best_params, all_results = grid_search.train_warm_start(compare_cold_start=True)
+        self.assertIn(best_params, grid_search.get_all_combinations())
+        # Sorted by n_factors, then by decreasing _lambda, every combination starts from the previous one.
+        self.assertEqual([row[:2] for row in all_results[1:]], [[10, 0.1], [10, 0.0001], [20, 0.1], [20, 0.0001]])
+        self.assertEqual([row[-3] for row in all_results[1:]],
+                         ['', '_lambda:0.1,n_factors:10', '_lambda:0.1,n_factors:10', '_lambda:0.1,n_factors:20'])
+        for row in all_results[1:]:
+            self.assertTrue(0 < row[-2] <= self.n_iterations)
+            self.assertTrue(0 < row[-1] <= self.n_iterations)
+        self.assertIsNone(grid_search.recommender.warm_start)
+        self.assertEqual(grid_search.recommender._convergence_tolerance, 0.0)
+        self.assertEqual(GridSearch.get_closest_combination({'n_factors': 10, '_lambda': 0.01}, []), None)
+
+
+class TestBayesianSearch(TestcaseBase):
+    def runTest(self):
+        # The surrogate interpolates the observations, and is uncertain away from them.
+        X = numpy.linspace(0, 1, 5)[:, numpy.newaxis]
+        y = numpy.sin(3 * X[:, 0])
+        gp = GaussianProcess().fit(X, y)
+        mean, std = gp.predict(X)
+        self.assertTrue(numpy.allclose(mean, y, atol=1e-3))
+        self.assertTrue(numpy.all(std < 1e-2))
+        self.assertTrue(numpy.all(gp.expected_improvement(numpy.array([[0.1], [0.6], [2.0]]), y.max()) >= 0))
+
+        grid_search = self.get_grid_search({'_lambda': [0.0001, 0.01, 0.1], 'n_factors': [5, 10, 20]})
+        features = grid_search.get_combination_features(grid_search.get_all_combinations())
+        self.assertEqual(features.shape, (9, 2))
+        self.assertEqual(sorted(set(features[:, 0])), [0.0, 0.5, 1.0])
+        best_params, all_results = grid_search.train_bayesian(n_trials=5, n_initial=2, batch_size=2,
+                                                              random_state=numpy.random.RandomState(0))
+        self.assertEqual(len(all_results), 6)
+        evaluated = [tuple(row[:2]) for row in all_results[1:]]
+        self.assertEqual(len(set(evaluated)), 5)
+        best_recall = max(errors['test_recall'] for errors in grid_search.get_all_errors().values())
+        self.assertEqual(grid_search.get_all_errors()[grid_search.get_key(best_params)]['test_recall'], best_recall)
+
+        # A batch of suggestions does not suggest the same combination twice.
+        suggestions = GridSearch.suggest_combinations(features, [0, 8], [0.2, 0.5], list(range(1, 8)), 3)
+        self.assertEqual(len(set(suggestions)), 3)
+        self.assertTrue(set(suggestions) <= set(range(1, 8)))
+        grid_search = self.get_grid_search({'content': ['LDA', 'TFIDF', 'LDA'], 'n_factors': [5]})
+        features = grid_search.get_combination_features([{'content': 'TFIDF', 'n_factors': 5}])
+        self.assertEqual(features.tolist(), [[0.0, 1.0, 0.0]])
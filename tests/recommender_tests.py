@@ -1,17 +1,26 @@
 #!/usr/bin/env python
+import csv
 import itertools
 import json
 import numpy
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 from lib.abstract_recommender import AbstractRecommender
 from lib.content_based import ContentBased
 from lib.collaborative_filtering import CollaborativeFiltering
 from lib.evaluator import Evaluator
+from lib.recommender_registry import RecommenderRegistry
 from lib.recommender_system import RecommenderSystem
+from runnables import RunnableRecommenders
 from util.abstracts_preprocessor import AbstractsPreprocessor
+from util.component_cache import ComponentCache
 from util.data_parser import DataParser
 from util.model_initializer import ModelInitializer
+from util.results_store import ResultsStore
 
 
 class TestcaseBase(unittest.TestCase):
@@ -90,3 +99,147 @@ class TestRecommenderSystem(TestcaseBase):
         self.assertEqual(rec_system.content_based.n_items, self.documents)
         self.assertEqual(rec_system.content_based.n_factors, n_factors)
         rec_system.train()
+
+
+class TestComponentCache(TestcaseBase):
+    def runTest(self):
+        component_cache = ComponentCache()
+        results = []
+        for recommender in ['itembased', 'userbased', 'hybrid', 'userbased']:
+            config = {'recommender': {'desc': 'TFIDF', 'content-based': 'TFIDF', 'error-metric': 'RMS',
+                                      'collaborative-filtering': 'None' if recommender == 'itembased' else 'ALS',
+                                      'recommender': recommender, 'hyperparameters': {'_lambda': 0.01, 'n_factors': 5},
+                                      'options': {'n_iterations': 3, 'k_folds': 2}}}
+            rec_system = RecommenderSystem(abstracts_preprocessor=self.abstracts_preprocessor,
+                                           ratings=self.ratings_matrix, config=config, load_matrices=False,
+                                           dump_matrices=False, train_more=False, component_cache=component_cache)
+            results.append(rec_system.train())
+        # The document distribution is computed by the first run and reused by the others. The factors of the two
+        # folds of the userbased and the hybrid runs are trained, and reused by the last run.
+        self.assertEqual(component_cache.misses, 1 + 4 + 4)
+        self.assertEqual(component_cache.hits, 3 + 4)
+        self.assertTrue(numpy.allclose(results[1], results[3]))
+        self.assertFalse(rec_system.collaborative_filtering.user_vecs.flags.writeable)
+        # The factors of random splits are not cached, and are not loaded.
+        rec_system = RecommenderSystem(abstracts_preprocessor=self.abstracts_preprocessor, ratings=self.ratings_matrix,
+                                       config=config, load_matrices=False, dump_matrices=False, train_more=False,
+                                       random_seed=True, component_cache=component_cache)
+        self.assertIsNone(rec_system.collaborative_initializer.component_cache)
+        self.assertFalse(rec_system.collaborative_filtering._load_matrices)
+
+
+class TestRunConfigs(TestcaseBase):
+    def get_configs(self):
+        """
+        :returns: The configurations of a small experiment, whose runs share two content models.
+        :rtype: list[dict]
+        """
+        configs = []
+        for recommender, n_factors in [('itembased', 5), ('userbased', 5), ('hybrid', 5), ('userbased', 4)]:
+            configs.append({'recommender': {'desc': '%s %d' % (recommender, n_factors), 'content-based': 'TFIDF',
+                                            'collaborative-filtering': 'None' if recommender == 'itembased' else 'ALS',
+                                            'error-metric': 'RMS', 'recommender': recommender,
+                                            'hyperparameters': {'_lambda': 0.01, 'n_factors': n_factors},
+                                            'options': {'n_iterations': 3, 'k_folds': 2}}})
+        return configs
+
+    def get_runnable(self, directory, **kwargs):
+        """
+        :param str directory: The directory of the results store and of the results of the experiment.
+        :returns: A runnable on the sample data, that does not load or save the matrices.
+        :rtype: RunnableRecommenders
+        """
+        runnable = RunnableRecommenders(use_database=False, verbose=False, load_matrices=False, dump=False,
+                                        train_more=False, **kwargs)
+        runnable.results_store = ResultsStore(os.path.join(directory, 'results_store.jsonl'), code_version='test')
+        runnable.experiment_results_path = os.path.join(directory, 'experiment_results.csv')
+        return runnable
+
+    def get_results(self, runnable):
+        """
+        :param RunnableRecommenders runnable: A runnable that dumped the results of an experiment.
+        :returns: The rows of the dumped results.
+        :rtype: list[list[str]]
+        """
+        with open(runnable.experiment_results_path) as results_file:
+            return list(csv.reader(results_file))
+
+    def runTest(self):
+        configs = self.get_configs()
+        runnables = []
+        rows = []
+        for n_jobs in [1, 2]:
+            directory = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, directory)
+            runnable = self.get_runnable(directory, n_jobs=n_jobs)
+            if n_jobs > 1:
+                # The content models are pinned for the runs that depend on them, even if the cache is full.
+                runnable.component_cache.max_components = 1
+            runnable.run_configs(configs)
+            rows.append(self.get_results(runnable))
+            runnables.append(runnable)
+        serial, parallel = runnables
+        self.assertEqual(len(rows[0]), len(configs) + 1)
+        self.assertEqual(rows[0], rows[1])
+        # The two content models are trained once by their stages, and loaded by all the runs.
+        self.assertEqual(parallel.component_cache.misses, serial.component_cache.misses)
+        self.assertEqual(parallel.component_cache.hits, serial.component_cache.hits + 2)
+        self.assertEqual(len(parallel.component_cache.pinned), 0)
+
+
+class TestMergeExperimentResults(TestRunConfigs):
+    def runTest(self):
+        configs = self.get_configs()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        serial = self.get_runnable(directory)
+        serial.run_configs(configs)
+        expected_rows = self.get_results(serial)
+        # The shards share a results store, and only the merge dumps the results.
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for shard_idx in range(2):
+            shard = self.get_runnable(directory, shard=(shard_idx, 2))
+            shard.run_configs(configs)
+            self.assertFalse(os.path.exists(shard.experiment_results_path))
+        merge = self.get_runnable(directory)
+        merge.merge_experiment_results(configs)
+        self.assertEqual(self.get_results(merge), expected_rows)
+        # The keys of the runs do not depend on the hash seed, the shards can run in different processes.
+        base_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        fingerprints = set()
+        for hash_seed in ['1', '2']:
+            output = subprocess.check_output(
+                [sys.executable, '-c', "from runnables import RunnableRecommenders; r = RunnableRecommenders("
+                 "use_database=False, verbose=False); print(r.component_cache.get_data_fingerprint("
+                 "r.ratings, r.abstracts_preprocessor))"], cwd=base_dir,
+                env=dict(os.environ, PYTHONHASHSEED=hash_seed))
+            fingerprints.add(output.decode('utf-8').strip().splitlines()[-1])
+        self.assertEqual(len(fingerprints), 1)
+
+
+class TestLoadConfig(TestcaseBase):
+    def runTest(self):
+        runnable = RunnableRecommenders(use_database=False, verbose=False)
+        options = runnable.options.copy()
+        # The grid search of an experiment changes the configuration, the daemon loads it again before the next job.
+        runnable.config.set_iterations(options['n_iterations'] + 1)
+        runnable.config.set_folds_num(options['k_folds'] + 1)
+        self.assertNotEqual(runnable.options, options)
+        runnable.load_config()
+        self.assertEqual(runnable.options, options)
+        self.assertEqual(runnable.initializer.config['n_iterations'], options['n_iterations'])
+
+
+class TestRecommenderRegistry(TestcaseBase):
+    def runTest(self):
+        self.assertIs(RecommenderRegistry.get_content_based('None'), ContentBased)
+        self.assertIs(RecommenderRegistry.get_collaborative_filtering('ALS'), CollaborativeFiltering)
+        self.assertRaises(NameError, RecommenderRegistry.get_content_based, 'Missing')
+        self.assertRaises(NameError, RecommenderRegistry.get_collaborative_filtering, 'LDA')
+        # The heavy frameworks are not imported until a configuration selects them.
+        base_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        imported = subprocess.check_output(
+            [sys.executable, '-c', "import sys, runnables; print(sorted(set(sys.modules) & "
+             "{'chainer', 'keras', 'tensorflow', 'lib.LDA2Vec', 'lib.SDAE', 'lib.LDA', 'sklearn'}))"], cwd=base_dir)
+        self.assertEqual(imported.decode('utf-8').strip().splitlines()[-1], '[]')
@@ -1,15 +1,29 @@
 #!/usr/bin/env python
+import io
 import itertools
 import json
+import multiprocessing
 import numpy
 import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 from scipy import sparse
 from util.data_parser import DataParser
+from util.experiment_planner import ExperimentPlanner
+from util.import_pipeline import ImportPipeline
+from util.interactions_loader import IdMap, InteractionsLoader
 from util.recommender_configuer import RecommenderConfiguration
 from util.abstracts_preprocessor import AbstractsPreprocessor
+from util.batch_prefetcher import BatchPrefetcher
+from util.component_cache import ComponentCache
 from util.model_initializer import ModelInitializer
+from util.recommender_daemon import RecommenderClient, RecommenderDaemon
+from util.results_store import ResultsStore
 from util.runs_loader import RunsLoader
+from util.work_queue import WorkQueue
 
 
 class TestcaseBase(unittest.TestCase):
@@ -105,6 +119,16 @@ class TestAbstractsPreprocessor(TestcaseBase):
         self.assertTrue(isinstance(self.abstracts_preprocessor.get_term_frequency_sparse_matrix(), sparse.csr_matrix))
         self.assertEqual(max(map(lambda inp: len(inp.split(' ')), self.abstracts_preprocessor.abstracts.values())),
                          self.abstracts_preprocessor.get_num_units())
+        term_frequency = self.abstracts_preprocessor.get_term_frequency_sparse_matrix()
+        self.assertTrue(term_frequency is self.abstracts_preprocessor.get_term_frequency_sparse_matrix())
+        self.assertFalse(term_frequency.data.flags.writeable)
+        self.assertEqual(term_frequency.sum(), sum(map(lambda inp: inp[2], self.article_to_word_to_count)))
+        article_ids, word_ids = self.abstracts_preprocessor.get_article_word_arrays()
+        self.assertEqual(article_ids.dtype, numpy.int32)
+        self.assertFalse(word_ids.flags.writeable)
+        self.assertEqual(list(zip(article_ids, word_ids)), self.article_to_word)
+        term_frequencies = self.abstracts_preprocessor.get_term_frequencies()
+        self.assertEqual(term_frequencies.sum(), sum(map(lambda inp: inp[1], self.word_to_count)))
 
 
 class TestModelInitializer(TestcaseBase):
@@ -122,3 +146,461 @@ class TestModelInitializer(TestcaseBase):
         loaded, loaded_matrix = initializer.load_matrix(config, 'user_v', matrix_shape)
         self.assertTrue(loaded)
         self.assertTrue(numpy.alltrue(loaded_matrix == users_mat))
+
+
+class TestSparseModelInitializer(TestcaseBase):
+    def runTest(self):
+        config = {'n_factors': 5, '_lambda': 0.01}
+        initializer = ModelInitializer(config.copy(), 1)
+        matrix = sparse.random(self.documents, self.documents, density=0.3, format='csr')
+        initializer.save_sparse_matrix(matrix, 'item_neighbours_test')
+        path = initializer._create_path('item_neighbours_test', matrix.shape, extension='.npz')
+        self.assertTrue(os.path.isfile(path))
+        loaded, loaded_matrix = initializer.load_sparse_matrix(config, 'item_neighbours_test', matrix.shape)
+        self.assertTrue(loaded)
+        self.assertEqual((loaded_matrix != matrix).nnz, 0)
+        os.remove(path)
+        loaded, loaded_matrix = initializer.load_sparse_matrix(config, 'item_neighbours_test', matrix.shape)
+        self.assertFalse(loaded)
+        self.assertIsNone(loaded_matrix)
+
+
+class TestImportPipeline(TestcaseBase):
+    def runTest(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        with open(os.path.join(data_dir, 'users.dat'), 'w') as f:
+            f.write('2 0 3\n1 2\n3 1 2 3\n')
+        with open(os.path.join(data_dir, 'citations.dat'), 'w') as f:
+            f.write('1 2\n0\n2 1 2\n')
+
+        def mock_get_data_path(file_name):
+            return os.path.join(data_dir, file_name)
+
+        def mock_get_dataset():
+            return 'citeulike-a'
+
+        for name, mock in [("get_data_path", mock_get_data_path), ("get_dataset", mock_get_dataset)]:
+            self.addCleanup(setattr, DataParser, name, DataParser.__dict__[name])
+            setattr(DataParser, name, mock)
+        self.assertEqual(list(DataParser.parse_citations()),
+                         [('citations', (1, '2')), ('citations', (3, '1')), ('citations', (3, '2'))])
+
+        inserted = []
+        lock = threading.Lock()
+
+        class MockCursor(object):
+            def executemany(self, statement, rows):
+                with lock:
+                    inserted.append((statement, list(rows)))
+
+            def close(self):
+                pass
+
+        class MockConnection(object):
+            def cursor(self):
+                return MockCursor()
+
+            def commit(self):
+                pass
+
+            def close(self):
+                pass
+
+        statements = DataParser.get_insert_statements()
+        pipeline = ImportPipeline(MockConnection, batch_size=2, queue_size=1, n_writers=2)
+        pipeline.add_source(DataParser.parse_users, {'users': statements['users'],
+                                                     'articles_users': statements['articles_users']})
+        pipeline.add_source(DataParser.parse_citations, {'citations': statements['citations']})
+        row_counts = pipeline.run()
+        self.assertEqual(row_counts, {'users': 3, 'articles_users': 6, 'citations': 3})
+        self.assertTrue(all(len(rows) <= 2 for statement, rows in inserted))
+        user_articles = sorted(row for statement, rows in inserted if statement == statements['articles_users']
+                               for row in rows)
+        self.assertEqual(user_articles, [(1, 1), (1, 4), (2, 3), (3, 2), (3, 3), (3, 4)])
+
+        def failing_parser():
+            yield 'users', (1,)
+            raise ValueError("Corrupted line")
+
+        pipeline = ImportPipeline(MockConnection, batch_size=1, queue_size=1)
+        pipeline.add_source(failing_parser, {'users': statements['users']})
+        self.assertRaises(ValueError, pipeline.run)
+
+
+class TestCreateIndexes(TestcaseBase):
+    def runTest(self):
+        class MockCursor(object):
+            def __init__(self, existing_indexes):
+                self.existing_indexes = existing_indexes
+                self.statements = []
+
+            def execute(self, statement, params=None):
+                self.statements.append(statement)
+
+            def fetchall(self):
+                return self.existing_indexes
+
+        self.addCleanup(setattr, DataParser, "get_config", DataParser.__dict__["get_config"])
+        setattr(DataParser, "get_config", lambda: {'database': {'database_name': 'test'}})
+        cursor = MockCursor([('words_articles', 'PRIMARY')])
+        DataParser.create_indexes(cursor)
+        created = [statement for statement in cursor.statements if statement.startswith('create index')]
+        self.assertEqual(len(created), 4)
+        # Importing again in the same schema only creates the missing indexes.
+        existing_indexes = [(statement.split(' on ')[1].split('(')[0], statement.split(' ')[2])
+                            for statement in created[1:]]
+        cursor = MockCursor(existing_indexes)
+        DataParser.create_indexes(cursor)
+        self.assertEqual([statement for statement in cursor.statements if statement.startswith('create index')],
+                         created[:1])
+
+
+class TestInteractionsLoader(TestcaseBase):
+    def runTest(self):
+        id_map = IdMap()
+        self.assertEqual(list(id_map.map([30, 10, 30, 20])), [0, 1, 0, 2])
+        self.assertEqual(list(id_map.map([20, 40, 10])), [2, 3, 1])
+        self.assertEqual(list(id_map.map([50, 40], add=False)), [-1, 3])
+        self.assertEqual(list(id_map.get_external_ids()), [30, 10, 20, 40])
+        self.assertEqual(list(IdMap.from_external_ids([5, 3, 4]).map([3, 4, 5])), [1, 2, 0])
+
+        data_dir = tempfile.mkdtemp()
+        path = os.path.join(data_dir, 'users.dat')
+        with open(path, 'w') as f:
+            for user in range(self.users):
+                articles = [article for article in range(self.documents) if self.ratings_matrix[user, article]]
+                # Duplicated interactions are counted once.
+                articles.append(articles[0])
+                f.write('%d %s\n' % (len(articles), ' '.join(map(str, articles))))
+        loader = InteractionsLoader(chunk_size=3, buffer_size=5, item_map=IdMap.from_external_ids(
+            range(self.documents)))
+        ratings = loader.ingest(loader.read_libraries_file(path))
+        self.assertTrue(isinstance(ratings, sparse.csr_matrix))
+        self.assertTrue(numpy.all(ratings.toarray() == self.ratings_matrix))
+
+        loader.save(data_dir)
+        loaded = InteractionsLoader.load(data_dir, chunk_size=2, buffer_size=2)
+        self.assertTrue(numpy.all(loaded.get_ratings().toarray() == self.ratings_matrix))
+        pairs_path = os.path.join(data_dir, 'pairs.txt')
+        with open(pairs_path, 'w') as f:
+            f.write('100 2\n0 0\n100 7\n')
+        ratings = loaded.ingest(loaded.read_pairs_file(pairs_path))
+        self.assertEqual(ratings.shape, (self.users + 1, self.documents))
+        self.assertEqual(ratings.nnz, self.ratings_matrix.sum() + 2)
+        self.assertEqual(list(loaded.user_map.map([100])), [self.users])
+        # An interaction that is duplicated 256 times in a buffer is not lost.
+        loader = InteractionsLoader(buffer_size=512)
+        ratings = loader.ingest([(numpy.full(256, 7), numpy.full(256, 3))])
+        self.assertEqual(ratings.nnz, 1)
+        ratings = loader.ingest([(numpy.full(300, 7), numpy.full(300, 3))])
+        self.assertEqual(ratings.nnz, 1)
+        self.assertEqual(ratings.data.tolist(), [1])
+
+
+class TestVocabularySelection(TestcaseBase):
+    def runTest(self):
+        n_vocab = self.abstracts_preprocessor.get_num_vocab()
+        self.assertTrue(self.abstracts_preprocessor.select_vocabulary() is self.abstracts_preprocessor)
+        self.assertEqual(self.abstracts_preprocessor.get_vocabulary_key(), '')
+        # A word of no document is only removed if the vocabulary is pruned.
+        preprocessor = AbstractsPreprocessor(self.abstracts, self.word_to_count + [(n_vocab, 0)], self.article_to_word,
+                                             self.article_to_word_to_count)
+        self.assertIs(preprocessor.select_vocabulary(), preprocessor)
+        self.assertEqual(preprocessor.select_vocabulary(min_df=1).get_num_vocab(), n_vocab)
+        pruned = self.abstracts_preprocessor.select_vocabulary(min_df=2)
+        document_frequencies = self.abstracts_preprocessor.get_document_frequencies()
+        self.assertEqual(pruned.get_num_vocab(), (document_frequencies >= 2).sum())
+        self.assertEqual(pruned.get_num_items(), self.documents)
+        mapping = pruned.get_vocabulary_mapping()
+        self.assertEqual(mapping.shape, (n_vocab,))
+        self.assertTrue(numpy.all((mapping >= 0) == (document_frequencies >= 2)))
+        term_frequency = self.abstracts_preprocessor.get_term_frequency_sparse_matrix().toarray()
+        self.assertTrue(numpy.all(pruned.get_term_frequency_sparse_matrix().toarray() ==
+                                  term_frequency[:, document_frequencies >= 2]))
+        article_ids, word_ids = pruned.get_article_word_arrays()
+        self.assertTrue(word_ids.max() < pruned.get_num_vocab())
+        self.assertNotEqual(pruned.get_vocabulary_key(), '')
+
+        top = self.abstracts_preprocessor.select_vocabulary(max_features=3)
+        self.assertEqual(top.get_num_vocab(), 3)
+        self.assertEqual(sorted(top.get_term_frequencies()),
+                         sorted(self.abstracts_preprocessor.get_term_frequencies())[-3:])
+
+        hashed = self.abstracts_preprocessor.select_vocabulary(n_hashed_features=4)
+        self.assertEqual(hashed.get_num_vocab(), 4)
+        self.assertEqual(hashed.get_term_frequency_sparse_matrix().shape, (self.documents, 4))
+        self.assertTrue(numpy.all(hashed.get_term_frequency_sparse_matrix().sum(axis=1) ==
+                                  term_frequency.sum(axis=1, keepdims=True)))
+        self.assertEqual(hashed.get_term_frequencies().sum(), self.abstracts_preprocessor.get_term_frequencies().sum())
+
+
+class TestBatchPrefetcher(TestcaseBase):
+    def runTest(self):
+        features = numpy.arange(30, dtype=numpy.float64).reshape((10, 3))
+        term_freq = sparse.random(10, 6, density=0.4, format='csr', dtype=numpy.float64)
+        prefetcher = BatchPrefetcher([features, term_freq], 4, queue_size=1)
+        self.assertEqual(len(prefetcher), 3)
+        batches = [(inputs.copy(), dense.copy()) for inputs, dense in prefetcher]
+        self.assertEqual([len(inputs) for inputs, dense in batches], [4, 4, 2])
+        self.assertTrue(numpy.array_equal(numpy.vstack([inputs for inputs, dense in batches]), features))
+        self.assertTrue(numpy.allclose(numpy.vstack([dense for inputs, dense in batches]), term_freq.toarray()))
+
+        # The shuffled rows stay aligned, and every row is produced once.
+        shuffled = BatchPrefetcher([features, numpy.arange(10)], 3, shuffle=True,
+                                   random_state=numpy.random.RandomState(0))
+        rows = []
+        for inputs, ids in shuffled:
+            self.assertTrue(numpy.array_equal(inputs, features[ids]))
+            rows.extend(ids.tolist())
+        self.assertEqual(sorted(rows), list(range(10)))
+
+        # Sparse batches, and stopping early does not block the producer.
+        sparse_batches = BatchPrefetcher([term_freq], 2, densify=False)
+        for batch, in sparse_batches:
+            self.assertTrue(sparse.issparse(batch))
+            break
+        self.assertEqual(sum(batch.shape[0] for batch, in sparse_batches), 10)
+
+
+class TestResultsStore(TestcaseBase):
+    def runTest(self):
+        path = os.path.join(tempfile.mkdtemp(), 'results_store.jsonl')
+        store = ResultsStore(path, code_version='test')
+        fingerprint = store.get_data_fingerprint(self.ratings_matrix, self.abstracts_preprocessor)
+        self.assertEqual(fingerprint, store.get_data_fingerprint(sparse.csr_matrix(self.ratings_matrix),
+                                                                 self.abstracts_preprocessor))
+        self.assertNotEqual(fingerprint, store.get_data_fingerprint(1 - self.ratings_matrix,
+                                                                    self.abstracts_preprocessor))
+        config = {'n_factors': 5, '_lambda': 0.01}
+        key = store.get_key(config, fingerprint, 42)
+        self.assertEqual(key, store.get_key({'_lambda': 0.01, 'n_factors': 5}, fingerprint, 42))
+        self.assertNotEqual(key, store.get_key(config, fingerprint, 43))
+        self.assertNotEqual(key, ResultsStore(path, code_version='other').get_key(config, fingerprint, 42))
+        self.assertIsNone(store.get(key))
+        store.add(key, [5, 0.01, numpy.float32(0.5)], config)
+        self.assertEqual(store.get(key), [5, 0.01, 0.5])
+
+        # The results are reloaded, a truncated last line is ignored.
+        with open(path, 'a') as store_file:
+            store_file.write('{"key": "trunc')
+        self.assertEqual(ResultsStore(path, code_version='test').get(key), [5, 0.01, 0.5])
+        self.assertIsNone(ResultsStore(path, code_version='test', force=True).get(key))
+
+
+class TestComponentCache(TestcaseBase):
+    def runTest(self):
+        component_cache = ComponentCache()
+        fingerprint = component_cache.get_data_fingerprint(self.ratings_matrix, self.abstracts_preprocessor)
+        self.assertEqual(fingerprint, component_cache.get_data_fingerprint(self.ratings_matrix,
+                                                                           self.abstracts_preprocessor))
+        config = {'n_factors': 5, '_lambda': 0.01}
+        initializer = ModelInitializer(config.copy(), 1)
+        # Nothing is loaded from or saved to the files.
+        initializer.set_component_cache(component_cache, (fingerprint,), load_files=False, dump_files=False)
+        initializer.folder = os.path.join('matrices', 'missing')
+        matrix = numpy.random.random((self.users, 5))
+        shape = matrix.shape
+        found, _ = initializer.load_matrix(config, 'cached_matrix', shape)
+        self.assertFalse(found)
+        initializer.save_matrix(matrix, 'cached_matrix')
+        initializer.save_model({'model': 1}, 'cached_model', shape)
+        self.assertEqual(len(component_cache), 2)
+        found, cached = initializer.load_matrix(config, 'cached_matrix', shape)
+        self.assertTrue(found)
+        self.assertTrue(numpy.array_equal(cached, matrix))
+        self.assertFalse(cached.flags.writeable)
+        # The cached matrix is shared, and not changed by its owner.
+        matrix[0, 0] = -1
+        self.assertIs(initializer.load_matrix(config, 'cached_matrix', shape)[1], cached)
+        self.assertNotEqual(cached[0, 0], -1)
+        self.assertEqual(initializer.load_model(config, 'cached_model', shape), (True, {'model': 1}))
+        self.assertEqual((component_cache.hits, component_cache.misses), (3, 1))
+        other = ModelInitializer(config.copy(), 1)
+        other.set_component_cache(component_cache, ('other',), load_files=False, dump_files=False)
+        self.assertFalse(other.load_matrix(config, 'cached_matrix', shape)[0])
+        # The least recently used component is evicted from a full cache.
+        component_cache = ComponentCache(max_components=2)
+        component_cache.put('first', 1)
+        component_cache.put('second', 2)
+        component_cache.get('first')
+        component_cache.put('third', 3)
+        self.assertEqual(list(component_cache.components), ['first', 'third'])
+        # The components of a pinned namespace are not evicted until it is unpinned.
+        component_cache.pin(('content',))
+        component_cache.put((('content',), 'model'), 4)
+        component_cache.put('fourth', 5)
+        component_cache.put('fifth', 6)
+        self.assertEqual(list(component_cache.components), [(('content',), 'model'), 'fifth'])
+        component_cache.unpin(('content',))
+        component_cache.put('sixth', 7)
+        self.assertEqual(list(component_cache.components), ['fifth', 'sixth'])
+        # The threads of an experiment share the cache.
+        component_cache = ComponentCache(max_components=8)
+
+        def use_cache(thread_idx):
+            for component_idx in range(200):
+                component_cache.put((thread_idx, component_idx % 16), component_idx)
+                component_cache.get((thread_idx, (component_idx + 1) % 16))
+
+        threads = [threading.Thread(target=use_cache, args=(thread_idx,)) for thread_idx in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(component_cache), 8)
+        self.assertEqual(component_cache.hits + component_cache.misses, 4 * 200)
+
+
+class TestExperimentPlanner(TestcaseBase):
+    def runTest(self):
+        lock = threading.Lock()
+        calls = []
+        running = [0, 0]
+
+        def stage(name, duration):
+            def run():
+                with lock:
+                    calls.append(name)
+                    running[0] += 1
+                    running[1] = max(running)
+                threading.Event().wait(duration)
+                with lock:
+                    running[0] -= 1
+                return name
+            return run
+
+        planner = ExperimentPlanner(n_jobs=3, verbose=False)
+        planner.add_stage(('load',), stage('load', 0.01))
+        planner.add_stage(('content',), stage('content', 0.05), [('load',)])
+        # A stage with a known key is only added once.
+        planner.add_stage(('content',), stage('duplicate', 0.01), [('load',)])
+        for run_idx in range(3):
+            planner.add_stage(('run', run_idx), stage('run %d' % run_idx, 0.05 * (run_idx + 1)),
+                              [('load',), ('content',)])
+        results = planner.run()
+        self.assertEqual(results[('run', 2)], 'run 2')
+        self.assertEqual(calls[:2], ['load', 'content'])
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(running[1], 3)
+        path, duration = planner.get_critical_path()
+        self.assertEqual(path, [('load',), ('content',), ('run', 2)])
+        self.assertGreaterEqual(duration, 0.2)
+        self.assertRaises(ValueError, planner.add_stage, ('other',), stage('other', 0), [('missing',)])
+
+        # The stages run one by one in a budget that only fits one of them, a larger stage still runs.
+        running[1] = 0
+        planner = ExperimentPlanner(n_jobs=3, memory_budget=100, verbose=False)
+        for run_idx in range(3):
+            planner.add_stage(('run', run_idx), stage('run', 0.01), memory=60 + run_idx * 30)
+        planner.run()
+        self.assertEqual(running[1], 1)
+        self.assertEqual(planner.peak_memory, 120)
+
+        # An error stops the stages that did not start, and is raised.
+        def fail():
+            raise RuntimeError("failed stage")
+        del calls[:]
+        planner = ExperimentPlanner(n_jobs=1, verbose=False)
+        planner.add_stage(('fail',), fail)
+        planner.add_stage(('after',), stage('after', 0), [('fail',)])
+        self.assertRaises(RuntimeError, planner.run)
+        self.assertEqual(calls, [])
+        # -1 jobs use all the cores.
+        self.assertEqual(ExperimentPlanner(n_jobs=-1, verbose=False).n_jobs, multiprocessing.cpu_count())
+
+
+class TestWorkQueue(TestcaseBase):
+    def runTest(self):
+        directory = tempfile.mkdtemp()
+        store_path = os.path.join(directory, 'results_store.jsonl')
+        queue = WorkQueue(os.path.join(directory, 'queue'), lease_seconds=0.5, worker_id='main')
+        for task in range(12):
+            queue.add('%02d' % task, {'value': task})
+        queue.add('00', {'value': -1})
+        self.assertEqual(len(queue.get_task_ids()), 12)
+        self.assertEqual(queue.get_task('00'), {'value': 0})
+
+        # A worker that dies holding a lease, its task is claimed again after the lease expires.
+        self.assertEqual(queue.claim(), ('00', {'value': 0}))
+        self.assertTrue(queue.renew('00'))
+        other = WorkQueue(queue.directory, worker_id='other')
+        self.assertEqual(other.claim(), ('01', {'value': 1}))
+        other.release('01')
+
+        def work(worker_id):
+            worker_queue = WorkQueue(queue.directory, lease_seconds=0.5, worker_id=worker_id)
+            store = ResultsStore(store_path, code_version='test')
+
+            def run_task(task_id, task):
+                time.sleep(0.05)
+                store.add(task_id, [task['value'] * 2, worker_id])
+
+            worker_queue.process(run_task, poll_seconds=0.1)
+
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=work, args=('worker%d' % index,)) for index in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertTrue(all(worker.exitcode == 0 for worker in workers))
+        self.assertEqual(queue.get_pending_task_ids(), [])
+        self.assertFalse(queue.renew('00'))
+        results = ResultsStore(store_path, code_version='test').results
+        self.assertEqual(sorted(results), queue.get_task_ids())
+        self.assertTrue(all(results['%02d' % task][0] == task * 2 for task in range(12)))
+        self.assertGreater(len(set(worker_id for value, worker_id in results.values())), 1)
+        self.assertIsNone(queue.claim())
+
+
+class TestRecommenderDaemon(TestcaseBase):
+    def runTest(self):
+        class Runnable(object):
+            def __init__(self):
+                self.verbose = False
+                self.n_runs = 0
+                self.load_config()
+
+            def load_config(self):
+                self.options = {'n_iterations': 10}
+
+            def run(self):
+                self.n_runs += 1
+                print("run %d, verbose %s, %d iterations" % (self.n_runs, self.verbose, self.options['n_iterations']))
+
+            def tune(self):
+                self.options['n_iterations'] = 5
+                self.run()
+
+            def fail(self):
+                raise RuntimeError("failed job")
+
+        runnable = Runnable()
+        socket_path = os.path.join(tempfile.mkdtemp(), 'daemon.sock')
+        daemon = RecommenderDaemon(runnable, socket_path, {'run': 'run', 'tune': 'tune', 'fail': 'fail'}, ['verbose'],
+                                   'load_config')
+        server_thread = threading.Thread(target=daemon.serve)
+        # A failed assertion does not keep the tests waiting for the daemon.
+        server_thread.daemon = True
+        server_thread.start()
+        client = RecommenderClient(socket_path)
+        while not client.is_alive():
+            time.sleep(0.01)
+
+        # The runnable is kept between the jobs, the options of a job are restored after it, and the configuration
+        # that a job changes is loaded again before the next job.
+        output = io.StringIO()
+        self.assertIsNone(client.submit('tune', {'verbose': True}, output))
+        self.assertIsNone(client.submit('run', {}, output))
+        self.assertEqual(output.getvalue(), "run 1, verbose True, 5 iterations\nrun 2, verbose False, 10 iterations\n")
+        self.assertEqual(client.submit('fail', output=output), "RuntimeError: failed job")
+        self.assertTrue(client.submit('missing', output=output).startswith("ValueError"))
+        self.assertTrue(client.submit('run', {'n_runs': 0}, output).startswith("ValueError"))
+        self.assertEqual(runnable.n_runs, 2)
+        self.assertRaises(RuntimeError, RecommenderDaemon(runnable, socket_path, {}).serve)
+
+        self.assertIsNone(client.submit('shutdown', output=output))
+        server_thread.join()
+        self.assertFalse(os.path.exists(socket_path))
+        self.assertFalse(client.is_alive())
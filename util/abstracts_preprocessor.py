@@ -2,6 +2,7 @@
 """
 Module to preprocess abstracts.
 """
+import copy
 import numpy
 from scipy import sparse
 
@@ -9,6 +10,8 @@ from scipy import sparse
 class AbstractsPreprocessor(object):
     """
     A class that computes necessary preprocessing for abstracts and query them.
+    The word distributions are held in int32 arrays, and all derived quantities are computed
+    once and handed out as read-only views, so that every content recommender shares them.
     """
     def __init__(self, abstracts, word_to_count, article_to_word, article_to_word_to_count):
         """
@@ -21,77 +24,233 @@ class AbstractsPreprocessor(object):
             List of (article_id, word_id, count) for the count of each word in all the abstracts.
         """
         self.abstracts = abstracts
-        self.word_to_count = word_to_count
-        self.article_to_word = article_to_word
-        self.article_to_word_to_count = article_to_word_to_count
+        self.word_ids, self.word_counts = self._to_arrays(word_to_count, 2)
+        self.article_ids, self.article_word_ids = self._to_arrays(article_to_word, 2)
+        self.tf_articles, self.tf_words, self.tf_counts = self._to_arrays(article_to_word_to_count, 3)
+        self.vocabulary_mapping = None
+        self.vocabulary_key = ''
+        self._cache = {}
+
+    @staticmethod
+    def _to_arrays(tuples, n_columns):
+        """
+        Convert a list of tuples to read-only int32 column arrays.
+
+        :param list[tuple] tuples: List of tuples of ints.
+        :param int n_columns: The length of each tuple.
+        :returns: A tuple of n_columns arrays.
+        :rtype: tuple[ndarray]
+        """
+        matrix = numpy.array(tuples, dtype=numpy.int32).reshape((-1, n_columns))
+        columns = tuple(numpy.ascontiguousarray(matrix[:, column]) for column in range(n_columns))
+        for column in columns:
+            column.flags.writeable = False
+        return columns
+
+    def _memoize(self, key, compute):
+        """
+        Compute a derived quantity only once.
+
+        :param str key: The name of the derived quantity.
+        :param callable compute: A function that computes the quantity.
+        :returns: The computed quantity.
+        """
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
 
     def get_abstracts(self):
         """
         :returns: List of abstracts.
         :rtype: list[str]
         """
-        abstracts = ['' for _ in range(self.get_num_items())]
-        for doc_id, abstract in self.abstracts.items():
-            abstracts[doc_id] = abstract
-        return abstracts
+        def compute():
+            abstracts = ['' for _ in range(self.get_num_items())]
+            for doc_id, abstract in self.abstracts.items():
+                abstracts[doc_id] = abstract
+            return abstracts
+        return list(self._memoize('abstracts', compute))
 
     def get_word_to_counts(self):
         """
         :returns: List of (word_id, word_count) pairs.
         :rtype: list[pair[int]]
         """
-        return self.word_to_count
+        return list(zip(self.word_ids.tolist(), self.word_counts.tolist()))
 
     def get_article_to_words(self):
         """
         :returns: List of (article_id, word_id) for all words in abstracts.
         :rtype: list[pair[int]]
         """
-        return self.article_to_word
+        return list(zip(self.article_ids.tolist(), self.article_word_ids.tolist()))
+
+    def get_article_word_arrays(self):
+        """
+        :returns: Read-only arrays of article ids and word ids, for all words in abstracts.
+        :rtype: tuple[ndarray]
+        """
+        return self.article_ids, self.article_word_ids
 
     def get_article_to_word_to_count(self):
         """
         :returns: List of (article_id, word_id, count) for the count of each word in all the abstracts.
         :rtype: list[triple[int]]
         """
-        return self.article_to_word_to_count
+        return list(zip(self.tf_articles.tolist(), self.tf_words.tolist(), self.tf_counts.tolist()))
 
     def get_term_frequency_sparse_matrix(self):
         """
-        :returns: Sparse matrix of documents X words, of the word count.
+        :returns: Read-only sparse matrix of documents X words, of the word count.
         :rtype: csr_matrix
         """
-        articles, words, counts = zip(*self.get_article_to_word_to_count())
-        return sparse.coo_matrix((counts, (articles, words)),
-                                 shape=(self.get_num_items(), self.get_num_vocab())).tocsr()
+        def compute():
+            matrix = sparse.coo_matrix((self.tf_counts, (self.tf_articles, self.tf_words)),
+                                       shape=(self.get_num_items(), self.get_num_vocab())).tocsr()
+            for array in (matrix.data, matrix.indices, matrix.indptr):
+                array.flags.writeable = False
+            return matrix
+        return self._memoize('term_frequency', compute)
 
     def get_num_vocab(self):
         """
         :returns: The size of the vocabulary.
         :rtype: int
         """
-        return max(map(lambda inp: inp[0], self.word_to_count)) + 1
+        return self._memoize('num_vocab', lambda: int(self.word_ids.max()) + 1)
 
     def get_num_items(self):
         """
         :returns: The number of items given.
         :rtype: int
         """
-        return max(self.abstracts.keys()) + 1
+        return self._memoize('num_items', lambda: max(self.abstracts.keys()) + 1)
 
     def get_term_frequencies(self):
         """
         :returns: The list of frequencies of words.
         :rtype: list
         """
-        counts = [0 for _ in range(self.get_num_vocab())]
-        for word_id, word_count in self.get_word_to_counts():
-            counts[word_id] = word_count
-        return numpy.array(counts)
+        def compute():
+            counts = numpy.zeros(self.get_num_vocab(), dtype=numpy.int64)
+            counts[self.word_ids] = self.word_counts
+            counts.flags.writeable = False
+            return counts
+        return self._memoize('term_frequencies', compute)
 
     def get_num_units(self):
         """
         :returns: The (maximum) number of words in each article.
         :rtype: int
         """
-        return max(map(lambda doc: len(doc.split(' ')), self.abstracts.values()))
+        return self._memoize('num_units', lambda: max(len(doc.split(' ')) for doc in self.abstracts.values()))
+
+    def get_document_frequencies(self):
+        """
+        :returns: The number of documents that contain each word.
+        :rtype: ndarray
+        """
+        def compute():
+            frequencies = numpy.bincount(self.get_term_frequency_sparse_matrix().indices,
+                                         minlength=self.get_num_vocab())
+            frequencies.flags.writeable = False
+            return frequencies
+        return self._memoize('document_frequencies', compute)
+
+    def select_vocabulary(self, min_df=None, max_df=None, max_features=None, n_hashed_features=None):
+        """
+        Prune the vocabulary and optionally hash it to a fixed width. Integer document frequencies are
+        counts of documents, and float document frequencies are proportions of the documents. If none
+        of the arguments is given, the vocabulary is not changed.
+
+        :param int|float min_df: Words that appear in fewer documents are removed, 1 by default.
+        :param int|float max_df: Words that appear in more documents are removed, 1.0 by default.
+        :param int max_features: If given, only the most frequent max_features words are kept.
+        :param int n_hashed_features: If given, the kept words are hashed to n_hashed_features buckets.
+        :returns: A preprocessor of the selected vocabulary, or this preprocessor if nothing is removed.
+        :rtype: AbstractsPreprocessor
+        """
+        if min_df is None and max_df is None and max_features is None and n_hashed_features is None:
+            return self
+        min_df = 1 if min_df is None else min_df
+        max_df = 1.0 if max_df is None else max_df
+        n_items, n_vocab = self.get_num_items(), self.get_num_vocab()
+        if isinstance(min_df, float):
+            min_df = int(numpy.ceil(min_df * n_items))
+        if isinstance(max_df, float):
+            max_df = int(numpy.floor(max_df * n_items))
+        document_frequencies = self.get_document_frequencies()
+        keep = (document_frequencies >= min_df) & (document_frequencies <= max_df)
+        if max_features is not None and keep.sum() > max_features:
+            term_frequencies = numpy.where(keep, self.get_term_frequencies(), -1)
+            top_words = numpy.argsort(-term_frequencies, kind='mergesort')[:max_features]
+            keep = numpy.zeros(n_vocab, dtype=bool)
+            keep[top_words] = True
+        key = []
+        if not keep.all():
+            key.append('mindf%s-maxdf%s' % (min_df, max_df))
+            if max_features is not None:
+                key.append('top%d' % max_features)
+        mapping = numpy.full(n_vocab, -1, dtype=numpy.int32)
+        mapping[keep] = numpy.arange(keep.sum())
+        n_features = int(keep.sum())
+        if n_hashed_features is not None:
+            # Multiplicative hashing of the kept word ids into a fixed number of buckets.
+            hashes = (numpy.arange(n_vocab, dtype=numpy.uint64) * numpy.uint64(2654435761)) % numpy.uint64(2 ** 32)
+            mapping[keep] = (hashes[keep] % numpy.uint64(n_hashed_features)).astype(numpy.int32)
+            n_features = n_hashed_features
+            key.append('hash%d' % n_hashed_features)
+        if not key:
+            return self
+        return self._remap(mapping, n_features, '_vocab-' + '-'.join(key))
+
+    def _remap(self, mapping, n_features, key):
+        """
+        Build a preprocessor where the word ids are remapped, and the words mapped to -1 are removed.
+
+        :param ndarray mapping: The new id of every word id, or -1.
+        :param int n_features: The size of the new vocabulary.
+        :param str key: A string that identifies the new vocabulary.
+        :returns: The remapped preprocessor.
+        :rtype: AbstractsPreprocessor
+        """
+        preprocessor = copy.copy(self)
+        if self.vocabulary_mapping is not None:
+            mapping = numpy.where(self.vocabulary_mapping >= 0, mapping[self.vocabulary_mapping], -1)
+            key = self.vocabulary_key + key[len('_vocab'):]
+        mapping.flags.writeable = False
+        preprocessor.vocabulary_mapping = mapping
+        preprocessor.vocabulary_key = key
+        word_counts = numpy.bincount(mapping[self.word_ids].clip(0), weights=(mapping[self.word_ids] >= 0) *
+                                     self.word_counts, minlength=n_features).astype(numpy.int32)
+        preprocessor.word_ids, preprocessor.word_counts = self._to_arrays(
+            numpy.array([word_counts.nonzero()[0], word_counts[word_counts.nonzero()]]).T, 2)
+        kept_words = mapping[self.article_word_ids] >= 0
+        preprocessor.article_ids, preprocessor.article_word_ids = self._to_arrays(
+            numpy.array([self.article_ids[kept_words], mapping[self.article_word_ids][kept_words]]).T, 2)
+        kept_words = mapping[self.tf_words] >= 0
+        # Duplicated (article, word) pairs of hashed words are summed.
+        term_frequency = sparse.coo_matrix((self.tf_counts[kept_words],
+                                            (self.tf_articles[kept_words], mapping[self.tf_words][kept_words])),
+                                           shape=(self.get_num_items(), n_features)).tocsr().tocoo()
+        preprocessor.tf_articles, preprocessor.tf_words, preprocessor.tf_counts = self._to_arrays(
+            numpy.array([term_frequency.row, term_frequency.col, term_frequency.data]).T, 3)
+        preprocessor._cache = {'num_vocab': n_features, 'num_items': self.get_num_items(),
+                               'num_units': self.get_num_units()}
+        return preprocessor
+
+    def get_vocabulary_mapping(self):
+        """
+        :returns:
+            The id of every word of the original vocabulary in the selected vocabulary, -1 for removed words.
+            None if the vocabulary was not selected.
+        :rtype: ndarray
+        """
+        return self.vocabulary_mapping
+
+    def get_vocabulary_key(self):
+        """
+        :returns: A string that identifies the selected vocabulary, empty for the original vocabulary.
+        :rtype: str
+        """
+        return self.vocabulary_key
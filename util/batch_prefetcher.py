@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+This module provides a batch iterator for training loops, where the next batches are
+prepared by a background thread while the current batch is trained on.
+"""
+import queue
+import threading
+import numpy
+from scipy import sparse
+
+
+class BatchPrefetcher(object):
+    """
+    A class that iterates over aligned mini-batches of several arrays. The batches are copied by a
+    background thread into a ring of preallocated buffers, and handed over through a bounded queue.
+    Sparse arrays are sliced by rows, and optionally densified into their buffers.
+    """
+    def __init__(self, arrays, batch_size, shuffle=False, queue_size=2, densify=True, random_state=None):
+        """
+        Constructs a batch prefetcher.
+
+        :param list arrays: ndarrays or sparse matrices, with the same number of rows.
+        :param int batch_size: The number of rows of every batch, the last batch can be smaller.
+        :param boolean shuffle: A flag for shuffling the rows at every iteration.
+        :param int queue_size: The maximum number of prepared batches waiting to be consumed.
+        :param boolean densify: A flag for converting the batches of sparse matrices to dense arrays.
+        :param RandomState random_state: The random generator of the shuffling, numpy's global one if None.
+        """
+        self.arrays = [sparse.csr_matrix(array) if sparse.issparse(array) else numpy.asarray(array)
+                       for array in arrays]
+        self.n_rows = self.arrays[0].shape[0]
+        assert all(array.shape[0] == self.n_rows for array in self.arrays)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.queue_size = queue_size
+        self.densify = densify
+        self.random_state = random_state if random_state is not None else numpy.random
+        # A buffer is only reused after the consumer moved on, the queue holds queue_size buffers,
+        # the producer fills one and the consumer holds one.
+        self.n_buffers = queue_size + 2
+        self._buffers = None
+
+    def __len__(self):
+        return (self.n_rows + self.batch_size - 1) // self.batch_size
+
+    def _allocate_buffers(self):
+        """
+        Allocate the ring of buffers of the dense (or densified) arrays.
+        """
+        self._buffers = []
+        buffer_rows = min(self.batch_size, self.n_rows)
+        for _ in range(self.n_buffers):
+            buffers = []
+            for array in self.arrays:
+                if sparse.issparse(array) and not self.densify:
+                    buffers.append(None)
+                else:
+                    buffers.append(numpy.empty((buffer_rows,) + array.shape[1:], dtype=array.dtype))
+            self._buffers.append(buffers)
+
+    def __iter__(self):
+        """
+        Iterate over the batches of one pass over the rows.
+
+        :returns: An iterator of tuples of batches, one batch of every array.
+        :rtype: generator
+        """
+        if self._buffers is None:
+            self._allocate_buffers()
+        batches = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._produce, args=(batches, stop))
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            # The consumer can stop early, then the producer must not stay blocked on the queue.
+            stop.set()
+            while thread.is_alive():
+                try:
+                    batches.get(timeout=0.01)
+                except queue.Empty:
+                    pass
+            thread.join()
+
+    def _produce(self, batches, stop):
+        """
+        Copy the batches into the buffers and put them on the queue, until all rows are produced.
+
+        :param Queue batches: The queue of the prepared batches.
+        :param Event stop: An event that is set when the consumer stopped iterating.
+        """
+        try:
+            order = self.random_state.permutation(self.n_rows) if self.shuffle else None
+            for batch_index, start in enumerate(range(0, self.n_rows, self.batch_size)):
+                if stop.is_set():
+                    return
+                end = min(self.n_rows, start + self.batch_size)
+                rows = order[start:end] if order is not None else slice(start, end)
+                buffers = self._buffers[batch_index % self.n_buffers]
+                batch = tuple(self._fill(array, rows, buffer, end - start)
+                              for array, buffer in zip(self.arrays, buffers))
+                batches.put(batch)
+            batches.put(None)
+        except Exception as e:
+            batches.put(e)
+
+    @staticmethod
+    def _fill(array, rows, buffer, n_rows):
+        """
+        Copy rows of an array into a buffer.
+
+        :param array: An ndarray or a csr_matrix.
+        :param rows: A slice or an array of the row indices.
+        :param ndarray buffer: The buffer, None for sparse batches.
+        :param int n_rows: The number of rows.
+        :returns: The batch.
+        """
+        if buffer is None:
+            return array[rows]
+        batch = buffer[:n_rows]
+        if sparse.issparse(array):
+            # Older versions of scipy add the sparse matrix to the output buffer.
+            batch[...] = 0
+            array[rows].toarray(out=batch)
+        elif isinstance(rows, slice):
+            batch[...] = array[rows]
+        else:
+            numpy.take(array, rows, axis=0, out=batch)
+        return batch
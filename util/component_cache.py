@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+This module provides an in-process cache of the trained components of the recommenders, so that the
+runs of an experiment that share a content model or collaborative filtering factors reuse them.
+"""
+import collections
+import threading
+import numpy
+from util.results_store import ResultsStore
+
+
+class ComponentCache(object):
+    """
+    A cache of matrices and models, filled and queried by the ModelInitializer of the recommenders in place
+    of, or before, their files. The cached arrays are read-only, and shared between the runs without copying.
+    The least recently used components are evicted when the cache is full, so that a long running process
+    does not keep the components of all its runs. The components of pinned namespaces are not evicted, and the
+    cache is shared by the threads of an experiment.
+    """
+    def __init__(self, max_components=256):
+        """
+        Constructs an empty component cache.
+
+        :param int max_components: The maximum number of cached components, None for no limit.
+        """
+        self.max_components = max_components
+        self.components = collections.OrderedDict()
+        self.fingerprints = []
+        self.pinned = collections.Counter()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.components)
+
+    def get_data_fingerprint(self, ratings, abstracts_preprocessor=None):
+        """
+        :param ndarray ratings: A matrix of the ratings.
+        :param AbstractsPreprocessor abstracts_preprocessor: The abstracts.
+        :returns: The fingerprint of the data, it is only computed once for the same objects.
+        :rtype: str
+        """
+        with self.lock:
+            for cached_ratings, cached_abstracts, fingerprint in self.fingerprints:
+                if cached_ratings is ratings and cached_abstracts is abstracts_preprocessor:
+                    return fingerprint
+            fingerprint = ResultsStore.get_data_fingerprint(ratings, abstracts_preprocessor)
+            # The objects are kept, so that their ids are not reused by other objects.
+            self.fingerprints.append((ratings, abstracts_preprocessor, fingerprint))
+            return fingerprint
+
+    def get(self, key):
+        """
+        :param tuple key: The key of the component.
+        :returns: A tuple of boolean (if the component is cached or not), and the component if it is cached.
+        :rtype: tuple
+        """
+        with self.lock:
+            if key in self.components:
+                self.hits += 1
+                self.components.move_to_end(key)
+                return True, self.components[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, component):
+        """
+        Cache a component, and evict the least recently used components if the cache is full. An array
+        is copied once, as its owner can keep training it in place, and the copy is read-only, so that the
+        runs that load it share it without copying.
+
+        :param tuple key: The key of the component.
+        :param object component: A matrix or a model.
+        """
+        with self.lock:
+            if self.components.get(key) is component:
+                self.components.move_to_end(key)
+                return
+            if isinstance(component, numpy.ndarray):
+                component = component.copy()
+                component.flags.writeable = False
+            self.components[key] = component
+            self.components.move_to_end(key)
+            if self.max_components is not None:
+                n_evicted = len(self.components) - self.max_components
+                # The cache can stay above its size while its components are pinned.
+                evicted = [cached_key for cached_key in self.components if not self._is_pinned(cached_key)]
+                for cached_key in evicted[:max(0, n_evicted)]:
+                    del self.components[cached_key]
+
+    def pin(self, cache_namespace):
+        """
+        Keep the components of a namespace until it is unpinned, a namespace can be pinned several times.
+
+        :param tuple cache_namespace: The namespace of the keys of the components.
+        """
+        with self.lock:
+            self.pinned[cache_namespace] += 1
+
+    def unpin(self, cache_namespace):
+        """
+        Let the components of a namespace be evicted again, once it is unpinned as many times as it was pinned.
+
+        :param tuple cache_namespace: The namespace of the keys of the components.
+        """
+        with self.lock:
+            self.pinned[cache_namespace] -= 1
+            if self.pinned[cache_namespace] <= 0:
+                del self.pinned[cache_namespace]
+
+    def _is_pinned(self, key):
+        """
+        :param tuple key: The key of a component.
+        :returns: True if the namespace of the key is pinned.
+        :rtype: bool
+        """
+        return isinstance(key, tuple) and bool(key) and key[0] in self.pinned
+
+    def clear(self):
+        """
+        Remove all the components.
+        """
+        with self.lock:
+            self.components = collections.OrderedDict()
@@ -3,9 +3,12 @@
 This module will provide the functionalities for parsing the data.
 """
 import mysql.connector as MySQLdb
+import mysql.connector.pooling as MySQLPooling
 import json
 import os
 import csv
+from util.import_pipeline import ImportPipeline
+from util.interactions_loader import IdMap
 
 
 class DataParser(object):
@@ -13,22 +16,90 @@ class DataParser(object):
     A class for parsing given data files.
     """
     @staticmethod
-    def process():
+    def process(pipelined=True, batch_size=5000):
         """
         Start processing the data. before running make sure you set autocommit to 0 in mysql,
         otherwise the script might take too long to execute
+
+        :param boolean pipelined:
+            A flag for parsing and inserting all tables concurrently, every table with its own connection.
+        :param int batch_size: The number of rows inserted by one statement.
         """
         db = DataParser.get_connection()
         cursor = db.cursor()
         DataParser.set_up_database(cursor)
         config = DataParser.get_config()
         cursor.execute("use %s" % config["database"]["database_name"])
-        DataParser.import_articles(cursor)
-        DataParser.import_citations(cursor)
-        DataParser.import_words(cursor)
-        DataParser.import_users(cursor)
+        if pipelined:
+            DataParser.import_pipelined(batch_size)
+        else:
+            DataParser.import_articles(cursor, batch_size)
+            DataParser.import_citations(cursor, batch_size)
+            DataParser.import_words(cursor, batch_size)
+            DataParser.import_users(cursor, batch_size)
+        DataParser.create_indexes(cursor)
         DataParser.clean_up(db, cursor)
 
+    @staticmethod
+    def import_pipelined(batch_size=5000, queue_size=8):
+        """
+        Import all the tables concurrently. Each data file is parsed in its own thread, which puts batches of rows
+        on bounded queues, and every table is inserted by a writer with its own pooled connection, so parsing
+        overlaps with inserting.
+
+        :param int batch_size: The number of rows inserted by one statement.
+        :param int queue_size: The maximum number of batches waiting to be inserted for each table.
+        :returns: A dictionary of table name to the number of inserted rows.
+        :rtype: dict
+        """
+        statements = DataParser.get_insert_statements()
+        pool = DataParser.get_connection_pool(len(statements))
+        pipeline = ImportPipeline(pool.get_connection, batch_size, queue_size, verbose=True)
+        pipeline.add_source(DataParser.parse_articles, {'articles': statements['articles']})
+        pipeline.add_source(DataParser.parse_citations, {'citations': statements['citations']})
+        pipeline.add_source(DataParser.parse_words, {'words_articles': statements['words_articles']})
+        pipeline.add_source(DataParser.parse_vocabulary, {'words': statements['words']})
+        pipeline.add_source(DataParser.parse_users, {'users': statements['users'],
+                                                     'articles_users': statements['articles_users']})
+        print("*** Inserting Articles, Citations, Words and Users ***")
+        return pipeline.run()
+
+    @staticmethod
+    def get_insert_statements():
+        """
+        :returns: A dictionary of table name to its insert statement.
+        :rtype: dict
+        """
+        return {
+            'articles': "insert into articles(id, title, abstract) values(%s, \"%s\", \"%s\")",
+            'citations': "insert into citations(article_id, cited_article_id) values (%s, %s)",
+            'words_articles': "insert into words_articles(article_id, count, word_id) values (%s, %s, %s)",
+            'words': "insert ignore into words(id, word) values(%s, %s)",
+            'users': "insert into users(id) values(%s)",
+            'articles_users': "insert into articles_users(user_id, article_id) values(%s, %s)"
+        }
+
+    @staticmethod
+    def insert_rows(cursor, rows, batch_size=5000):
+        """
+        Insert the rows produced by a parser in batches.
+
+        :param cursor: A database cursor.
+        :param iterator rows: An iterator of (table_name, row) pairs.
+        :param int batch_size: The number of rows inserted by one statement.
+        """
+        statements = DataParser.get_insert_statements()
+        batches = {}
+        for table_name, row in rows:
+            batch = batches.setdefault(table_name, [])
+            batch.append(row)
+            if len(batch) >= batch_size:
+                cursor.executemany(statements[table_name], batch)
+                batches[table_name] = []
+        for table_name, batch in batches.items():
+            if batch:
+                cursor.executemany(statements[table_name], batch)
+
     @staticmethod
     def listify(input_str):
         """
@@ -65,6 +136,39 @@ class DataParser(object):
         word_article_count = list(map(lambda t: (t[0] - 1, t[1] - 1, t[2]), word_article_count))
         return word_count, article_words, word_article_count
 
+    @staticmethod
+    def get_vocabulary():
+        """
+        :returns: A dictionary of every word of the vocabulary to its 0-based word id.
+        :rtype: dict[str,int]
+        """
+        db = DataParser.get_connection()
+        cursor = db.cursor()
+        config = DataParser.get_config()
+        cursor.execute("use %s" % config["database"]["database_name"])
+        cursor.execute("select id, word from words")
+        vocabulary = dict((word, word_id - 1) for word_id, word in cursor.fetchall())
+        DataParser.clean_up(db, cursor)
+        return vocabulary
+
+    @staticmethod
+    def get_citations():
+        """
+        :returns:
+            List of (article_id, cited_article_id) pairs of 0-based article indices. The cited ids of citeulike-t
+            are 1-based, and those of citeulike-a are 0-based, like the article ids of the users.
+        :rtype: list[pair[int]]
+        """
+        db = DataParser.get_connection()
+        cursor = db.cursor()
+        config = DataParser.get_config()
+        cursor.execute("use %s" % config["database"]["database_name"])
+        offset = 1 if DataParser.get_dataset() == 'citeulike-t' else 0
+        cursor.execute("select article_id, cited_article_id from citations")
+        citations = list(map(lambda t: (t[0] - 1, t[1] - offset), cursor.fetchall()))
+        DataParser.clean_up(db, cursor)
+        return citations
+
     @staticmethod
     def get_ratings_hash():
         """
@@ -83,6 +187,28 @@ class DataParser(object):
         DataParser.clean_up(db, cursor)
         return ratings_hash
 
+    @staticmethod
+    def ingest_ratings(loader):
+        """
+        Stream the ratings from the database into an interactions loader, in chunks of the loader's size.
+        Users and articles are indexed by their ids, so the ratings are aligned with the abstracts.
+
+        :param InteractionsLoader loader: The loader that ingests the ratings.
+        :returns: Sparse matrix between users and documents.
+        :rtype: csr_matrix
+        """
+        db = DataParser.get_connection()
+        cursor = db.cursor()
+        config = DataParser.get_config()
+        cursor.execute("use %s" % config["database"]["database_name"])
+        if not len(loader.user_map) and not len(loader.item_map):
+            loader.user_map = IdMap.from_external_ids(range(1, DataParser.get_row_count("users") + 1))
+            loader.item_map = IdMap.from_external_ids(range(1, DataParser.get_row_count("articles") + 1))
+        cursor.execute("select user_id, article_id from articles_users")
+        ratings = loader.ingest(loader.read_cursor(cursor))
+        DataParser.clean_up(db, cursor)
+        return ratings
+
     @staticmethod
     def get_row_count(table_name):
         """
@@ -115,15 +241,27 @@ class DataParser(object):
         return ratings_matrix
 
     @staticmethod
-    def import_articles(cursor):
+    def get_data_path(file_name):
         """
-        reads raw-data.csv and fills the articles table
+        :param str file_name: The name of a file of the dataset.
+        :returns: The path of the file in the data/ directory of the dataset.
+        :rtype: str
+        """
+        return os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "data",
+                            DataParser.get_dataset(), file_name)
+
+    @staticmethod
+    def parse_articles():
+        """
+        reads raw-data.csv and generates the rows of the articles table
+
+        :returns: An iterator of (table_name, row) pairs.
+        :rtype: generator
         """
-        print("*** Inserting Articles ***")
         dataset = DataParser.get_dataset()
+        store_abstracts = DataParser.store_abstracts()
         first_line = True
-        with open(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "data",
-                  dataset, "raw-data.csv"), "r", encoding='utf-8', errors='ignore') as f:
+        with open(DataParser.get_data_path("raw-data.csv"), "r", encoding='utf-8', errors='ignore') as f:
             delimiter = '\t'
             if dataset == 'citeulike-t':
                 reader = csv.reader(f, quotechar='"', delimiter=delimiter)
@@ -139,45 +277,42 @@ class DataParser(object):
                     id = int(line[0])
 
                 title = line[1]
-                if DataParser.store_abstracts():
+                if store_abstracts:
                     if dataset == 'citeulike-t':
                         abstract = line[1]
                     else:
                         abstract = line[4]
                 else:
                     abstract = ""
-                cursor.execute("insert into articles(id, title, abstract) values(%s, \"%s\", \"%s\")",
-                               (str(id), title, abstract.replace("\"", "\\\"")))
+                yield 'articles', (str(id), title, abstract.replace("\"", "\\\""))
 
     @staticmethod
-    def import_citations(cursor):
+    def parse_citations():
         """
-        reads citations.dat and inserts rows in the citations table
+        reads citations.dat and generates the rows of the citations table
+
+        :returns: An iterator of (table_name, row) pairs.
+        :rtype: generator
         """
-        print("*** Inserting Citations ***")
         id = 1
-        dataset = DataParser.get_dataset()
-        with open(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "data",
-                  dataset, "citations.dat")) as f:
+        with open(DataParser.get_data_path("citations.dat")) as f:
             for line in f:
                 splitted = line.replace("\n", "").split(" ")
                 num_citations = splitted[0]
                 for i in range(1, int(num_citations) + 1):
-                    cursor.execute("insert into citations(article_id, cited_article_id) \
-                                   values (%s,%s)", (id, splitted[i]))
+                    yield 'citations', (id, splitted[i])
                 id += 1
 
     @staticmethod
-    def import_words(cursor):
+    def parse_words():
         """
-        reads mult.dat and vocabulary.dat to insert bag of words representation in words_articles
+        reads mult.dat and generates the bag of words representation rows of the words_articles table
+
+        :returns: An iterator of (table_name, row) pairs.
+        :rtype: generator
         """
-        print("*** Inserting Words ***")
-        base_dir = os.path.dirname(os.path.realpath(__file__))
         id = 1
-        dataset = DataParser.get_dataset()
-        with open(os.path.join(os.path.dirname(base_dir), "data", dataset, "mult.dat")) as\
-                bag, open(os.path.join(os.path.dirname(base_dir), "data", dataset, "vocabulary.dat")) as vocab:
+        with open(DataParser.get_data_path("mult.dat")) as bag:
             for entry in bag:
                 entry = entry.strip()
                 splitted = entry.split(" ")
@@ -186,38 +321,81 @@ class DataParser(object):
                     article_to_count = splitted[i].split(":")
                     word_id = str(int(article_to_count[0]) + 1)
                     count = article_to_count[1]
-                    cursor.execute("insert into words_articles(article_id, count, word_id) \
-                                   values (%s, %s, %s)", (id, count, word_id))
+                    yield 'words_articles', (id, count, word_id)
                 id += 1
-            current_word = 1
+
+    @staticmethod
+    def parse_vocabulary():
+        """
+        reads vocabulary.dat and generates the rows of the words table
+
+        :returns: An iterator of (table_name, row) pairs.
+        :rtype: generator
+        """
+        current_word = 1
+        with open(DataParser.get_data_path("vocabulary.dat")) as vocab:
             for word in vocab:
                 word = word.strip()
-                cursor.execute("insert ignore into words(id, word) values(%s, %s)", (current_word, word))
+                yield 'words', (current_word, word)
                 current_word += 1
 
     @staticmethod
-    def import_users(cursor):
+    def parse_users():
         """
-        reads users.dat to insert entries in users and articles_users table
+        reads users.dat and generates the rows of the users and articles_users tables
+
+        :returns: An iterator of (table_name, row) pairs.
+        :rtype: generator
         """
-        print("*** Inserting Users ***")
         id = 1
         dataset = DataParser.get_dataset()
-        with open(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "data",
-                  dataset, "users.dat")) as f:
+        with open(DataParser.get_data_path("users.dat")) as f:
             for line in f:
                 splitted = line.replace("\n", "").split(" ")
                 num_articles = int(splitted[0])
 
-                cursor.execute("insert into users(id) values(%s)" % id)
+                yield 'users', (id,)
                 for i in range(1, num_articles + 1):
                     if dataset == 'citeulike-t':
                         article_id = int(splitted[i])
                     elif dataset == 'citeulike-a':
                         article_id = int(splitted[i]) + 1
-                    cursor.execute("insert into articles_users(user_id, article_id) values(%s, %s)", (id, article_id))
+                    yield 'articles_users', (id, article_id)
                 id += 1
 
+    @staticmethod
+    def import_articles(cursor, batch_size=5000):
+        """
+        reads raw-data.csv and fills the articles table
+        """
+        print("*** Inserting Articles ***")
+        DataParser.insert_rows(cursor, DataParser.parse_articles(), batch_size)
+
+    @staticmethod
+    def import_citations(cursor, batch_size=5000):
+        """
+        reads citations.dat and inserts rows in the citations table
+        """
+        print("*** Inserting Citations ***")
+        DataParser.insert_rows(cursor, DataParser.parse_citations(), batch_size)
+
+    @staticmethod
+    def import_words(cursor, batch_size=5000):
+        """
+        reads mult.dat and vocabulary.dat to insert bag of words representation in words_articles
+        """
+        print("*** Inserting Words ***")
+        DataParser.insert_rows(cursor, DataParser.parse_words(), batch_size)
+        DataParser.insert_rows(cursor, DataParser.parse_vocabulary(), batch_size)
+
+    @staticmethod
+    def import_users(cursor, batch_size=5000):
+        """
+        reads users.dat to insert entries in users and articles_users table
+        """
+        print("*** Inserting Users ***")
+        DataParser.insert_rows(cursor, DataParser.parse_users(), batch_size)
+
     @staticmethod
     def get_config():
         """
@@ -274,6 +452,18 @@ class DataParser(object):
                              passwd=config["database"]["password"])
         return db
 
+    @staticmethod
+    def get_connection_pool(pool_size):
+        """
+        :param int pool_size: The number of connections in the pool.
+        :returns: A pool of database connections, that are connected to the configured database.
+        """
+        config = DataParser.get_config()
+        return MySQLPooling.MySQLConnectionPool(pool_name='data_parser', pool_size=pool_size,
+                                                host=config["database"]["host"], user=config["database"]["user"],
+                                                passwd=config["database"]["password"],
+                                                database=config["database"]["database_name"])
+
     @staticmethod
     def set_up_database(cursor):
         """
@@ -295,6 +485,26 @@ class DataParser(object):
                        "article_id int(11) not null, cited_article_id int(11) not null, primary key(id))")
         cursor.execute("create table if not exists words(id int(11) not null, word varchar(55), primary key(id))")
 
+    @staticmethod
+    def create_indexes(cursor):
+        """
+        Creates the indexes of the tables, it is called after loading the data, since
+        maintaining the indexes while inserting slows down the import. The indexes that
+        already exist are kept, so that the data can be imported again in the same schema.
+        """
+        print("*** Creating indexes ***")
+        indexes = [('words_articles_article_word', 'words_articles', 'article_id, word_id'),
+                   ('words_articles_word', 'words_articles', 'word_id'),
+                   ('articles_users_user', 'articles_users', 'user_id'),
+                   ('citations_article', 'citations', 'article_id')]
+        config = DataParser.get_config()
+        cursor.execute("select distinct table_name, index_name from information_schema.statistics "
+                       "where table_schema = %s", (config["database"]["database_name"],))
+        existing_indexes = set((table, index) for table, index in cursor.fetchall())
+        for index, table, columns in indexes:
+            if (table, index) not in existing_indexes:
+                cursor.execute("create index %s on %s(%s)" % (index, table, columns))
+
     @staticmethod
     def drop_database():
         """
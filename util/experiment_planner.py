@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+This module provides a planner of experiments, that runs the stages of the runs as a DAG. Stages that are shared
+by several runs are run once, and the stages whose dependencies are done run in parallel within a memory budget.
+"""
+import multiprocessing
+import threading
+import time
+
+
+class ExperimentStage(object):
+    """
+    A stage of an experiment, a function that runs after its dependencies.
+    """
+    def __init__(self, key, function, dependencies=(), memory=0, name=None):
+        """
+        Constructs a stage.
+
+        :param tuple key: The key of the stage, stages with the same key are the same stage.
+        :param function function: The function of the stage, it is called without arguments.
+        :param list[tuple] dependencies: The keys of the stages this stage depends on.
+        :param int memory: The estimated memory footprint of the stage, in bytes.
+        :param str name: The name of the stage in the report.
+        """
+        self.key = key
+        self.function = function
+        self.dependencies = list(dependencies)
+        self.memory = memory
+        self.name = name if name is not None else str(key)
+        self.start_time = None
+        self.end_time = None
+        self.result = None
+
+    def get_duration(self):
+        """
+        :returns: The time the stage took, 0 if it did not run.
+        :rtype: float
+        """
+        if self.start_time is None or self.end_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+
+
+class ExperimentPlanner(object):
+    """
+    A class that schedules the stages of an experiment on worker threads. The threads share the in-process
+    caches of the runs, and a stage only starts if the estimated memory of the running stages stays in the budget.
+    """
+    def __init__(self, n_jobs=1, memory_budget=None, verbose=True):
+        """
+        Constructs an experiment planner.
+
+        :param int n_jobs: The maximum number of stages that run at the same time, -1 uses all the cores.
+        :param int memory_budget: The maximum estimated memory of the running stages in bytes, None for no limit.
+        :param boolean verbose: A flag for printing the report.
+        """
+        self.n_jobs = ExperimentPlanner.get_n_jobs(n_jobs)
+        self.memory_budget = memory_budget
+        self._verbose = verbose
+        self.stages = {}
+        self.order = []
+        self.peak_memory = 0
+
+    @staticmethod
+    def get_n_jobs(n_jobs):
+        """
+        :param int n_jobs: A number of jobs, -1 for all the cores.
+        :returns: The number of jobs, at least one.
+        :rtype: int
+        """
+        if n_jobs == -1:
+            return multiprocessing.cpu_count()
+        return max(1, n_jobs)
+
+    def add_stage(self, key, function, dependencies=(), memory=0, name=None):
+        """
+        Add a stage, unless a stage with the same key was already added.
+
+        :param tuple key: The key of the stage.
+        :param function function: The function of the stage, it is called without arguments.
+        :param list[tuple] dependencies: The keys of the stages this stage depends on, they are added before.
+        :param int memory: The estimated memory footprint of the stage, in bytes.
+        :param str name: The name of the stage in the report.
+        :returns: The key of the stage.
+        :rtype: tuple
+        """
+        if key in self.stages:
+            return key
+        for dependency in dependencies:
+            if dependency not in self.stages:
+                raise ValueError("Stage %s depends on the unknown stage %s" % (name or str(key), dependency))
+        self.stages[key] = ExperimentStage(key, function, dependencies, memory, name)
+        self.order.append(key)
+        return key
+
+    def run(self):
+        """
+        Run all the stages. A stage starts when its dependencies are done, there is a free worker, and its memory
+        fits in the budget. A stage that does not fit in the budget alone runs when no other stage is running.
+        If a stage raises an exception, no new stage starts, and the exception is raised after the running stages.
+
+        :returns: The results of the stages, by their keys.
+        :rtype: dict
+        """
+        condition = threading.Condition()
+        pending = list(self.order)
+        done = set()
+        running = {}
+        errors = []
+
+        def work(stage):
+            try:
+                stage.start_time = time.time()
+                stage.result = stage.function()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                stage.end_time = time.time()
+                with condition:
+                    del running[stage.key]
+                    done.add(stage.key)
+                    condition.notify_all()
+
+        with condition:
+            while (pending and not errors) or running:
+                started = False
+                if not errors:
+                    for key in list(pending):
+                        stage = self.stages[key]
+                        if len(running) >= self.n_jobs:
+                            break
+                        if not all(dependency in done for dependency in stage.dependencies):
+                            continue
+                        used_memory = sum(self.stages[running_key].memory for running_key in running)
+                        if (self.memory_budget is not None and running and
+                                used_memory + stage.memory > self.memory_budget):
+                            continue
+                        pending.remove(key)
+                        running[key] = stage
+                        self.peak_memory = max(self.peak_memory, used_memory + stage.memory)
+                        thread = threading.Thread(target=work, args=(stage,))
+                        thread.daemon = True
+                        thread.start()
+                        started = True
+                if not started:
+                    condition.wait()
+        if errors:
+            raise errors[0]
+        if self._verbose:
+            self.print_report()
+        return dict((key, self.stages[key].result) for key in self.order)
+
+    def get_critical_path(self):
+        """
+        The chain of dependent stages of the longest total duration, that bounds the duration of the experiment.
+
+        :returns: The keys of the stages of the critical path, and its duration.
+        :rtype: tuple(list[tuple], float)
+        """
+        finish = {}
+        previous = {}
+        # The stages are added after their dependencies.
+        for key in self.order:
+            stage = self.stages[key]
+            previous[key] = None
+            longest = 0.0
+            for dependency in stage.dependencies:
+                if finish[dependency] > longest:
+                    longest = finish[dependency]
+                    previous[key] = dependency
+            finish[key] = longest + stage.get_duration()
+        if not finish:
+            return [], 0.0
+        key = max(self.order, key=lambda stage_key: finish[stage_key])
+        duration = finish[key]
+        path = []
+        while key is not None:
+            path.append(key)
+            key = previous[key]
+        return list(reversed(path)), duration
+
+    def print_report(self):
+        """
+        Print the timings of the stages, and the critical path.
+        """
+        print("Stage timings:")
+        for key in self.order:
+            stage = self.stages[key]
+            print("\t%.3fs %s (%.1f MB)" % (stage.get_duration(), stage.name, stage.memory / 2.0 ** 20))
+        path, duration = self.get_critical_path()
+        print("Critical path %.3fs: %s" % (duration, ' -> '.join(self.stages[key].name for key in path)))
+        if self.memory_budget is not None:
+            print("Peak estimated memory %.1f MB of %.1f MB" % (self.peak_memory / 2.0 ** 20,
+                                                                self.memory_budget / 2.0 ** 20))
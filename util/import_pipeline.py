@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+This module provides a pipelined importer, where parsing of the data files and
+inserting into the database overlap.
+"""
+import queue
+import threading
+
+
+class ImportPipeline(object):
+    """
+    A class that parses several tables concurrently and inserts them in batches.
+    Every table has a parser thread that produces batches of rows on a bounded queue,
+    and writer threads that consume these batches using their own database connections.
+    """
+    def __init__(self, get_connection, batch_size=5000, queue_size=8, n_writers=1, verbose=False):
+        """
+        Constructs an import pipeline.
+
+        :param callable get_connection: A function that returns a new (or pooled) database connection.
+        :param int batch_size: The number of rows inserted by one statement.
+        :param int queue_size: The maximum number of batches waiting to be inserted for each table.
+        :param int n_writers: The number of writer threads (and connections) of each table.
+        :param boolean verbose: A flag for printing progress.
+        """
+        self.get_connection = get_connection
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.n_writers = n_writers
+        self._verbose = verbose
+        self.sources = []
+        self.tables = []
+        self.errors = []
+        self.row_counts = {}
+        self._lock = threading.Lock()
+
+    def add_source(self, parser, statements):
+        """
+        Register a data source. A source is parsed by one parser thread, and it can
+        produce rows of several tables.
+
+        :param callable parser:
+            A function that returns an iterator of (table_name, row) pairs.
+        :param dict statements: A dictionary of table_name to its insert statement.
+        """
+        queues = {}
+        for table_name, statement in statements.items():
+            queues[table_name] = queue.Queue(maxsize=self.queue_size)
+            self.tables.append((table_name, statement, queues[table_name]))
+        self.sources.append((parser, queues))
+
+    def run(self):
+        """
+        Start parsing and inserting all the registered sources, and block until all rows are inserted.
+
+        :returns: A dictionary of table_name to the number of inserted rows.
+        :rtype: dict
+        """
+        threads = []
+        for parser, queues in self.sources:
+            threads.append(threading.Thread(target=self._parse, args=(parser, queues)))
+        for table_name, statement, batches in self.tables:
+            self.row_counts[table_name] = 0
+            for _ in range(self.n_writers):
+                threads.append(threading.Thread(target=self._write, args=(table_name, statement, batches)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+        return self.row_counts
+
+    def _parse(self, parser, queues):
+        """
+        Parse a source and put its rows in batches on the queues of their tables.
+
+        :param callable parser: A function that returns an iterator of (table_name, row) pairs.
+        :param dict queues: A dictionary of table_name to its queue of batches.
+        """
+        batches = dict((table_name, []) for table_name in queues)
+        try:
+            for table_name, row in parser():
+                batch = batches[table_name]
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    queues[table_name].put(batch)
+                    batches[table_name] = []
+                if self.errors:
+                    break
+            for table_name, batch in batches.items():
+                if batch:
+                    queues[table_name].put(batch)
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            # One end marker for every writer of every table.
+            for table_queue in queues.values():
+                for _ in range(self.n_writers):
+                    table_queue.put(None)
+
+    def _write(self, table_name, statement, batches):
+        """
+        Insert the batches of a table until the parser signals the end of the data.
+
+        :param str table_name: The name of the table.
+        :param str statement: The insert statement of the table.
+        :param Queue batches: The queue of batches of the table.
+        """
+        db = None
+        try:
+            db = self.get_connection()
+            cursor = db.cursor()
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if self.errors:
+                    continue
+                cursor.executemany(statement, batch)
+                db.commit()
+                with self._lock:
+                    self.row_counts[table_name] += len(batch)
+            cursor.close()
+            if self._verbose:
+                print("*** Inserted %d rows in %s ***" % (self.row_counts[table_name], table_name))
+        except Exception as e:
+            self.errors.append(e)
+            # Keep draining, so that the parser is never blocked on a full queue.
+            while batches.get() is not None:
+                pass
+        finally:
+            if db is not None:
+                db.close()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+This module provides a streaming ingestion of user-item interactions, that reads the
+interactions in chunks, so that the memory does not depend on the size of the input.
+"""
+import itertools
+import os
+import numpy
+from scipy import sparse
+
+
+class IdMap(object):
+    """
+    A compact map from external ids to dense internal indices. The ids are stored in
+    a sorted array instead of a dictionary, and new ids get the next free index.
+    """
+    def __init__(self, keys=None, values=None):
+        """
+        Constructs an id map.
+
+        :param ndarray keys: Sorted external ids.
+        :param ndarray values: The internal index of every external id in keys.
+        """
+        if keys is None:
+            keys = numpy.empty(0, dtype=numpy.int64)
+            values = numpy.empty(0, dtype=numpy.int32)
+        self.keys = keys
+        self.values = values
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def from_external_ids(external_ids):
+        """
+        Build an id map where the i-th given id is mapped to i.
+
+        :param int[] external_ids: Unique external ids.
+        :returns: The id map.
+        :rtype: IdMap
+        """
+        external_ids = numpy.asarray(external_ids, dtype=numpy.int64)
+        order = numpy.argsort(external_ids, kind='mergesort')
+        return IdMap(external_ids[order], numpy.arange(len(external_ids), dtype=numpy.int32)[order])
+
+    def map(self, external_ids, add=True):
+        """
+        Map external ids to internal indices.
+
+        :param int[] external_ids: The external ids.
+        :param boolean add: A flag for adding the unknown ids to the map, otherwise they are mapped to -1.
+        :returns: The internal indices of the ids.
+        :rtype: ndarray
+        """
+        external_ids = numpy.asarray(external_ids, dtype=numpy.int64)
+        positions, found = self._search(external_ids)
+        if add and not found.all():
+            new_ids, first_indices = numpy.unique(external_ids[~found], return_index=True)
+            # New ids are numbered in the order of their first appearance.
+            new_values = numpy.empty(len(new_ids), dtype=numpy.int32)
+            new_values[numpy.argsort(first_indices, kind='mergesort')] = numpy.arange(len(self),
+                                                                                      len(self) + len(new_ids))
+            keys = numpy.concatenate((self.keys, new_ids))
+            order = numpy.argsort(keys, kind='mergesort')
+            self.keys = keys[order]
+            self.values = numpy.concatenate((self.values, new_values))[order]
+            positions, found = self._search(external_ids)
+        indices = numpy.full(len(external_ids), -1, dtype=numpy.int32)
+        indices[found] = self.values[positions[found]]
+        return indices
+
+    def _search(self, external_ids):
+        """
+        Find the positions of external ids in the sorted keys.
+
+        :param ndarray external_ids: The external ids.
+        :returns: A tuple of the positions, and a mask of the found ids.
+        :rtype: tuple
+        """
+        positions = numpy.searchsorted(self.keys, external_ids)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == external_ids[found]
+        return positions, found
+
+    def get_external_ids(self):
+        """
+        :returns: The external id of every internal index.
+        :rtype: ndarray
+        """
+        external_ids = numpy.empty(len(self), dtype=numpy.int64)
+        external_ids[self.values] = self.keys
+        return external_ids
+
+    def save(self, path):
+        """
+        Save the id map.
+
+        :param str path: Path of the .npz file.
+        """
+        numpy.savez(path, keys=self.keys, values=self.values)
+
+    @staticmethod
+    def load(path):
+        """
+        Load a saved id map.
+
+        :param str path: Path of the .npz file.
+        :returns: The loaded id map.
+        :rtype: IdMap
+        """
+        with numpy.load(path) as data:
+            return IdMap(data['keys'], data['values'])
+
+
+class InteractionsLoader(object):
+    """
+    A class that ingests a stream of (user, item) interactions in fixed-size chunks. The interactions
+    are buffered as COO arrays, which are periodically merged into a deduplicated CSR ratings matrix.
+    """
+    def __init__(self, chunk_size=100000, buffer_size=1000000, user_map=None, item_map=None, verbose=False):
+        """
+        Constructs an interactions loader.
+
+        :param int chunk_size: The number of interactions read at once.
+        :param int buffer_size: The number of interactions buffered before merging them into the ratings.
+        :param IdMap user_map: A map of the external user ids, to continue a previous ingestion.
+        :param IdMap item_map: A map of the external item ids, to continue a previous ingestion.
+        :param boolean verbose: A flag for printing progress.
+        """
+        self.chunk_size = chunk_size
+        self.buffer_size = max(buffer_size, chunk_size)
+        self.user_map = user_map if user_map is not None else IdMap()
+        self.item_map = item_map if item_map is not None else IdMap()
+        self._verbose = verbose
+        self.ratings = sparse.csr_matrix((len(self.user_map), len(self.item_map)), dtype=numpy.int8)
+        self._users_buffer = numpy.empty(self.buffer_size, dtype=numpy.int32)
+        self._items_buffer = numpy.empty(self.buffer_size, dtype=numpy.int32)
+        self._buffered = 0
+        self.n_interactions = 0
+
+    def add_chunk(self, users, items):
+        """
+        Add a chunk of interactions.
+
+        :param int[] users: External ids of the users.
+        :param int[] items: External ids of the items, parallel to users.
+        """
+        users = self.user_map.map(users)
+        items = self.item_map.map(items)
+        start = 0
+        while start < len(users):
+            end = min(len(users), start + self.buffer_size - self._buffered)
+            self._users_buffer[self._buffered:self._buffered + end - start] = users[start:end]
+            self._items_buffer[self._buffered:self._buffered + end - start] = items[start:end]
+            self._buffered += end - start
+            start = end
+            if self._buffered == self.buffer_size:
+                self.merge()
+        self.n_interactions += len(users)
+
+    def merge(self):
+        """
+        Merge the buffered interactions into the ratings matrix, and deduplicate them.
+        """
+        shape = (len(self.user_map), len(self.item_map))
+        buffered = sparse.coo_matrix((numpy.ones(self._buffered, dtype=numpy.int8),
+                                      (self._users_buffer[:self._buffered], self._items_buffer[:self._buffered])),
+                                     shape=shape).tocsr()
+        # The duplicates are summed in int8, they are set to 1 before they can wrap around to 0.
+        buffered.data[:] = 1
+        self.ratings.resize(shape)
+        self.ratings = self.ratings + buffered
+        # Interactions are binary, duplicates are only counted once.
+        self.ratings.data[:] = 1
+        self._buffered = 0
+        if self._verbose:
+            print("Merged %d interactions, %d users, %d items, %d ratings" %
+                  (self.n_interactions, shape[0], shape[1], self.ratings.nnz))
+
+    def ingest(self, chunks):
+        """
+        Ingest an iterator of chunks.
+
+        :param iterator chunks: An iterator of (users, items) pairs of arrays.
+        :returns: The ratings matrix.
+        :rtype: csr_matrix
+        """
+        for users, items in chunks:
+            self.add_chunk(users, items)
+        return self.get_ratings()
+
+    def read_pairs_file(self, path, delimiter=None):
+        """
+        Read chunks from a file, where every line holds the external ids of a user and an item.
+
+        :param str path: Path of the file.
+        :param str delimiter: The delimiter between the ids, None for whitespace.
+        :returns: An iterator of (users, items) pairs of arrays.
+        :rtype: generator
+        """
+        with open(path) as f:
+            while True:
+                lines = list(itertools.islice(f, self.chunk_size))
+                if not lines:
+                    break
+                pairs = numpy.array([line.split(delimiter)[:2] for line in lines if line.strip()], dtype=numpy.int64)
+                if len(pairs):
+                    yield pairs[:, 0], pairs[:, 1]
+
+    def read_libraries_file(self, path, first_item_id=0):
+        """
+        Read chunks from a file in the format of users.dat, where line u holds the number of items
+        of user u followed by the ids of the items.
+
+        :param str path: Path of the file.
+        :param int first_item_id: The id of the first item in the file, it is mapped to 0.
+        :returns: An iterator of (users, items) pairs of arrays.
+        :rtype: generator
+        """
+        users, items = [], []
+        with open(path) as f:
+            for user, line in enumerate(f):
+                splitted = line.split()
+                user_items = splitted[1:int(splitted[0]) + 1]
+                users.extend([user] * len(user_items))
+                items.extend(user_items)
+                if len(users) >= self.chunk_size:
+                    yield numpy.array(users), numpy.array(items, dtype=numpy.int64) - first_item_id
+                    users, items = [], []
+        if users:
+            yield numpy.array(users), numpy.array(items, dtype=numpy.int64) - first_item_id
+
+    def read_cursor(self, cursor):
+        """
+        Read chunks from a database cursor, which has executed a query that selects (user_id, item_id) rows.
+
+        :param cursor: A database cursor.
+        :returns: An iterator of (users, items) pairs of arrays.
+        :rtype: generator
+        """
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                break
+            rows = numpy.array(rows, dtype=numpy.int64)
+            yield rows[:, 0], rows[:, 1]
+
+    def get_ratings(self):
+        """
+        :returns: The deduplicated ratings matrix of all the ingested interactions.
+        :rtype: csr_matrix
+        """
+        if self._buffered:
+            self.merge()
+        self.ratings.resize((len(self.user_map), len(self.item_map)))
+        return self.ratings
+
+    def save(self, directory):
+        """
+        Save the ratings matrix and the id maps, to be used for serving.
+
+        :param str directory: The directory of the saved files.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        sparse.save_npz(os.path.join(directory, 'ratings.npz'), self.get_ratings())
+        self.user_map.save(os.path.join(directory, 'user_map.npz'))
+        self.item_map.save(os.path.join(directory, 'item_map.npz'))
+        if self._verbose:
+            print("dumped interactions to %s" % directory)
+
+    @staticmethod
+    def load(directory, chunk_size=100000, buffer_size=1000000, verbose=False):
+        """
+        Load a saved ingestion, more interactions can be ingested afterwards.
+
+        :param str directory: The directory of the saved files.
+        :param int chunk_size: The number of interactions read at once.
+        :param int buffer_size: The number of interactions buffered before merging them into the ratings.
+        :param boolean verbose: A flag for printing progress.
+        :returns: An interactions loader holding the saved ratings.
+        :rtype: InteractionsLoader
+        """
+        loader = InteractionsLoader(chunk_size, buffer_size, IdMap.load(os.path.join(directory, 'user_map.npz')),
+                                    IdMap.load(os.path.join(directory, 'item_map.npz')), verbose)
+        loader.ratings = sparse.load_npz(os.path.join(directory, 'ratings.npz')).tocsr()
+        return loader
@@ -4,6 +4,8 @@ This module saves and imports matrices.
 """
 import numpy
 import os
+import pickle
+from scipy import sparse
 
 
 class ModelInitializer(object):
@@ -20,6 +22,51 @@ class ModelInitializer(object):
         self.folder = 'matrices'
         self.set_config(config, n_iterations)
         self._v = verbose
+        self.component_cache = None
+        self.cache_namespace = None
+        self._load_files = True
+        self._dump_files = True
+
+    def set_component_cache(self, component_cache, cache_namespace, load_files=True, dump_files=True):
+        """
+        Share the matrices and models through a component cache. They are saved to the cache, and loaded
+        from the cache before their files.
+
+        :param ComponentCache component_cache: The component cache.
+        :param tuple cache_namespace: The namespace of the keys, it identifies the data and the options.
+        :param boolean load_files: A flag for loading the files that are not in the cache.
+        :param boolean dump_files: A flag for also saving to files.
+        """
+        self.component_cache = component_cache
+        self.cache_namespace = cache_namespace
+        self._load_files = load_files
+        self._dump_files = dump_files
+
+    def _load_cached(self, path):
+        """
+        :param str path: The path of the file of the component.
+        :returns: A tuple of boolean (if the component is cached or not), and the component if it is cached.
+        :rtype: tuple
+        """
+        if self.component_cache is None:
+            return False, None
+        found, component = self.component_cache.get((self.cache_namespace, os.path.basename(path)))
+        if found and self._v:
+            print("loaded from cache %s" % path)
+        return found, component
+
+    def _save_cached(self, component, path):
+        """
+        Save a component to the component cache, if there is one.
+
+        :param object component: The matrix or model.
+        :param str path: The path of the file of the component.
+        :returns: True if the component should also be saved to its file.
+        :rtype: bool
+        """
+        if self.component_cache is not None:
+            self.component_cache.put((self.cache_namespace, os.path.basename(path)), component)
+        return self._dump_files
 
     def set_config(self, config, n_iterations):
         """
@@ -41,24 +88,32 @@ class ModelInitializer(object):
         if shape is None:
             shape = matrix.shape
         path = self._create_path(matrix_name, shape)
+        if not self._save_cached(matrix, path):
+            return
         matrix.dump(path)
         if self._v:
             print("dumped to %s" % path)
 
-    def load_matrix(self, config, matrix_name, matrix_shape):
+    def load_matrix(self, config, matrix_name, matrix_shape, random_state=None):
         """
         Function that loads a matrix from a file.
 
         :param dict config: Config that was used to calculate the matrix.
         :param str matrix_name: Name of the matrix to be loaded.
         :param tuple matrix_shape: A tuple of int containing matrix shape.
+        :param RandomState random_state: The generator of the random matrix, numpy's global one if None.
         :returns:
             A tuple of boolean (if the matrix is loaded or not)
             And the matrix if loaded, random matrix otherwise.
         :rtype: tuple
         """
         path = self._create_path(matrix_name, matrix_shape, config.copy())
+        found, matrix = self._load_cached(path)
+        if found:
+            return found, matrix
         try:
+            if not self._load_files:
+                raise FileNotFoundError(path)
             res = (True, numpy.load(path))
             if self._v:
                 print("loaded from %s" % path)
@@ -66,7 +121,95 @@ class ModelInitializer(object):
         except FileNotFoundError:
             if self._v:
                 print("File not found, %s will initialize randomly" % path)
-            return (False, numpy.random.random(matrix_shape))
+            random_state = random_state if random_state is not None else numpy.random
+            return (False, random_state.random_sample(matrix_shape))
+
+    def save_sparse_matrix(self, matrix, matrix_name):
+        """
+        Function that dumps a sparse matrix to a .npz file.
+
+        :param spmatrix matrix: Sparse matrix to be dumped.
+        :param str matrix_name: Name of the matrix to be dumped.
+        """
+        path = self._create_path(matrix_name, matrix.shape, extension='.npz')
+        if not self._save_cached(matrix, path):
+            return
+        sparse.save_npz(path, matrix)
+        if self._v:
+            print("dumped to %s" % path)
+
+    def load_sparse_matrix(self, config, matrix_name, matrix_shape):
+        """
+        Function that loads a sparse matrix from a file.
+
+        :param dict config: Config that was used to calculate the matrix.
+        :param str matrix_name: Name of the matrix to be loaded.
+        :param tuple matrix_shape: A tuple of int containing matrix shape.
+        :returns:
+            A tuple of boolean (if the matrix is loaded or not)
+            And the matrix in csr format if loaded, None otherwise.
+        :rtype: tuple
+        """
+        path = self._create_path(matrix_name, matrix_shape, config.copy(), extension='.npz')
+        found, matrix = self._load_cached(path)
+        if found:
+            return found, matrix
+        try:
+            if not self._load_files:
+                raise FileNotFoundError(path)
+            res = (True, sparse.load_npz(path).tocsr())
+            if self._v:
+                print("loaded from %s" % path)
+            return res
+        except FileNotFoundError:
+            if self._v:
+                print("File not found, %s will be computed" % path)
+            return (False, None)
+
+    def save_model(self, model, model_name, shape):
+        """
+        Function that dumps a trained model to a .pkl file.
+
+        :param object model: The model to be dumped.
+        :param str model_name: Name of the model to be dumped.
+        :param tuple shape: The shape of the output of the model, which identifies it as the shape of a matrix.
+        """
+        path = self._create_path(model_name, shape, extension='.pkl')
+        if not self._save_cached(model, path):
+            return
+        with open(path, 'wb') as f:
+            pickle.dump(model, f)
+        if self._v:
+            print("dumped to %s" % path)
+
+    def load_model(self, config, model_name, shape):
+        """
+        Function that loads a trained model from a file.
+
+        :param dict config: Config that was used to train the model.
+        :param str model_name: Name of the model to be loaded.
+        :param tuple shape: The shape of the output of the model.
+        :returns:
+            A tuple of boolean (if the model is loaded or not)
+            And the model if loaded, None otherwise.
+        :rtype: tuple
+        """
+        path = self._create_path(model_name, shape, config.copy(), extension='.pkl')
+        found, model = self._load_cached(path)
+        if found:
+            return found, model
+        try:
+            if not self._load_files:
+                raise FileNotFoundError(path)
+            with open(path, 'rb') as f:
+                res = (True, pickle.load(f))
+            if self._v:
+                print("loaded from %s" % path)
+            return res
+        except FileNotFoundError:
+            if self._v:
+                print("File not found, %s will be trained" % path)
+            return (False, None)
 
     def _generate_file_name(self, config, matrix_name):
         """
@@ -81,13 +224,14 @@ class ModelInitializer(object):
         generated_key = str.join(',', ['%s-%s' % (key, str(config[key]).replace('.', '_')) for key in keys_array])
         return generated_key + matrix_name
 
-    def _create_path(self, matrix_name, matrix_shape, config=None):
+    def _create_path(self, matrix_name, matrix_shape, config=None, extension='.dat'):
         """
         Function creates a string uniquely representing the matrix it also
         uses the config to generate the name.
 
         :param str matrix_name: Name of the matrix.
         :param int n_rows: Number of rows of the matrix.
+        :param str extension: The extension of the file.
         :returns: A string representing the matrix path.
         :rtype: str
         """
@@ -100,4 +244,4 @@ class ModelInitializer(object):
         config['n_rows'] = n_rows
         path = self._generate_file_name(config, matrix_name)
         base_dir = os.path.dirname(os.path.realpath(__file__))
-        return os.path.join(os.path.dirname(base_dir), self.folder, path + '.dat')
+        return os.path.join(os.path.dirname(base_dir), self.folder, path + extension)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+This module provides a daemon that keeps the data and the trained components of the recommenders loaded
+between the calls of the command line, and a thin client that submits jobs to it over a Unix socket.
+"""
+import json
+import os
+import socket
+import socketserver
+import sys
+from contextlib import redirect_stdout
+from optparse import OptionParser
+
+
+def get_code_version():
+    """
+    :returns: The version of the code, the daemon runs the code it imported when it started.
+    :rtype: str
+    """
+    from util.results_store import ResultsStore
+    return ResultsStore.get_code_version()
+
+
+class _SocketWriter(object):
+    """
+    A file-like object that sends the output of a job to the client, line by line. If the client
+    disconnects, the output is dropped and the job goes on.
+    """
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.buffer = ''
+        self.connected = True
+
+    def write(self, text):
+        self.buffer += text
+        while '\n' in self.buffer:
+            line, self.buffer = self.buffer.split('\n', 1)
+            self.send({'output': line})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def send(self, message):
+        if not self.connected:
+            return
+        try:
+            self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+            self.wfile.flush()
+        except OSError:
+            self.connected = False
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    """
+    Handles a request of a client, a JSON line of the command and its options. The output of the job
+    is sent as JSON lines, and the last line has the status of the job.
+    """
+    def handle(self):
+        writer = _SocketWriter(self.wfile)
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+        except ValueError:
+            writer.send({'done': True, 'error': "The request is not valid JSON"})
+            return
+        error = None
+        try:
+            with redirect_stdout(writer):
+                self.server.recommender_daemon.run_job(request)
+        except Exception as e:
+            error = "%s: %s" % (type(e).__name__, e)
+        if writer.buffer:
+            writer.send({'output': writer.buffer})
+        writer.send({'done': True, 'error': error})
+
+
+class RecommenderDaemon(object):
+    """
+    A daemon that serves the jobs of the clients one after another, with one runnable that keeps the data,
+    the component cache and the results store in memory. The jobs run the methods of the runnable.
+    """
+    def __init__(self, runnable, socket_path, commands, job_options=(), before_job=None):
+        """
+        Constructs a daemon.
+
+        :param object runnable: The object that runs the jobs, like RunnableRecommenders.
+        :param str socket_path: The path of the Unix socket.
+        :param dict commands: The names of the methods of the runnable, by the commands of the jobs.
+        :param list[str] job_options: The attributes of the runnable that a job can set, they are restored after it.
+        :param str before_job: The name of a method of the runnable that is called before every job, like reloading
+            its configuration, so that a job does not run with the changes of the previous jobs.
+        """
+        self.runnable = runnable
+        self.socket_path = socket_path
+        self.commands = commands
+        self.job_options = job_options
+        self.before_job = before_job
+        self.code_version = get_code_version()
+        self.n_jobs = 0
+        self.server = None
+
+    def run_job(self, request):
+        """
+        Run a job in the runnable, with the options of the job.
+
+        :param dict request: The command, the options, and the version of the code of the client.
+        """
+        command = request.get('command')
+        if command == 'status':
+            print("Daemon of process %d, %d jobs done, code version %s" %
+                  (os.getpid(), self.n_jobs, self.code_version))
+            return
+        if command == 'shutdown':
+            print("Daemon shutting down")
+            self.server.shutdown_requested = True
+            return
+        if command not in self.commands:
+            raise ValueError("'%s' is not a command, please use one of %s" % (command, sorted(self.commands)))
+        if request.get('code_version', self.code_version) != self.code_version:
+            raise RuntimeError("The code changed since the daemon started, please restart the daemon")
+        options = request.get('options', {})
+        unknown_options = set(options) - set(self.job_options)
+        if unknown_options:
+            raise ValueError("The options %s can not be set by a job" % sorted(unknown_options))
+        previous_options = dict((name, getattr(self.runnable, name)) for name in options)
+        for name, value in options.items():
+            setattr(self.runnable, name, value)
+        try:
+            if self.before_job is not None:
+                getattr(self.runnable, self.before_job)()
+            getattr(self.runnable, self.commands[command])()
+        finally:
+            for name, value in previous_options.items():
+                setattr(self.runnable, name, value)
+            self.n_jobs += 1
+
+    def serve(self):
+        """
+        Serve the jobs until a shutdown job. A stale socket file of a daemon that died is replaced.
+        """
+        if os.path.exists(self.socket_path):
+            if RecommenderClient(self.socket_path).is_alive():
+                raise RuntimeError("A daemon is already listening on %s" % self.socket_path)
+            os.remove(self.socket_path)
+        self.server = socketserver.UnixStreamServer(self.socket_path, _JobHandler)
+        self.server.recommender_daemon = self
+        self.server.shutdown_requested = False
+        try:
+            while not self.server.shutdown_requested:
+                self.server.handle_request()
+        finally:
+            self.server.server_close()
+            os.remove(self.socket_path)
+
+
+class RecommenderClient(object):
+    """
+    A client that submits jobs to a daemon, and prints their output as it arrives.
+    """
+    def __init__(self, socket_path):
+        """
+        Constructs a client.
+
+        :param str socket_path: The path of the Unix socket of the daemon.
+        """
+        self.socket_path = socket_path
+
+    def is_alive(self):
+        """
+        :returns: A flag that is True if a daemon listens on the socket.
+        :rtype: boolean
+        """
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self.socket_path)
+        except OSError:
+            return False
+        finally:
+            connection.close()
+        return True
+
+    def submit(self, command, options=None, output=None):
+        """
+        Submit a job, and wait until it is done.
+
+        :param str command: The command of the job, like 'experiment', 'status' or 'shutdown'.
+        :param dict options: The options of the job, they are set on the runnable of the daemon for this job.
+        :param file output: The file where the output of the job is written, the standard output by default.
+        :returns: The error of the job, None if it succeeded.
+        :rtype: str
+        """
+        output = output if output is not None else sys.stdout
+        request = {'command': command, 'options': options or {}, 'code_version': get_code_version()}
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(self.socket_path)
+        try:
+            connection.sendall((json.dumps(request) + '\n').encode('utf-8'))
+            with connection.makefile('rb') as responses:
+                for line in responses:
+                    message = json.loads(line.decode('utf-8'))
+                    if message.get('done'):
+                        return message['error']
+                    output.write(message['output'] + '\n')
+                    output.flush()
+        finally:
+            connection.close()
+        return "The daemon closed the connection before the job was done"
+
+
+if __name__ == '__main__':
+    parser = OptionParser("python3 -m util.recommender_daemon [options] commands\n\nSubmits the commands to the daemon"
+                          " that was started by runnables.py --socket SOCKET daemon, like experiment, status or "
+                          "shutdown.")
+    parser.add_option("--socket", dest="socket", default=os.path.join('matrices', 'recommender_daemon.sock'),
+                      help="path of the Unix socket of the daemon", metavar="SOCKET")
+    parser.add_option("-v", "--verbose", dest="verbose", action='store_true',
+                      help="print update statements during computations", metavar="VERBOSE")
+    parser.add_option("-f", "--force", dest="force", action='store_true',
+                      help="run again the runs that are already in the results store", metavar="FORCE")
+    options, args = parser.parse_args()
+    job_options = {}
+    if options.verbose is not None:
+        job_options['verbose'] = True
+    if options.force is not None:
+        job_options['force'] = True
+    client = RecommenderClient(options.socket)
+    for arg in args:
+        error = client.submit(arg, job_options)
+        if error is not None:
+            print(error)
+            sys.exit(1)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+This module provides a store of the results of the runs, so that runs that were already
+evaluated are not run again.
+"""
+import fcntl
+import hashlib
+import json
+import numpy
+import os
+from scipy import sparse
+
+
+class ResultsStore(object):
+    """
+    An append-only JSON lines store of results. Every record is keyed by a hash of the configuration
+    of the run, the fingerprint of the data, the seed of the split and the version of the code.
+    """
+    def __init__(self, path=None, code_version=None, force=False):
+        """
+        Constructs a results store, and loads the stored results.
+
+        :param str path: The path of the JSON lines file, matrices/results_store.jsonl by default.
+        :param str code_version: The version of the code, a hash of the sources by default.
+        :param boolean force: A flag for ignoring the stored results, the new results are still stored.
+        """
+        if path is None:
+            base_dir = os.path.dirname(os.path.realpath(__file__))
+            path = os.path.join(os.path.dirname(base_dir), 'matrices', 'results_store.jsonl')
+        self.path = path
+        self.code_version = code_version if code_version is not None else self.get_code_version()
+        self.force = force
+        self.results = {}
+        self.reload()
+
+    def reload(self):
+        """
+        Load the stored results, including the results that other processes added since the store was loaded.
+        """
+        if os.path.exists(self.path):
+            with open(self.path) as store_file:
+                for line in store_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # The last line is truncated if a run crashed while writing it.
+                        continue
+                    self.results[record['key']] = record['results']
+
+    @staticmethod
+    def get_code_version():
+        """
+        :returns: A hash of the python sources of lib and util.
+        :rtype: str
+        """
+        base_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        code_hash = hashlib.sha1()
+        for directory in ['lib', 'util']:
+            for file_name in sorted(os.listdir(os.path.join(base_dir, directory))):
+                if file_name.endswith('.py'):
+                    code_hash.update(file_name.encode('utf-8'))
+                    with open(os.path.join(base_dir, directory, file_name), 'rb') as source_file:
+                        code_hash.update(source_file.read())
+        return code_hash.hexdigest()[:12]
+
+    @staticmethod
+    def get_data_fingerprint(ratings, abstracts_preprocessor=None):
+        """
+        :param ratings: A matrix of the ratings, dense or sparse.
+        :param AbstractsPreprocessor abstracts_preprocessor: The abstracts, if the runs use them.
+        :returns: A hash of the ratings and of the term frequencies of the abstracts.
+        :rtype: str
+        """
+        data_hash = hashlib.sha1()
+        matrices = [ratings]
+        if abstracts_preprocessor is not None:
+            matrices.append(abstracts_preprocessor.get_term_frequency_sparse_matrix())
+        for matrix in matrices:
+            # Dense and sparse matrices of the same values have the same fingerprint.
+            matrix = sparse.csr_matrix(matrix, dtype=numpy.float64, copy=True)
+            matrix.eliminate_zeros()
+            matrix.sort_indices()
+            data_hash.update(str(matrix.shape).encode('utf-8'))
+            data_hash.update(numpy.ascontiguousarray(matrix.indptr, dtype=numpy.int64).tobytes())
+            data_hash.update(numpy.ascontiguousarray(matrix.indices, dtype=numpy.int64).tobytes())
+            data_hash.update(numpy.ascontiguousarray(matrix.data).tobytes())
+        return data_hash.hexdigest()[:12]
+
+    def get_key(self, config, data_fingerprint, seed):
+        """
+        :param dict config: The configuration of the run.
+        :param str data_fingerprint: The fingerprint of the data.
+        :param int seed: The seed of the split of the data.
+        :returns: The key of the run.
+        :rtype: str
+        """
+        canonical = json.dumps([config, data_fingerprint, seed, self.code_version], sort_keys=True,
+                               default=self._to_builtin)
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        :param str key: The key of the run.
+        :returns: The stored results of the run, None if it was not run or if the store is forced.
+        """
+        if self.force:
+            return None
+        return self.results.get(key)
+
+    def add(self, key, results, config=None):
+        """
+        Store the results of a run, they are written to the file right away. The file is locked while the
+        line is written, so that several processes can share the store.
+
+        :param str key: The key of the run.
+        :param results: The results, anything that can be serialized to JSON.
+        :param dict config: The configuration of the run, stored for reference.
+        """
+        record = {'key': key, 'results': results, 'config': config, 'code_version': self.code_version}
+        line = json.dumps(record, sort_keys=True, default=self._to_builtin)
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.path, 'a') as store_file:
+            fcntl.flock(store_file, fcntl.LOCK_EX)
+            try:
+                store_file.write(line + '\n')
+                store_file.flush()
+                os.fsync(store_file.fileno())
+            finally:
+                fcntl.flock(store_file, fcntl.LOCK_UN)
+        self.results[key] = json.loads(line)['results']
+
+    @staticmethod
+    def _to_builtin(value):
+        """
+        Convert numpy values to values that can be serialized to JSON.
+        """
+        if isinstance(value, (numpy.ndarray, numpy.generic)):
+            return value.tolist()
+        raise TypeError("%r is not JSON serializable" % value)
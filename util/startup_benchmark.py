@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+A script that measures the startup cost of every recommender type, the time of importing it and the
+memory of the process after the import. Every type is imported in a new python process.
+"""
+import json
+import os
+import subprocess
+import sys
+from optparse import OptionParser
+
+# The code of the process that imports a recommender type, it prints the measures as JSON.
+MEASURE_CODE = '''
+import json, resource, sys, time
+start = time.time()
+error = None
+try:
+    if sys.argv[1] != 'python':
+        import runnables
+        from lib.recommender_registry import RecommenderRegistry
+    if sys.argv[1] == 'content-based':
+        RecommenderRegistry.get_content_based(sys.argv[2])
+    elif sys.argv[1] == 'collaborative-filtering':
+        RecommenderRegistry.get_collaborative_filtering(sys.argv[2])
+except ImportError as e:
+    error = str(e)
+duration = time.time() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+print(json.dumps({'seconds': duration, 'rss': rss, 'error': error}))
+'''
+
+
+class StartupBenchmark(object):
+    """
+    A class that measures the import time and the peak RSS of the recommender types, after importing
+    runnables, compared to the bare interpreter and to runnables alone.
+    """
+    def __init__(self, repeats=3):
+        """
+        Constructs a startup benchmark.
+
+        :param int repeats: The number of processes for every type, the fastest import is reported.
+        """
+        self.repeats = repeats
+        self.base_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+    def get_types(self):
+        """
+        :returns: The kinds and names of the measured types.
+        :rtype: list[tuple]
+        """
+        from lib.recommender_registry import RecommenderRegistry
+        types = [('python', 'interpreter'), ('runnables', 'runnables')]
+        types.extend(('content-based', name) for name in RecommenderRegistry.CONTENT_BASED)
+        types.extend(('collaborative-filtering', name) for name in RecommenderRegistry.COLLABORATIVE_FILTERING)
+        return types
+
+    def measure(self, kind, name):
+        """
+        :param str kind: 'python', 'runnables', 'content-based' or 'collaborative-filtering'.
+        :param str name: The name of the type in the configurations.
+        :returns: The seconds of the import, the peak RSS in bytes, and the error if it could not be imported.
+        :rtype: dict
+        """
+        measures = []
+        for _ in range(self.repeats):
+            output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', MEASURE_CODE, kind, name],
+                                             cwd=self.base_dir)
+            measures.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+        return min(measures, key=lambda measure: measure['seconds'])
+
+    def run(self):
+        """
+        Measure all the types, and print a report.
+
+        :returns: The measures of every type, by its kind and name.
+        :rtype: dict
+        """
+        results = {}
+        print("%-25s %-14s %10s %10s" % ('kind', 'type', 'seconds', 'RSS MB'))
+        for kind, name in self.get_types():
+            measure = self.measure(kind, name)
+            results[(kind, name)] = measure
+            if measure['error'] is not None:
+                print("%-25s %-14s unavailable, %s" % (kind, name, measure['error']))
+            else:
+                print("%-25s %-14s %10.3f %10.1f" % (kind, name, measure['seconds'], measure['rss'] / 2.0 ** 20))
+        return results
+
+
+if __name__ == '__main__':
+    parser = OptionParser("python3 -m util.startup_benchmark [options]")
+    parser.add_option("-r", "--repeats", dest="repeats", type='int', default=3,
+                      help="number of processes of every recommender type, the fastest is reported",
+                      metavar="REPEATS")
+    options, args = parser.parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    StartupBenchmark(options.repeats).run()
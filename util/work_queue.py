@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+This module provides a work queue in a shared directory, from which worker processes on one or more
+hosts claim tasks with lock files and leases.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+
+class WorkQueue(object):
+    """
+    A queue of tasks in a directory. A worker claims a task by creating its lease file exclusively, and renews
+    the lease while it works on it. The lease of a worker that died expires, and the task is claimed again.
+    A task can then run twice, so the tasks should be idempotent, like runs whose results are stored by key.
+
+    The directory has a tasks folder with a JSON file per task, a leases folder with the lease files, and
+    a done folder with a marker per done task.
+    """
+    def __init__(self, directory, lease_seconds=600, worker_id=None):
+        """
+        Constructs a work queue, and creates its folders.
+
+        :param str directory: The shared directory of the queue.
+        :param float lease_seconds: The seconds after the last renewal after which a lease expires.
+        :param str worker_id: The id of the worker, the host name and the process id by default.
+        """
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        if worker_id is None:
+            worker_id = '%s-%d' % (socket.gethostname(), os.getpid())
+        self.worker_id = worker_id
+        for folder in ['tasks', 'leases', 'done']:
+            path = os.path.join(directory, folder)
+            if not os.path.exists(path):
+                try:
+                    os.makedirs(path)
+                except FileExistsError:
+                    # Another worker created it.
+                    pass
+
+    def _get_path(self, folder, task_id, extension):
+        return os.path.join(self.directory, folder, task_id + extension)
+
+    def add(self, task_id, task):
+        """
+        Add a task, unless a task with the same id was already added. The task file is written to
+        a temporary file and renamed, so that the workers never read a partial task.
+
+        :param str task_id: The id of the task, the tasks are claimed in the order of their ids.
+        :param task: The task, anything that can be serialized to JSON.
+        """
+        path = self._get_path('tasks', task_id, '.json')
+        if os.path.exists(path):
+            return
+        temporary_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+        with open(temporary_path, 'w') as task_file:
+            json.dump(task, task_file, sort_keys=True)
+        os.rename(temporary_path, path)
+
+    def get_task_ids(self):
+        """
+        :returns: The ids of all the tasks, sorted.
+        :rtype: list[str]
+        """
+        return sorted(file_name[:-len('.json')] for file_name in os.listdir(os.path.join(self.directory, 'tasks'))
+                      if file_name.endswith('.json'))
+
+    def get_task(self, task_id):
+        """
+        :param str task_id: The id of the task.
+        :returns: The task.
+        """
+        with open(self._get_path('tasks', task_id, '.json')) as task_file:
+            return json.load(task_file)
+
+    def is_done(self, task_id):
+        """
+        :param str task_id: The id of the task.
+        :returns: A flag that is True if the task is done.
+        :rtype: boolean
+        """
+        return os.path.exists(self._get_path('done', task_id, ''))
+
+    def get_pending_task_ids(self):
+        """
+        :returns: The ids of the tasks that are not done, sorted.
+        :rtype: list[str]
+        """
+        return [task_id for task_id in self.get_task_ids() if not self.is_done(task_id)]
+
+    def _is_expired(self, lease_path):
+        """
+        :returns: A flag that is True if the lease was not renewed for lease_seconds, or if it is already gone.
+        :rtype: boolean
+        """
+        try:
+            return time.time() - os.path.getmtime(lease_path) > self.lease_seconds
+        except FileNotFoundError:
+            return True
+
+    def claim(self):
+        """
+        Claim the first task that is not done and that has no valid lease. An expired lease is moved away
+        before the task is claimed again, the move only succeeds for one worker.
+
+        :returns: A tuple of the id of the task and the task, None if there is no task to claim.
+        :rtype: tuple
+        """
+        for task_id in self.get_pending_task_ids():
+            lease_path = self._get_path('leases', task_id, '.lease')
+            if os.path.exists(lease_path):
+                if not self._is_expired(lease_path):
+                    continue
+                expired_path = '%s.%s.expired' % (lease_path, uuid.uuid4().hex)
+                try:
+                    os.rename(lease_path, expired_path)
+                except FileNotFoundError:
+                    continue
+                os.remove(expired_path)
+            try:
+                lease_file = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            os.write(lease_file, self.worker_id.encode('utf-8'))
+            os.close(lease_file)
+            # The task can be done by a worker whose lease expired while this worker listed the tasks.
+            if self.is_done(task_id):
+                self.release(task_id)
+                continue
+            return task_id, self.get_task(task_id)
+        return None
+
+    def renew(self, task_id):
+        """
+        Renew the lease of a claimed task.
+
+        :param str task_id: The id of the task.
+        :returns: A flag that is False if the lease was lost to another worker.
+        :rtype: boolean
+        """
+        lease_path = self._get_path('leases', task_id, '.lease')
+        try:
+            with open(lease_path) as lease_file:
+                if lease_file.read() != self.worker_id:
+                    return False
+            os.utime(lease_path, None)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self, task_id):
+        """
+        Release the lease of a claimed task, so that it is claimed again.
+
+        :param str task_id: The id of the task.
+        """
+        lease_path = self._get_path('leases', task_id, '.lease')
+        try:
+            with open(lease_path) as lease_file:
+                if lease_file.read() == self.worker_id:
+                    os.remove(lease_path)
+        except FileNotFoundError:
+            pass
+
+    def complete(self, task_id):
+        """
+        Mark a claimed task as done, and release its lease.
+
+        :param str task_id: The id of the task.
+        """
+        with open(self._get_path('done', task_id, ''), 'w') as done_file:
+            done_file.write(self.worker_id)
+        self.release(task_id)
+
+    def process(self, function, poll_seconds=1.0, wait=True):
+        """
+        Claim and run tasks until all of them are done. The lease of a running task is renewed by a thread,
+        if the function raises an exception, the task is released and the exception is raised.
+
+        :param function function: The function that runs a task, it is called with the id of the task and the task.
+        :param float poll_seconds: The seconds between the checks for expired leases of other workers.
+        :param boolean wait: A flag for waiting for the tasks that other workers claimed, so that they are claimed
+            again if their leases expire. If False, the worker stops when there is no task to claim.
+        :returns: The ids of the tasks that this worker did.
+        :rtype: list[str]
+        """
+        done_task_ids = []
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                if not wait or not self.get_pending_task_ids():
+                    return done_task_ids
+                time.sleep(poll_seconds)
+                continue
+            task_id, task = claimed
+            stopped = threading.Event()
+
+            def heartbeat():
+                while not stopped.wait(self.lease_seconds / 3.0):
+                    if not self.renew(task_id):
+                        return
+
+            heartbeat_thread = threading.Thread(target=heartbeat)
+            heartbeat_thread.daemon = True
+            heartbeat_thread.start()
+            try:
+                function(task_id, task)
+            except BaseException:
+                self.release(task_id)
+                raise
+            finally:
+                stopped.set()
+                heartbeat_thread.join()
+            self.complete(task_id)
+            done_task_ids.append(task_id)